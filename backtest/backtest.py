@@ -9,9 +9,9 @@ except ImportError:
     import queue
 import time
 
-from strategy import PortfolioAllocation, RSIStrategy
-from portfolio import Portfolio
-from price import HistoricCSVPriceHandler
+from backtest.strategy import PortfolioAllocation, RSIStrategy
+from backtest.portfolio import Portfolio
+from backtest.price import HistoricCSVPriceHandler
 
 
 class Backtest(object):
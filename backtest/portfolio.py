@@ -2,7 +2,7 @@ import logging
 from copy import deepcopy
 from datetime import datetime
 
-from strategy import OrderEvent
+from backtest.strategy import OrderEvent
 from decimal import Decimal, getcontext, ROUND_HALF_DOWN
 
 UNIT_RATIO = 100000
@@ -2,11 +2,13 @@ from datetime import datetime
 
 import time
 from decimal import Decimal
+import numpy as np
 import pandas as pd
 import requests
 from socketIO_client import SocketIO
 
-from strategy import TickEvent
+from backtest.strategy import TickEvent
+from backtest.vectorized import PRICE_COLUMNS
 
 
 class HistoricCSVPriceHandler(object):
@@ -166,3 +168,32 @@ class HistoricCSVPriceHandler(object):
                 self.continue_backtest = False
                 return
         self.cur_date_indx += 1
+
+
+class CandlePriceHandler(HistoricCSVPriceHandler):
+    """
+    HistoricCSVPriceHandler on candles given up front instead of
+    requested from FXCM, candles is a dict of pair to candle frames
+    or dicts of arrays, bid and ask open, high, low and close and a
+    time column of epoch seconds, the DatetimeIndex without one.
+
+    Backtest builds the data handler itself, pass the candles with
+    functools.partial(CandlePriceHandler, candles=candles).
+    """
+
+    def __init__(self, pairs, time, token, events_queue, candles=None):
+        self.candles = candles or {}
+        super(CandlePriceHandler, self).__init__(pairs, time, token, events_queue)
+
+    @property
+    def set_up_df(self):
+        df_dict = []
+        for pair in self.pairs:
+            candles = self.candles[pair]
+            df = pd.DataFrame(dict((name, np.asarray(candles[name], dtype=np.float64)) for name in PRICE_COLUMNS))
+            if 'time' in candles:
+                df['time'] = np.asarray(candles['time'])
+            else:
+                df['time'] = pd.DatetimeIndex(candles.index).asi8 // 10 ** 9
+            df_dict.append(df)
+        return df_dict
@@ -4,6 +4,7 @@ from decimal import Decimal
 from pyllist import dllist
 import talib as ta
 import numpy as np
+import pandas as pd
 
 
 class Event(object):
@@ -81,6 +82,19 @@ class TestRandomStrategy(Strategy):
 
 
 class MovingAverageCrossStrategy(Strategy):
+    """
+    Long only, a buy when the short rolling SMA of the bid crosses
+    above the long one and a sell closing it when it crosses back.
+
+    signals and exits are the same rules over a whole candle history
+    for backtest.vectorized, calculate_signals trades the bid open of
+    every tick so the signal of bar i is the cross at the open of bar
+    i + 1, the one it's filled at.
+    """
+    stop_loss = None  # backtest.vectorized, Backtest has no stops
+    take_profit = None
+    trailing_stop = None
+
     def __init__(
             self, pairs, events,
             short_window=10, long_window=50
@@ -134,6 +148,30 @@ class MovingAverageCrossStrategy(Strategy):
             pd["ticks"] += 1
             # print(str(pd["short_sma"]) + " & " + str(pd["long_sma"]))
 
+    def rolling_sma(self, prices, window):
+        """calc_rolling_sma over an array, from its first price"""
+        return pd.Series(prices).ewm(alpha=1.0 / window, adjust=False).mean().values
+
+    def invested(self, candles):
+        """invested after the tick of every bar"""
+        bid = np.asarray(candles['bidopen'], dtype=np.float64)
+        short_sma = self.rolling_sma(bid, self.short_window)
+        long_sma = self.rolling_sma(bid, self.long_window)
+        started = np.arange(len(bid)) > self.short_window
+        state = np.where(started & (short_sma > long_sma), 1.0,
+                         np.where(started & (short_sma < long_sma), 0.0, np.nan))
+        return pd.Series(state).ffill().fillna(0).values.astype(bool)
+
+    def signals(self, candles):
+        invested = self.invested(candles)
+        buys = invested & ~np.concatenate([[False], invested[:-1]])
+        return np.concatenate([buys[1:], [False]]).astype(np.int8)
+
+    def exits(self, candles):
+        invested = self.invested(candles)
+        sells = ~invested & np.concatenate([[False], invested[:-1]])
+        return np.concatenate([sells[1:], [False]])
+
 
 class BollingerBandStrategy(Strategy):
     '''
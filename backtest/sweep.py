@@ -0,0 +1,222 @@
+"""
+Parameter sweep of a strategy over a process pool.
+
+Every combination of a parameter grid is one VectorizedBacktest run of the
+strategy class over the same candle histories. The candles are copied once
+into a multiprocessing.shared_memory block, the workers attach to it when they
+start and read the prices through read-only numpy views, so nothing but the
+parameters goes to a worker and nothing but a summary comes back. Before
+python 3.8, without shared_memory, the candles are pickled to each worker
+when it starts instead.
+
+    sweep = ParameterSweep(HLHBTrendStrategy, {'short_ema': [3, 5, 8], 'take_profit': [30, 50]})
+    for result in sweep.run(data):  # in the order they finish
+        print(result)
+
+A key of the grid found in the strategy's params dict overrides that param,
+any other key sets the strategy attribute of that name, stop_loss,
+take_profit and trailing_stop included.
+"""
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from backtest.vectorized import VectorizedBacktest, PRICE_COLUMNS
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python 3.7
+    shared_memory = None
+
+logger = logging.getLogger(__name__)
+
+_data = None  # symbol -> candles of a worker, SharedCandles attached by _attach or pickled to _load
+_memory = None
+
+
+def grid(params):
+    """every combination of a dict of param name to values, as dicts"""
+    names = list(params)
+    return [dict(zip(names, values)) for values in itertools.product(*(params[name] for name in names))]
+
+
+class SharedCandles(dict):
+    """price columns of one symbol over shared memory, index is the bar times or None"""
+    index = None
+
+
+class SharedPrices(object):
+    """
+    Candle histories copied into one shared memory block.
+
+    layout is picklable, attach(name, layout) in another process maps the same
+    block back read-only.
+    """
+
+    def __init__(self, data):
+        self.layout = []  # (symbol, offset, bars, has_index)
+        size = 0
+        for symbol, candles in data.items():
+            bars = len(candles[PRICE_COLUMNS[0]])
+            has_index = isinstance(getattr(candles, 'index', None), pd.DatetimeIndex)
+            self.layout.append((symbol, size, bars, has_index))
+            size += bars * 8 * (len(PRICE_COLUMNS) + 1)
+        self.memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.name = self.memory.name
+        self.nbytes = size
+        for symbol, offset, bars, has_index in self.layout:
+            prices, times = _views(self.memory.buf, offset, bars)
+            for i, name in enumerate(PRICE_COLUMNS):
+                prices[i] = np.asarray(data[symbol][name], dtype=np.float64)
+            if has_index:
+                times[:] = data[symbol].index.values.astype('datetime64[ns]').view(np.int64)
+
+    @staticmethod
+    def attach(name, layout):
+        memory = shared_memory.SharedMemory(name=name)
+        return memory, dict((symbol, _candles(memory.buf, offset, bars, has_index))
+                            for symbol, offset, bars, has_index in layout)
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+def _views(buf, offset, bars):
+    prices = np.ndarray((len(PRICE_COLUMNS), bars), dtype=np.float64, buffer=buf, offset=offset)
+    times = np.ndarray(bars, dtype=np.int64, buffer=buf, offset=offset + prices.nbytes)
+    return prices, times
+
+
+def _candles(buf, offset, bars, has_index):
+    prices, times = _views(buf, offset, bars)
+    prices.setflags(write=False)
+    times.setflags(write=False)
+    candles = SharedCandles(zip(PRICE_COLUMNS, prices))
+    if has_index:
+        candles.index = pd.DatetimeIndex(times.view('datetime64[ns]'), copy=False)
+    return candles
+
+
+def _attach(name, layout):
+    """initializer of the pool workers"""
+    global _data, _memory
+    _memory, _data = SharedPrices.attach(name, layout)
+
+
+def _load(data):
+    """initializer of the pool workers without shared memory, data is pickled to each"""
+    global _data
+    _data = data
+
+
+def _run(strategy_class, params):
+    return run_params(strategy_class, params, _data)
+
+
+def run_params(strategy_class, params, data):
+    """one VectorizedBacktest of strategy_class with params over data, a SweepResult"""
+    start = time.perf_counter()
+    strategy = strategy_class(None, None)
+    strategy.params = dict(strategy.params)
+    for name, value in params.items():
+        if name in strategy.params:
+            strategy.params[name] = value
+        elif hasattr(strategy, name):
+            setattr(strategy, name, value)
+        else:
+            raise ValueError('%s has no param or attribute %s.' % (strategy_class.__name__, name))
+    results = VectorizedBacktest(strategy).run(data)
+    summaries = dict((symbol, summarize(result)) for symbol, result in results.items())
+    return SweepResult(params, summaries, time.perf_counter() - start)
+
+
+def summarize(result):
+    """the numbers of a VectorResult a sweep sends back"""
+    drawdown = np.maximum.accumulate(result.equity) - result.equity if len(result.equity) else np.zeros(1)
+    return {'trades': result.trade_count,
+            'wins': result.win_count,
+            'losses': result.loss_count,
+            'win_rate': result.get_win_rate(),
+            'profit_pips': result.profit_pips,
+            'max_drawdown_pips': float(drawdown.max())}
+
+
+class SweepResult(object):
+    """summary of the run of one param combination, summaries is symbol -> summarize()"""
+
+    def __init__(self, params, summaries, elapsed):
+        self.params = params
+        self.summaries = summaries
+        self.elapsed = elapsed
+
+    @property
+    def trade_count(self):
+        return sum(s['trades'] for s in self.summaries.values())
+
+    @property
+    def profit_pips(self):
+        return sum(s['profit_pips'] for s in self.summaries.values())
+
+    def __str__(self):
+        return '%s trades=%s profit=%0.1f pips' % (self.params, self.trade_count, self.profit_pips)
+
+
+class ParameterSweep(object):
+    """
+    Runs strategy_class for every combination of param_grid, a dict of name to
+    values or a list of param dicts, on processes workers, all cores by default.
+
+    processes=0 runs in this process, on the same shared memory views.
+    """
+
+    def __init__(self, strategy_class, param_grid, processes=None):
+        self.strategy_class = strategy_class
+        self.params = grid(param_grid) if isinstance(param_grid, dict) else list(param_grid)
+        self.processes = os.cpu_count() if processes is None else processes
+        self.elapsed = 0.0
+
+    def run(self, data):
+        """yields a SweepResult per combination as they finish"""
+        start = time.perf_counter()
+        prices = SharedPrices(data) if shared_memory is not None else None
+        logger.info('[SWEEP] %s runs of %s on %s processes, %s' % (
+            len(self.params), self.strategy_class.__name__, self.processes,
+            '%s bytes shared' % prices.nbytes if prices else 'candles pickled'))
+        try:
+            if not self.processes and prices is None:
+                for params in self.params:
+                    yield run_params(self.strategy_class, params, data)
+            elif not self.processes:
+                memory, shared = SharedPrices.attach(prices.name, prices.layout)
+                try:
+                    for params in self.params:
+                        yield run_params(self.strategy_class, params, shared)
+                finally:
+                    del shared
+                    memory.close()
+            else:
+                if prices is None:
+                    initializer, initargs = _load, (data,)
+                else:
+                    initializer, initargs = _attach, (prices.name, prices.layout)
+                with ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=initializer, initargs=initargs) as executor:
+                    futures = [executor.submit(_run, self.strategy_class, params) for params in self.params]
+                    try:
+                        for future in as_completed(futures):
+                            yield future.result()
+                    finally:
+                        for future in futures:
+                            future.cancel()
+        finally:
+            if prices is not None:
+                prices.close()
+            self.elapsed = time.perf_counter() - start
+            logger.info('[SWEEP] done in %0.3fs' % self.elapsed)
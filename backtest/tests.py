@@ -0,0 +1,150 @@
+import itertools
+import queue
+import unittest
+from datetime import datetime, timedelta
+from functools import partial
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from backtest import sweep
+from backtest.backtest import Backtest
+from backtest.portfolio import Portfolio
+from backtest.price import CandlePriceHandler
+from backtest.strategy import MovingAverageCrossStrategy
+from backtest.sweep import ParameterSweep, grid
+from backtest.vectorized import VectorizedBacktest, ExitReason, PRICE_COLUMNS
+from mt4.constants import OrderSide
+from strategy.hlhb_trend import HLHBTrendStrategy
+
+
+class VectorizedBacktestTest(unittest.TestCase):
+    def test_vectorized_backtest(self):
+        class Fixed(object):
+            stop_loss = 10
+            take_profit = 20
+            trailing_stop = None
+
+            def signals(self, candles):
+                return [1, 0, -1, 1, 0, 1, 0, 0]
+
+            def exits(self, candles):
+                return [False] * 6 + [True, False]
+
+        bid = {'bidopen': [1.1] * 8, 'bidhigh': [1.1005] * 8, 'bidlow': [1.0995] * 8, 'bidclose': [1.1] * 8}
+        bid['bidlow'][2] = 1.099  # stop loss of the BUY filled on bar 1
+        for name, value in (('bidopen', 1.0973), ('bidhigh', 1.0978), ('bidlow', 1.097), ('bidclose', 1.0975)):
+            bid[name][4] = value  # gap through the take profit of the SELL filled on bar 3
+        candles = dict(bid)
+        candles.update(dict((name.replace('bid', 'ask'), np.array(values) + 0.0002) for name, values in bid.items()))
+
+        result = VectorizedBacktest(Fixed()).run({'EURUSD': candles})['EURUSD']
+        trades = result.trades
+        self.assertEqual(trades['side'].tolist(), [1, -1, 1])
+        self.assertEqual(trades['entry'].tolist(), [1, 3, 6])
+        self.assertEqual(trades['exit'].tolist(), [2, 4, 7])
+        self.assertEqual(trades['reason'].tolist(), [ExitReason.STOP_LOSS, ExitReason.TAKE_PROFIT, ExitReason.SIGNAL])
+        np.testing.assert_allclose(trades['close_price'], [1.0992, 1.0975, 1.1])
+        np.testing.assert_allclose(trades['pips'], [-10, 25, -2])
+        self.assertAlmostEqual(result.equity[-1], 13)
+        self.assertEqual((result.win_count, result.loss_count), (1, 2))
+
+        trades = VectorizedBacktest(Fixed(), stop_loss=None, trailing_stop=3).run({'EURUSD': candles})['EURUSD'].trades
+        self.assertEqual((trades[0]['exit'], trades[0]['reason']), (1, ExitReason.TRAILING_STOP))
+        self.assertAlmostEqual(trades[0]['pips'], -5)
+
+        # array signals against the live open() on every prefix of the history
+        random = np.random.RandomState(0)
+        close = 1.13 + np.cumsum(random.standard_normal(400)) * 0.0008
+        frame = pd.DataFrame({'bidclose': close, 'bidlow': close - 0.0006, 'askhigh': close + 0.0008},
+                             index=pd.date_range(datetime(2019, 3, 4), periods=400, freq='h'))
+        strategy = HLHBTrendStrategy(queue.Queue(), None)
+        expected = []
+        for i in range(len(frame)):
+            prefix = dict((name, frame[name].values[:i + 1]) for name in frame.columns)
+            strategy.open('EURUSD', *strategy.indicators(prefix))
+            event = strategy.get()
+            expected.append(0 if event is None else (1 if event.side == OrderSide.BUY else -1))
+        can_open = strategy.can_open_array(frame.index + timedelta(hours=1))
+        signals = strategy.signals(frame)
+        self.assertEqual(signals.tolist(), np.where(can_open, expected, 0).tolist())
+        self.assertTrue(np.count_nonzero(signals) > 2)
+
+    def test_event_driven_parity(self):
+        random = np.random.RandomState(0)
+        bid_open = np.round(1.13 + np.cumsum(random.standard_normal(600)) * 0.0008, 5)
+        # the last bar is flat, Backtest closes what's left at its open and VectorizedBacktest at its close
+        bid_close = np.append(bid_open[1:], bid_open[-1])
+        bid = {'bidopen': bid_open, 'bidclose': bid_close,
+               'bidhigh': np.maximum(bid_open, bid_close) + 0.0003, 'bidlow': np.minimum(bid_open, bid_close) - 0.0003}
+        candles = dict(bid)
+        candles.update(dict((name.replace('bid', 'ask'), np.round(values + 0.00015, 5)) for name, values in bid.items()))
+        data = {'EURUSD': pd.DataFrame(candles, index=pd.date_range(datetime(2019, 3, 4), periods=600, freq='h'))}
+        params = {'short_window': 5, 'long_window': 20}
+
+        backtest = Backtest(['EURUSD'], 'H1', None, partial(CandlePriceHandler, candles=data),
+                            MovingAverageCrossStrategy, params, Portfolio)
+        backtest._run_backtest()
+        portfolio = backtest.portfolio
+
+        result = VectorizedBacktest(MovingAverageCrossStrategy(['EURUSD'], None, **params)).run(data)['EURUSD']
+        self.assertTrue(result.trade_count > 5)
+        self.assertEqual((portfolio.trade_count, portfolio.win_count, portfolio.loss_count),
+                         (result.trade_count, result.win_count, result.loss_count))
+        self.assertAlmostEqual(portfolio.balance - portfolio.equity, result.profit_pips * 0.0001 * portfolio.trade_units,
+                               places=6)
+
+
+class ParameterSweepTest(unittest.TestCase):
+    def test_parameter_sweep(self):
+        self.assertEqual(grid({'a': [1, 2], 'b': [3]}), [{'a': 1, 'b': 3}, {'a': 2, 'b': 3}])
+
+        random = np.random.RandomState(0)
+        close = 1.13 + np.cumsum(random.standard_normal(600)) * 0.0008
+        frame = pd.DataFrame(dict((name, close + (0.0002 if name.startswith('ask') else 0) +
+                                   (0.0006 if name.endswith('high') else -0.0006 if name.endswith('low') else 0))
+                                  for name in PRICE_COLUMNS),
+                             index=pd.date_range(datetime(2019, 3, 4), periods=600, freq='h'))
+        data = {'EURUSD': frame}
+        param_grid = {'short_ema': [3, 5], 'take_profit': [20, None]}
+
+        expected = {}
+        for params in grid(param_grid):
+            strategy = HLHBTrendStrategy(None, None)
+            strategy.params = dict(strategy.params, short_ema=params['short_ema'])
+            strategy.take_profit = params['take_profit']
+            result = VectorizedBacktest(strategy).run(data)['EURUSD']
+            expected[str(params)] = (result.trade_count, result.profit_pips)
+
+        # on shared memory, and pickled to the workers as on python 3.7
+        for processes, memory in itertools.product((0, 1), (sweep.shared_memory, None)):
+            with mock.patch.object(sweep, 'shared_memory', memory):
+                results = list(ParameterSweep(HLHBTrendStrategy, param_grid, processes=processes).run(data))
+            self.assertEqual(len(results), 4)
+            for result in results:
+                summary = result.summaries['EURUSD']
+                self.assertEqual((summary['trades'], summary['profit_pips']), expected[str(result.params)])
+        self.assertEqual(HLHBTrendStrategy.params['short_ema'], 5)
+
+        with self.assertRaises(ValueError):
+            list(ParameterSweep(HLHBTrendStrategy, {'nope': [1]}, processes=0).run(data))
+
+    def test_array_candles(self):
+        random = np.random.RandomState(0)
+        close = 1.13 + np.cumsum(random.standard_normal(600)) * 0.0008
+        # plain arrays without bar times, every bar may open
+        candles = dict((name, close + (0.0006 if name.endswith('high') else -0.0006 if name.endswith('low') else 0))
+                       for name in PRICE_COLUMNS)
+        strategy = HLHBTrendStrategy(None, None)
+        strategy.hours = []
+        signals = strategy.signals(candles)
+        self.assertTrue(np.count_nonzero(signals) > 2)
+
+        expected = VectorizedBacktest(HLHBTrendStrategy(None, None)).run({'EURUSD': candles})['EURUSD']
+        for processes in (0, 1):
+            results = list(ParameterSweep(HLHBTrendStrategy, [{}], processes=processes).run({'EURUSD': candles}))
+            summary = results[0].summaries['EURUSD']
+            self.assertEqual((summary['trades'], summary['profit_pips']),
+                             (expected.trade_count, expected.profit_pips))
+        self.assertTrue(expected.trade_count > 0)
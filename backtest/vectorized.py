@@ -0,0 +1,207 @@
+"""
+Vectorized bar backtest.
+
+The strategy gives its entries, and optionally its exits, as arrays over a
+whole candle history (StrategyBase.signals and exits, HLHBTrendStrategy
+implements them next to its live signal_pair and the MovingAverageCrossStrategy
+of backtest.strategy next to its calculate_signals), and the engine turns them
+into trades and an equity curve with numpy, no event per bar.
+
+Fill model:
+- a signal on bar i is decided at its close and filled at the open of bar
+  i + 1, a BUY at the ask and a SELL at the bid
+- one position per instrument, signals of the bars it's open at the close of
+  are ignored
+- a long is closed at the bid, a short at the ask
+- stop loss, trailing stop and take profit are checked against the low and
+  high of every bar from the entry on, the stop first when both are touched,
+  a gap through a level fills at the open
+- the trailing stop follows the best price of the previous bars, the entry
+  bar open included
+- an exit signal on bar i closes at the open of bar i + 1
+- a position still open on the last bar is closed at its close
+
+Candles are FXCM candle frames or dicts of arrays with bidopen, bidhigh,
+bidlow, bidclose, askopen, askhigh, asklow and askclose. Prices are float64,
+pips and equity are in pips.
+"""
+import logging
+import time
+
+import numpy as np
+
+from mt4.constants import pip
+
+logger = logging.getLogger(__name__)
+
+
+class ExitReason(object):
+    STOP_LOSS = 1
+    TRAILING_STOP = 2
+    TAKE_PROFIT = 3
+    SIGNAL = 4
+    END = 5
+
+
+TRADE_DTYPE = np.dtype([('side', np.int8),  # 1 BUY, -1 SELL
+                        ('entry', np.int64),  # bar index of the fill
+                        ('exit', np.int64),
+                        ('open_price', np.float64),
+                        ('close_price', np.float64),
+                        ('pips', np.float64),
+                        ('reason', np.int8)])
+
+PRICE_COLUMNS = ('bidopen', 'bidhigh', 'bidlow', 'bidclose', 'askopen', 'askhigh', 'asklow', 'askclose')
+
+
+def _column(candles, name):
+    return np.ascontiguousarray(np.asarray(candles[name], dtype=np.float64))
+
+
+class VectorResult(object):
+    """trades and per bar equity of one instrument"""
+
+    def __init__(self, symbol, trades, equity):
+        self.symbol = symbol
+        self.trades = trades
+        self.equity = equity
+
+    @property
+    def trade_count(self):
+        return len(self.trades)
+
+    @property
+    def win_count(self):
+        return int((self.trades['pips'] > 0).sum())
+
+    @property
+    def loss_count(self):
+        return int((self.trades['pips'] <= 0).sum())
+
+    @property
+    def profit_pips(self):
+        return float(self.trades['pips'].sum())
+
+    def get_win_rate(self):
+        if not len(self.trades):
+            return 0.0
+        return self.win_count / len(self.trades) * 100
+
+    def __str__(self):
+        return '%s trades=%s win=%s loss=%s win_rate=%0.2f%% profit=%0.1f pips' % (
+            self.symbol, self.trade_count, self.win_count, self.loss_count, self.get_win_rate(), self.profit_pips)
+
+
+class VectorizedBacktest(object):
+    """
+    Backtest a strategy over candle histories, data is a dict of symbol to candles.
+
+    stop_loss, take_profit and trailing_stop are in pips, the strategy's own
+    by default, None turns one off.
+    """
+    window = 64  # bars searched for an exit at once, doubled until one is found
+
+    def __init__(self, strategy, stop_loss=False, take_profit=False, trailing_stop=False):
+        self.strategy = strategy
+        self.stop_loss = strategy.stop_loss if stop_loss is False else stop_loss
+        self.take_profit = strategy.take_profit if take_profit is False else take_profit
+        self.trailing_stop = strategy.trailing_stop if trailing_stop is False else trailing_stop
+        self.results = {}
+        self.bars = 0
+        self.elapsed = 0.0
+
+    @property
+    def bars_per_second(self):
+        return self.bars / self.elapsed if self.elapsed else 0.0
+
+    def run(self, data):
+        start = time.perf_counter()
+        for symbol, candles in data.items():
+            self.results[symbol] = self.run_symbol(symbol, candles)
+            self.bars += len(self.results[symbol].equity)
+        self.elapsed += time.perf_counter() - start
+        logger.info('[VECTORIZED] %s bars in %0.3fs, %0.0f bars/s' % (self.bars, self.elapsed, self.bars_per_second))
+        return self.results
+
+    def run_symbol(self, symbol, candles):
+        signals = np.asarray(self.strategy.signals(candles), dtype=np.int8)
+        exits = self.strategy.exits(candles)
+        exits = np.zeros(len(signals), dtype=bool) if exits is None else np.asarray(exits, dtype=bool)
+        prices = dict((name, _column(candles, name)) for name in PRICE_COLUMNS)
+        trades = self.trades(symbol, signals, exits, prices)
+        return VectorResult(symbol, trades, self.equity(symbol, trades, prices))
+
+    def trades(self, symbol, signals, exits, prices):
+        unit = float(pip(symbol))
+        count = len(signals)
+        candidates = np.flatnonzero(signals[:-1])  # the last bar has no next open to fill at
+        trades = []
+        position = 0
+        while position < len(candidates):
+            signal_bar = candidates[position]
+            side = int(signals[signal_bar])
+            entry = signal_bar + 1
+            open_price = prices['askopen'][entry] if side > 0 else prices['bidopen'][entry]
+            exit, close_price, reason = self.find_exit(side, entry, open_price, exits, prices, unit, count)
+            trades.append((side, entry, exit, open_price, close_price,
+                           (close_price - open_price) * side / unit, reason))
+            # the position is closed by the end of the exit bar, its signal is the first to count again
+            position = np.searchsorted(candidates, exit)
+        return np.array(trades, dtype=TRADE_DTYPE)
+
+    def find_exit(self, side, entry, open_price, exits, prices, unit, count):
+        """bar index, price and ExitReason of the first exit after a fill at the open of bar entry"""
+        if side > 0:
+            opens, highs, lows, closes = prices['bidopen'], prices['bidhigh'], prices['bidlow'], prices['bidclose']
+        else:
+            # a short is a long on the negated ask, highs and lows swap
+            opens, highs, lows, closes = -prices['askopen'], -prices['asklow'], -prices['askhigh'], -prices['askclose']
+            open_price = -open_price
+        stop = open_price - self.stop_loss * unit if self.stop_loss else -np.inf
+        target = open_price + self.take_profit * unit if self.take_profit else np.inf
+
+        start = entry
+        window = self.window
+        while start < count:
+            end = min(start + window, count)
+            bar_open, high, low = opens[start:end], highs[start:end], lows[start:end]
+            level = np.full(end - start, stop)
+            reasons = np.full(end - start, ExitReason.STOP_LOSS, dtype=np.int8)
+            if self.trailing_stop:
+                best = np.empty(end - start)
+                best[0] = opens[entry] if start == entry else max(opens[entry], highs[entry:start].max())
+                best[1:] = high[:-1]
+                trail = np.maximum.accumulate(best) - self.trailing_stop * unit
+                reasons[trail > level] = ExitReason.TRAILING_STOP
+                level = np.maximum(level, trail)
+            signal_exit = exits[start - 1:end - 1].copy()
+            if start == entry:
+                signal_exit[0] = False  # the signal bar itself
+            hit_stop = low <= level
+            hit_target = high >= target
+            hit = signal_exit | hit_stop | hit_target
+            if hit.any():
+                i = int(hit.argmax())
+                if signal_exit[i]:
+                    price, reason = bar_open[i], ExitReason.SIGNAL
+                elif hit_stop[i]:
+                    price, reason = min(bar_open[i], level[i]), reasons[i]
+                else:
+                    price, reason = max(bar_open[i], target), ExitReason.TAKE_PROFIT
+                return start + i, float(price * side), int(reason)
+            start = end
+            window *= 2
+        return count - 1, float(closes[-1] * side), ExitReason.END
+
+    def equity(self, symbol, trades, prices):
+        """closed pips plus the open position marked at the bar close, per bar"""
+        unit = float(pip(symbol))
+        count = len(prices['bidclose'])
+        equity = np.zeros(count)
+        closed = np.zeros(count)
+        for trade in trades:
+            entry, exit, side = trade['entry'], trade['exit'], trade['side']
+            marks = prices['bidclose'][entry:exit] if side > 0 else prices['askclose'][entry:exit]
+            equity[entry:exit] = (marks - trade['open_price']) * side / unit
+            closed[exit] += trade['pips']
+        return equity + np.cumsum(closed)
@@ -1,7 +1,7 @@
 from fxcmpy import fxcmpy
 
 from mt4.constants import PERIOD_H1, PERIOD_M1, PERIOD_M5, PERIOD_M15, PERIOD_M30, PERIOD_D1, PERIOD_H4, PERIOD_W1, \
-    PERIOD_MN1
+    PERIOD_MN1, get_instrument
 from utils.singleton import SingletonDecorator
 
 
@@ -37,14 +37,19 @@ ALL_SYMBOLS = ['EUR/USD', 'USD/JPY', 'GBP/USD', 'USD/CHF', 'EUR/CHF', 'AUD/USD',
                'NAS100', 'SPX500', 'UK100', 'US30', 'Copper', 'CHN50', 'EUSTX50', 'USDOLLAR', 'US2000', 'USOil',
                'UKOil', 'SOYF', 'NGAS', 'WHEATF', 'CORNF', 'Bund', 'XAU/USD', 'XAG/USD', 'BTC/USD', 'ETH/USD',
                'LTC/USD']
+_SYMBOL_SET = frozenset(ALL_SYMBOLS)
 
 
 def get_fxcm_symbol(symbol):
+    instrument = get_instrument(symbol)
+    if instrument is not None and instrument.fxcm in _SYMBOL_SET:
+        return instrument.fxcm
+
     symbol = symbol.replace('_', '/').upper()
     if len(symbol) == 6:
         symbol = '%s/%s' % (symbol[:3], symbol[3:])
 
-    if symbol in ALL_SYMBOLS:
+    if symbol in _SYMBOL_SET:
         return symbol
     else:
         raise Exception('Invalid symbol for FXCM')
@@ -2,7 +2,6 @@ import json
 import logging
 import time
 from datetime import datetime
-from decimal import Decimal
 
 from fxcmpy import fxcmpy, fxcmpy_closed_position
 from fxcmpy.fxcmpy import ServerError
@@ -14,7 +13,9 @@ from broker.fxcm.constants import get_fxcm_symbol
 from event.event import TickPriceEvent, TimeFrameEvent, HeartBeatEvent, StartUpEvent, ConnectEvent, TradeCloseEvent, \
     MarketEvent, MarketAction
 from event.runner import StreamRunnerBase
-from mt4.constants import get_mt4_symbol, OrderSide, pip
+from event.timer import TimerService, IntervalJob
+from mt4.constants import get_mt4_symbol, OrderSide, to_points
+from utils import clock
 from utils import telegram as tg
 from utils.market import is_market_open
 from utils.redis import RedisQueue, set_tick_price
@@ -27,13 +28,20 @@ class FXCMStreamRunner(StreamRunnerBase):
     account = None
     broker = 'FXCM'
     max_prices = 4000
-    loop_counter = 0
+    loop_counter = 0  # heartbeat counter in LOOP_SLEEP units
+    market_check_interval = 1  # seconds
+    connection_check_interval = 5
+    check_timers = None  # event.timer.TimerService of the heartbeat, market and connection checks, see setup_timers
+    checks = {}  # job name -> callback
     is_market_open = True
     last_tick_time = None
     error_counter = 0
 
-    def __init__(self, queue, *, pairs, handlers, access_token=None, account_type=AccountType.DEMO, api=None, **kwargs):
+    def __init__(self, queue, *, pairs, handlers, access_token=None, account_type=AccountType.DEMO, api=None,
+                 conflate=False, **kwargs):
         super(FXCMStreamRunner, self).__init__(queue=queue, pairs=pairs)
+        if conflate:
+            self.enable_conflation()
         self.last_tick_time = datetime.utcnow()
         self.access_token = access_token
         self.account_type = account_type
@@ -64,25 +72,50 @@ class FXCMStreamRunner(StreamRunnerBase):
             logger.info('Market is closed now.')
         logger.info('####################################')
 
+        self.setup_timers()
         while self.running:
-            while self.is_market_open:
-                event = self.get(False)
-                if event:
-                    if event.type == ConnectEvent.type:
-                        self.process_connect_event(event)
-                    else:
-                        self.handle_event(event)
+            if not self.is_market_open:
+                # handler timers don't fire over a closed market, nor pile up as missed runs for the open
+                self.skip_timers()
+            timeout = self.run_timers()
+            self.release_retries()
+            self.release_errors()
+            if not self.is_market_open:
+                time.sleep(timeout)
+                continue
+
+            self.release_timers()
+            self.flush_ticks()
+            events = self.get_many(self.batch_size)
+            if not events and timeout > 0:
+                # wait for the next event or the next timer, whichever comes first
+                event = self.get(True, timeout)
+                events = [event] if event else []
+            for event in events:
+                if event.type == ConnectEvent.type:
+                    self.process_connect_event(event)
                 else:
-                    break
-
-            time.sleep(settings.LOOP_SLEEP)
-            self.loop_counter += 1
-
-            self.check_market_status()
-
-            if self.is_market_open:
-                self.generate_heartbeat()
-                self.check_connection()
+                    self.handle_event(event)
+
+    def setup_timers(self):
+        """the runner's own checks, on a TimerService of their own as a closed market skips the handlers' timers"""
+        self.check_timers = TimerService()
+        self.checks = {}
+        for name, interval, callback in (('heartbeat', settings.HEARTBEAT, self.generate_heartbeat),
+                                         ('market_check', self.market_check_interval, self.check_market_status),
+                                         ('connection_check', self.connection_check_interval, self.check_connection)):
+            self.check_timers.add(IntervalJob(name, interval))
+            self.checks[name] = callback
+
+    def run_timers(self):
+        """run the checks due, return the seconds to wait for the next one, a handler timer or a retry"""
+        for event in self.check_timers.due():
+            self.checks[event.name]()
+        next_due = self.check_timers.next_release()
+        due = self.next_due()
+        if due is not None:
+            next_due = min(next_due, due)
+        return max(0, next_due - clock.timestamp())
 
     def check_market_status(self):
         current_status = is_market_open()
@@ -92,13 +125,13 @@ class FXCMStreamRunner(StreamRunnerBase):
                 event = MarketEvent(MarketAction.OPEN)
                 self.put(event)
                 logger.info('[MarketEvent] Market opened.')
-                tg.send_me('[MarketEvent] Forex market opened.')
+                tg.send_me_nowait('[MarketEvent] Forex market opened.')
             elif current_status is False:
                 event = MarketEvent(MarketAction.CLOSE)
                 self.handle_event(event)
                 self.market_close()
                 logger.info('[MarketEvent] Market closed.')
-                tg.send_me('[MarketEvent] Forex market closed.')
+                tg.send_me_nowait('[MarketEvent] Forex market closed.')
                 self.is_market_open = current_status
 
     def market_open(self):
@@ -118,13 +151,24 @@ class FXCMStreamRunner(StreamRunnerBase):
         logger.info('[MARKET_CLOSE] Connection closed.')
 
     def generate_heartbeat(self):
-        if not self.loop_counter % (settings.HEARTBEAT / settings.LOOP_SLEEP):
+        self.loop_counter += int(settings.HEARTBEAT / settings.LOOP_SLEEP)
+        if self.is_market_open:
             self.put(HeartBeatEvent(self.loop_counter))
+            if self.conflator is not None:
+                logger.info('[CONFLATION] %s' % self.conflator.stats())
+            if self.retry.scheduled:
+                logger.info('[EVENT_RETRY] %s' % self.retry.stats())
+            if self.pool.submitted:
+                logger.info('[BACKGROUND] %s' % self.pool.stats())
+            if self.metrics:
+                self.metrics.report()
             if not self.initialized:
                 self.initialized = True
                 self.put(StartUpEvent())
 
     def check_connection(self):
+        if not self.is_market_open:
+            return
         seconds = (datetime.utcnow() - self.last_tick_time).seconds
         if seconds > 60:
             if self.fxcm.__disconnected__:
@@ -239,10 +283,11 @@ class FXCMStreamRunner(StreamRunnerBase):
             instrument = get_mt4_symbol(data['Symbol'])
             time = datetime.utcfromtimestamp(int(data['Updated']) / 1000.0)
 
-            bid = Decimal(str(data['Rates'][0])).quantize(pip(instrument))
-            ask = Decimal(str(data['Rates'][1])).quantize(pip(instrument))
-            tick = TickPriceEvent(self.broker, instrument, time, bid, ask)
-            self.put(tick)
+            bid = data['Rates'][0]
+            ask = data['Rates'][1]
+            tick = TickPriceEvent.from_points(self.broker, instrument, time, to_points(instrument, bid),
+                                              to_points(instrument, ask))
+            self.put_tick(tick)
             data = json.dumps(
                 {'ask': float(ask), 'bid': float(bid), 'time': time.strftime('%Y-%m-%d %H:%M:%S:%f')})
             set_tick_price(instrument, data)
@@ -276,7 +321,7 @@ class FXCMStreamRunner(StreamRunnerBase):
                     pips=closed_trade.get_visiblePL(),
                 )
                 self.put(event)
-                tg.send_me('[FOREX_TRADE_CLOSE]\n%s#%s#%s %s->%s, pips=%s, lots=%s, profit=%s' % (
+                tg.send_me_nowait('[FOREX_TRADE_CLOSE]\n%s#%s#%s %s->%s, pips=%s, lots=%s, profit=%s' % (
                     event.trade_id, event.instrument, event.side,
                     closed_trade.get_open(),
                     closed_trade.get_close(),
@@ -1,9 +1,17 @@
+import queue
+import time
 import unittest
+from datetime import datetime
+from unittest import mock
 
 import settings
 from broker import SingletonFXCM
 from broker.base import AccountType
+from broker.fxcm.streaming import FXCMStreamRunner
+from event.event import TimerEvent
+from event.handler import BaseHandler
 from mt4.constants import OrderSide
+from utils.clock import VirtualClock, set_clock
 
 
 class TestAccount(unittest.TestCase):
@@ -57,3 +65,54 @@ class TestAccount(unittest.TestCase):
         self.account.cancel_order(order1.get_orderId())
         self.account.cancel_order(order2.get_orderId())
         self.assertEqual(len(self.account.open_order_ids()), order_count)
+
+
+class TestStreamRunner(unittest.TestCase):
+    def test_market_closed(self):
+        class Fast(BaseHandler):
+            subscription = [TimerEvent.type]
+            timers = {'fast': 0.1}
+
+        sleep = time.sleep
+        sleeps = []
+        start = time.time()
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            if time.time() - start > 0.5:
+                runner.running = False
+            sleep(min(seconds, 0.05))
+
+        with mock.patch('broker.fxcm.streaming.is_market_open', return_value=False):
+            runner = FXCMStreamRunner(queue.Queue(), pairs=['EUR/USD'], handlers=[Fast(None)],
+                                      api=mock.MagicMock())
+            with mock.patch('broker.fxcm.streaming.time.sleep', side_effect=fake_sleep):
+                runner.run()
+
+        # the loop waits for the next timer instead of spinning on the jobs a closed market doesn't release
+        self.assertTrue(sleeps)
+        self.assertTrue(all(seconds > 0 for seconds in sleeps))
+        self.assertLess(len(sleeps), 40)
+        self.assertEqual(runner.timer_service.fired, 0)
+        self.assertGreater(runner.timer_service.skipped, 0)
+        self.assertTrue(runner.queue.empty())
+
+    def test_checks(self):
+        with mock.patch('broker.fxcm.streaming.is_market_open', return_value=False):
+            runner = FXCMStreamRunner(queue.Queue(), pairs=['EUR/USD'], handlers=[], api=mock.MagicMock())
+        calls = []
+        for name in ('generate_heartbeat', 'check_market_status', 'check_connection'):
+            setattr(runner, name, lambda name=name: calls.append(name))
+
+        clock = VirtualClock(datetime(2019, 3, 4))
+        set_clock(clock)
+        self.addCleanup(set_clock)
+        runner.setup_timers()
+        self.assertAlmostEqual(runner.run_timers(), runner.market_check_interval)
+        self.assertEqual(calls, [])
+
+        clock.set(datetime(2019, 3, 4, 0, 0, 5))
+        runner.run_timers()
+        self.assertEqual(sorted(calls), ['check_connection', 'check_market_status', 'generate_heartbeat'])
+        self.assertEqual(runner.check_timers.stats()['missed'], 4)  # the market checks of seconds 1 to 4
+        self.assertEqual(runner.timer_service.fired, 0)
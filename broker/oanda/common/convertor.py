@@ -1,12 +1,16 @@
 from decimal import Decimal
 
 from mt4.constants import OrderSide, PERIOD_M1, PERIOD_M5, PERIOD_M15, PERIOD_M30, PERIOD_H1, PERIOD_H4, PERIOD_D1, \
-    PERIOD_W1, PERIOD_MN1
+    PERIOD_W1, PERIOD_MN1, get_instrument
 from broker.oanda.common.constants import UNIT_RATIO
 
 
 def get_symbol(symbol):
     '''MT4 symbol to Oanda V20 symbol name'''
+    instrument = get_instrument(symbol)
+    if instrument is not None:
+        return instrument.oanda
+
     symbol = symbol.replace("/", "_").upper()
 
     if '_' not in symbol:
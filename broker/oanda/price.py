@@ -1,7 +1,6 @@
 import logging
 from decimal import Decimal
 
-import dateparser
 import pandas as pd
 
 import settings
@@ -10,6 +9,7 @@ from broker.oanda.base import OANDABase
 from broker.oanda.common.convertor import get_symbol, get_timeframe_granularity
 from broker.oanda.common.view import price_to_string, heartbeat_to_string
 from mt4.constants import pip
+from utils.time import parse_rfc3339, parse_datetime
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +19,7 @@ class PriceMixin(OANDABase, PriceBase):
 
     def _process_price(self, price):
         instrument = price.instrument
-        time = dateparser.parse(price.time)
+        time = parse_rfc3339(price.time)
         bid = Decimal(str(price.bids[0].price))
         ask = Decimal(str(price.asks[0].price))
         spread = pip(instrument, ask - bid)
@@ -64,12 +64,12 @@ class PriceMixin(OANDABase, PriceBase):
         granularity = get_timeframe_granularity(granularity)
 
         if isinstance(fromTime, str):
-            fromTime = dateparser.parse(fromTime).strftime('%Y-%m-%dT%H:%M:%S')
+            fromTime = parse_datetime(fromTime).strftime('%Y-%m-%dT%H:%M:%S')
         elif fromTime:
             fromTime = fromTime.strftime('%Y-%m-%dT%H:%M:%S')
 
         if isinstance(toTime, str):
-            toTime = dateparser.parse(toTime).strftime('%Y-%m-%dT%H:%M:%S')
+            toTime = parse_datetime(toTime).strftime('%Y-%m-%dT%H:%M:%S')
         elif toTime:
             toTime = toTime.strftime('%Y-%m-%dT%H:%M:%S')
 
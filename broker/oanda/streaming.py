@@ -1,11 +1,14 @@
 import logging
+from decimal import Decimal
 from queue import Empty, Queue
-import dateparser
 
+import settings
 from broker.base import AccountType
 from broker import SingletonOANDA
+from event.event import HeartBeatEvent, TickPriceEvent
 from event.runner import StreamRunnerBase
 from broker.oanda.common.convertor import get_symbol
+from utils.time import parse_rfc3339
 
 logger = logging.getLogger(__name__)
 
@@ -49,19 +52,14 @@ class OandaV20StreamRunner(StreamRunnerBase):
                 self.put(HeartBeatEvent())
             elif msg_type == "pricing.ClientPrice" and msg.type == 'PRICE':
                 instrument = msg.instrument
-                time = dateparser.parse(msg.time)
+                time = parse_rfc3339(msg.time)
                 bid = Decimal(str(msg.bids[0].price))
                 ask = Decimal(str(msg.asks[0].price))
                 self.put(TickPriceEvent(self.broker, instrument, time, bid, ask))
             else:
                 print('Unknow type:', msg_type, msg.__dict__)
 
-            while True:
-                event = self.get(False)
-                if event:
-                    self.handle_event(event)
-                else:
-                    break
+            self.drain()
 
             if not self.running:
                 self.stop()
@@ -76,7 +74,6 @@ class OandaV20StreamRunner(StreamRunnerBase):
 if __name__ == '__main__':
     from event.runner import *
     from event.handler import *
-    import settings
 
     queue = Queue(maxsize=2000)
     debug = DebugHandler(queue)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from event.runner import Runner
+from utils import clock
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRunner(Runner):
+    """
+    Runner on an asyncio event loop.
+
+    Handlers defining `async def process(self, event)` are awaited on the loop,
+    legacy sync handlers run off the loop on a single thread, one at a time,
+    as they share broker clients and account state that aren't thread safe.
+    Sync handlers setting concurrent = True run on a pool of max_workers
+    threads instead. Each event is handed to all its
+    handlers at once, so a handler waiting on I/O (telegram, sms, broker rest)
+    only holds back its own later events: every handler still sees events in
+    queue order, one at a time. An event is retried once all its handlers are
+    done, if any of them returned truthy.
+    """
+    max_in_flight = 1000  # events taken from the queue but not finished by all their handlers
+    idle_sleep = 0.01  # seconds between queue polls when it's empty
+    max_workers = 8  # threads running the concurrent sync handlers
+
+    def __init__(self, queue, *args, codec=None, retry=None, metrics=None, journal=None, timer_service=None,
+                 **kwargs):
+        super(AsyncRunner, self).__init__(queue, codec=codec, retry=retry, metrics=metrics, journal=journal,
+                                          timer_service=timer_service)
+        self.executor = None
+        self.serial_executor = None
+        self.locks = {}
+        self.in_flight = None
+        self.tasks = set()
+        self.register(*args)
+
+    def run(self):
+        logger.info('%s statup.' % self.__class__.__name__)
+        logger.info('Registered handler: %s' % ', '.join([x.__class__.__name__ for x in self.handlers]))
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.run_async())
+        finally:
+            loop.close()
+
+    async def run_async(self):
+        self.setup()
+        try:
+            while self.running:
+                if not await self.drain_async():
+                    await asyncio.sleep(self.idle_sleep)
+            await self.join()
+        finally:
+            self.executor.shutdown(wait=True)
+            self.serial_executor.shutdown(wait=True)
+            if self.journal is not None:
+                self.journal.close()
+
+    def setup(self):
+        """loop bound state, call from inside the loop before handling events"""
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.serial_executor = ThreadPoolExecutor(max_workers=1)
+        self.locks = dict((handler, asyncio.Lock()) for handler in self.handlers)
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+
+    async def drain_async(self):
+        """start handling queued events until the queue is empty, return the count started"""
+        self.release_retries()
+        self.release_timers()
+        self.release_errors()
+        count = 0
+        while self.running:
+            events = self.get_many(self.batch_size)
+            if not events:
+                break
+            for event in events:
+                await self.in_flight.acquire()
+                task = asyncio.ensure_future(self.handle_event_async(event))
+                self.tasks.add(task)
+                task.add_done_callback(self.task_done)
+            count += len(events)
+        if self.metrics:
+            self.metrics.report()
+        return count
+
+    def task_done(self, task):
+        self.tasks.discard(task)
+        self.in_flight.release()
+
+    async def join(self):
+        """wait for the events in flight"""
+        if self.tasks:
+            await asyncio.wait(list(self.tasks))
+
+    async def handle_event_async(self, event):
+        event.freeze()
+        if self.journal is not None:
+            self.journal.append(event)
+        if self.metrics:
+            self.metrics.record_wait(event.type, (clock.utcnow() - event.time).total_seconds())
+        handlers = self.dispatch.get(event.type, self.wildcard)
+        if not handlers:
+            return
+        results = await asyncio.gather(*[self.process_event_async(handler, event) for handler in handlers])
+        if any(results):
+            self.retry.schedule(event)
+
+    async def process_event_async(self, handler, event):
+        """process event by single handler, in order with the handler's other events"""
+        lock = self.locks.get(handler)
+        if lock is None:
+            lock = self.locks[handler] = asyncio.Lock()
+        async with lock:
+            if asyncio.iscoroutinefunction(handler.process):
+                start = time.perf_counter()
+                failed = False
+                try:
+                    return await handler.process(event)
+                except Exception as ex:
+                    failed = True
+                    self.process_error(ex, event)
+                finally:
+                    if self.metrics:
+                        self.metrics.record(handler, event.type, time.perf_counter() - start, failed)
+            else:
+                executor = self.executor if handler.concurrent else self.serial_executor
+                return await asyncio.get_running_loop().run_in_executor(executor, self.process_event_sync, handler,
+                                                                        event)
+
+    def process_event_sync(self, handler, event):
+        """a sync handler on an executor thread, handle_error of its failures runs on the loop, see release_errors"""
+        if handler.background:
+            return self.process_event(handler, event)
+        return self.run_handler(handler, event, threaded=True)
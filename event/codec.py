@@ -0,0 +1,229 @@
+import json
+import queue
+import struct
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from event.event import Event, EventType
+from mt4.constants import Instrument, INSTRUMENTS
+
+MAGIC = 0xE7  # first byte of a binary frame, can never start a JSON document
+
+_NONE = 0
+_INT = 1
+_DECIMAL = 2
+_STR = 3
+_DATETIME = 4
+_TEXT = 5  # decimal or int out of the fixed width range, stored as text
+
+_HEADER = struct.Struct('>BB')
+_TAG = struct.Struct('>B')
+_INT64 = struct.Struct('>Bq')
+_DECIMAL64 = struct.Struct('>Bqb')
+_LENGTH = struct.Struct('>BH')
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_MISSING = object()
+
+# fields shared by every event, written before the per type fields
+COMMON_FIELDS = ('time', 'tried')
+# set on retried copies only, see event.retry, those are written as json
+RETRY_FIELDS = ('failed',)
+
+# fixed field order per event type, the names never go over the wire.
+# only append to this dict and to the field tuples, the position is the wire id,
+# fields appended after a frame was written decode as None.
+# every field must be a slot of the event class registered for the type.
+SCHEMAS = {
+    EventType.DEBUG: ('action',),
+    EventType.STARTUP: (),
+    EventType.SHUTDOWN: (),
+    EventType.HEARTBEAT: ('counter',),
+    EventType.TICK: ('instrument', 'bid', 'ask'),
+    EventType.TICK_PRICE: ('broker', 'instrument', 'bid', 'ask', 'bid_points', 'ask_points'),
+    EventType.TIMEFRAME: ('timeframe', 'current_time', 'previous', 'timezone'),
+    EventType.SIGNAL: ('action', 'strategy', 'version', 'magic_number', 'instrument', 'order_type', 'side', 'price',
+                       'stop_loss', 'take_profit', 'trailing_stop', 'percent', 'trade_id'),
+    EventType.ORDER_CLOSE: ('strategy', 'version', 'magic_number', 'instrument', 'stop_loss', 'take_profit',
+                            'trailing_stop', 'percent'),
+    EventType.ORDER_HOLDING: ('magic_number', 'orders'),
+    EventType.TRADE_OPEN: ('broker', 'account_id', 'trade_id', 'instrument', 'side', 'lots', 'open_time',
+                           'open_price', 'stop_loss', 'take_profit', 'magic_number'),
+    EventType.TRADE_CLOSE: ('broker', 'account_id', 'trade_id', 'instrument', 'side', 'lots', 'profit', 'close_time',
+                            'close_price', 'open_time', 'pips'),
+    EventType.ORDER: ('instrument', 'units', 'order_type', 'side', 'expiry', 'price', 'lowerBound', 'upperBound',
+                      'stopLoss', 'takeProfit', 'trailingStop'),
+    EventType.MARKET: ('action',),
+    EventType.CONNECT: ('action',),
+    EventType.TIMER: ('name', 'scheduled', 'missed'),
+}
+
+TYPE_IDS = dict((event_type, i) for i, event_type in enumerate(SCHEMAS))
+TYPES = dict((i, (event_type, COMMON_FIELDS + fields)) for i, (event_type, fields) in enumerate(SCHEMAS.items()))
+
+
+class JsonCodec(object):
+    """Readable wire format, Event.to_dict dumped as json."""
+    binary = False
+
+    def encode(self, event):
+        return json.dumps(event.to_dict())
+
+    def decode(self, data):
+        return Event.from_dict(json.loads(data))
+
+
+class BinaryCodec(object):
+    """
+    Compact wire format with a fixed field order per EventType.
+
+    Frame: MAGIC, type id, then one tagged value per schema field.
+    Datetimes are epoch nanoseconds (naive values are UTC), decimals are an
+    exact int64 coefficient plus exponent, floats are sent as their decimal
+    repr to match what the json path hands to handlers.
+    Decoded events are instances of the class registered for their type.
+    Events without a schema, carrying extra attributes or retried are written
+    as json and any json frame is accepted on decode, so event/debug.py keeps
+    working.
+    """
+    binary = True
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback or JsonCodec()
+
+    def encode(self, event):
+        type_id = TYPE_IDS.get(event.type)
+        if type_id is None or event.tried:
+            return self.fallback.encode(event)
+        fields = TYPES[type_id][1]
+        if event._dynamic:
+            extra = set(event.as_dict()).difference(fields)
+            extra.discard('type')
+            if extra:
+                return self.fallback.encode(event)
+
+        parts = [_HEADER.pack(MAGIC, type_id)]
+        for name in fields:
+            value = getattr(event, name, _MISSING)
+            if value is _MISSING:
+                return self.fallback.encode(event)
+            self._encode_value(parts, value, event, name)
+        return b''.join(parts)
+
+    def _encode_value(self, parts, value, event, name):
+        value_type = type(value)
+        if value is None:
+            parts.append(_TAG.pack(_NONE))
+        elif value_type is str or value_type is Instrument:
+            raw = value.encode('utf-8')
+            parts.append(_LENGTH.pack(_STR, len(raw)))
+            parts.append(raw)
+        elif value_type is Decimal or value_type is float:
+            if value_type is float:
+                value = Decimal(repr(value))
+            exponent = value.as_tuple().exponent
+            if type(exponent) is int and -128 <= exponent <= 127:
+                coefficient = int(value.scaleb(-exponent))
+                if _INT64_MIN <= coefficient <= _INT64_MAX:
+                    parts.append(_DECIMAL64.pack(_DECIMAL, coefficient, exponent))
+                    return
+            self._encode_text(parts, str(value))
+        elif value_type is int:
+            if _INT64_MIN <= value <= _INT64_MAX:
+                parts.append(_INT64.pack(_INT, value))
+            else:
+                self._encode_text(parts, str(value))
+        elif isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            parts.append(_INT64.pack(_DATETIME, (value - _EPOCH) // _MICROSECOND * 1000))
+        else:
+            raise Exception('%s.%s is not serializable.' % (event.__class__.__name__, name))
+
+    def _encode_text(self, parts, text):
+        raw = text.encode('ascii')
+        parts.append(_LENGTH.pack(_TEXT, len(raw)))
+        parts.append(raw)
+
+    def decode(self, data):
+        if not data or data[0] != MAGIC:
+            return self.fallback.decode(data)
+
+        _, type_id = _HEADER.unpack_from(data, 0)
+        event_type, fields = TYPES[type_id]
+        offset = _HEADER.size
+        instance = Event.new(event_type)
+        end = len(data)
+        for name in fields:
+            if offset >= end:
+                setattr(instance, name, None)
+                continue
+            tag = data[offset]
+            if tag == _NONE:
+                value = None
+                offset += 1
+            elif tag == _STR:
+                length = _LENGTH.unpack_from(data, offset)[1]
+                offset += _LENGTH.size
+                value = data[offset:offset + length].decode('utf-8')
+                offset += length
+                if name == 'instrument':
+                    value = INSTRUMENTS.get(value, value)
+            elif tag == _DECIMAL:
+                _, coefficient, exponent = _DECIMAL64.unpack_from(data, offset)
+                value = Decimal(coefficient).scaleb(exponent)
+                offset += _DECIMAL64.size
+            elif tag == _INT:
+                value = _INT64.unpack_from(data, offset)[1]
+                offset += _INT64.size
+            elif tag == _DATETIME:
+                value = _EPOCH + timedelta(microseconds=_INT64.unpack_from(data, offset)[1] // 1000)
+                offset += _INT64.size
+            elif tag == _TEXT:
+                length = _LENGTH.unpack_from(data, offset)[1]
+                offset += _LENGTH.size
+                text = data[offset:offset + length].decode('ascii')
+                value = int(text) if text.lstrip('-').isdigit() else Decimal(text)
+                offset += length
+            else:
+                raise Exception('BinaryCodec unknown tag %s for %s.%s' % (tag, event_type, name))
+            setattr(instance, name, value)
+        return instance
+
+
+class ReferenceCodec(object):
+    """
+    In process delivery, the event object itself goes through the queue.
+
+    Events are frozen on put so a handler can't change what the next one sees,
+    a handler wanting a modified copy uses event.replace(...).
+    """
+    binary = False
+
+    def encode(self, event):
+        return event.freeze()
+
+    def decode(self, data):
+        return data
+
+
+json_codec = JsonCodec()
+binary_codec = BinaryCodec(json_codec)
+reference_codec = ReferenceCodec()
+
+
+def get_codec(backend):
+    """
+    Codec for a queue backend.
+
+    Queues crossing a process boundary declare a codec attribute (RedisQueue),
+    None there means json. In process queue.Queue pass events by reference.
+    """
+    if hasattr(backend, 'codec'):
+        return backend.codec or json_codec
+    if isinstance(backend, (queue.Queue, queue.SimpleQueue)):
+        return reference_codec
+    return json_codec
@@ -0,0 +1,50 @@
+import threading
+from collections import OrderedDict
+
+
+class TickConflator(object):
+    """
+    One pending tick per instrument between a broker stream and the queue.
+
+    offer keeps only the freshest tick of an instrument until the consumer is
+    ready and flush hands them over, in the order the instruments first became
+    pending. A tick overwritten in its slot counts as merged, a tick older than
+    the pending one is dropped. offer is called from the broker socket thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = OrderedDict()  # instrument -> latest TickPriceEvent
+        self.offered = 0
+        self.emitted = 0
+        self.merged = 0
+        self.dropped = 0
+
+    def offer(self, tick):
+        with self.lock:
+            self.offered += 1
+            pending = self.pending.get(tick.instrument)
+            if pending is None:
+                self.pending[tick.instrument] = tick
+            elif tick.time < pending.time:
+                self.dropped += 1
+            else:
+                self.merged += 1
+                self.pending[tick.instrument] = tick
+
+    def flush(self):
+        """pending ticks, freshest per instrument, and clear the slots"""
+        with self.lock:
+            if not self.pending:
+                return []
+            ticks = list(self.pending.values())
+            self.pending.clear()
+            self.emitted += len(ticks)
+            return ticks
+
+    def __len__(self):
+        return len(self.pending)
+
+    def stats(self):
+        return {'offered': self.offered, 'emitted': self.emitted, 'merged': self.merged, 'dropped': self.dropped,
+                'pending': len(self.pending)}
@@ -2,10 +2,10 @@ import json
 from datetime import datetime
 from decimal import Decimal
 
-from dateparser import parse
-
 from broker.oanda.common.constants import OrderType
-from mt4.constants import get_mt4_symbol
+from mt4.constants import get_mt4_symbol, from_points, Instrument, INSTRUMENTS
+from utils.clock import utcnow
+from utils.time import parse_datetime
 
 
 class SignalAction(object):
@@ -34,19 +34,86 @@ class EventType(object):
     TRADE_CLOSE = 'TRADE_CLOSE'
     ORDER = 'ORDER'
     MARKET = 'MARKET'
+    CONNECT = 'CONNECT'
+    TIMER = 'TIMER'
+
+
+EVENT_TYPES = {}  # EventType -> event class, used to rebuild typed events from the queue
+_FROZEN_TYPES = {}  # event class -> read only twin, see Event.freeze
+_MISSING = object()
+
+
+def register_event(cls):
+    """class decorator, make the event class the one rebuilt for its type"""
+    EVENT_TYPES[cls.type] = cls
+    return cls
 
 
 class Event(object):
+    __slots__ = ('time', 'tried', 'failed')  # failed: first failure, set on the copies event.retry holds
     type = None
+    _fields = ('time', 'tried', 'failed')
+    _dynamic = False  # instances have a __dict__ for attributes beyond _fields
+    _frozen = False
+    retry_deadline = None  # seconds after the first failure to give up retrying, None for the RetryScheduler default
+
+    def __init_subclass__(cls, **kwargs):
+        super(Event, cls).__init_subclass__(**kwargs)
+        slots = cls.__dict__.get('__slots__')
+        if slots is None:
+            cls._dynamic = True
+        else:
+            cls._fields = cls._fields + tuple(name for name in slots if name not in cls._fields)
 
     def __init__(self):
-        self.time = datetime.utcnow()
+        self.time = utcnow()
         self.tried = 0  # some event may push back to queue for re-process
 
+    def freeze(self):
+        """
+        Make the event read only, it's shared by reference between handlers.
+
+        The instance is switched to a read only twin of its class, so isinstance checks
+        and attribute reads are unchanged and nothing is paid on construction.
+        """
+        cls = self.__class__
+        if not cls._frozen:
+            frozen = _FROZEN_TYPES.get(cls)
+            if frozen is None:
+                frozen = type(cls.__name__, (cls,), {'__slots__': (), '__module__': cls.__module__, '_frozen': True,
+                                                     '__setattr__': _read_only, '__delattr__': _read_only,
+                                                     '__reduce__': _reduce_frozen})
+                _FROZEN_TYPES[cls] = frozen
+            self.__class__ = frozen
+        return self
+
+    def replace(self, **changes):
+        """writable copy of the event with changes applied"""
+        cls = self.__class__
+        if cls._frozen:
+            cls = cls.__bases__[0]
+        instance = cls.__new__(cls)
+        for name, value in self.as_dict().items():
+            setattr(instance, name, value)
+        for name, value in changes.items():
+            setattr(instance, name, value)
+        return instance
+
+    def as_dict(self):
+        """attribute values of the event, slotted and dynamic"""
+        data = {}
+        for name in self._fields:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                data[name] = value
+        if self._dynamic:
+            data.update(self.__dict__)
+        return data
+
     def to_dict(self):
-        data = self.__dict__.copy()
+        data = self.as_dict()
         for k in data.keys():
-            if type(data[k]) in (str, float, int) or data[k] is None:
+            if type(data[k]) in (str, float, int, Instrument) or data[k] is None:
                 pass
             elif type(data[k]) is Decimal:
                 data[k] = float(data[k])
@@ -57,49 +124,106 @@ class Event(object):
         data['type'] = self.type
         return data
 
+    @staticmethod
+    def new(event_type, names=()):
+        """empty instance of the registered class for event_type, GenericEvent if it can't hold names"""
+        cls = EVENT_TYPES.get(event_type)
+        if cls is not None and (cls._dynamic or set(names).issubset(cls._fields)):
+            return cls.__new__(cls)
+        instance = GenericEvent.__new__(GenericEvent)
+        instance.type = event_type
+        return instance
+
     @staticmethod
     def from_dict(data):
-        instance = Event()
+        data = dict(data)  # the caller's dict is left as it was
+        event_type = data.pop('type', None)
+        instance = Event.new(event_type, data.keys())
         for k in data.keys():
             if type(data[k]) is int or data[k] is None:
                 pass
             elif type(data[k]) is float:
                 data[k] = Decimal(str(data[k]))
 
-            elif type(data[k]) is str:
+            elif type(data[k]) is str or type(data[k]) is Instrument:
                 if data[k].startswith('datetime:'):
                     dt_str = data[k].replace('datetime:', '')
-                    dt = parse(dt_str, date_formats=['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S:%f',
-                                                     '%Y-%m-%dT%H:%M:%S'])
+                    dt = parse_datetime(dt_str)
                     data[k] = dt or data[k]
+                elif k == 'instrument':
+                    data[k] = INSTRUMENTS.get(data[k], data[k])
             else:
                 raise Exception('Event.from_dict %s=%s is not deserializable.' % (k, data[k]))
             setattr(instance, k, data[k])
         return instance
 
 
+class FrozenEventError(AttributeError):
+    pass
+
+
+def _read_only(self, name, value=None):
+    raise FrozenEventError("%s is shared by reference and read only, use replace() to change %s." % (
+        self.__class__.__name__, name))
+
+
+def _reduce_frozen(self):
+    # the twin isn't a module attribute pickle can find, a frozen event goes as its writable copy
+    return _load_frozen, (self.replace(),)
+
+
+def _load_frozen(event):
+    """frozen event back from pickle or copy"""
+    return event.freeze()
+
+
+class GenericEvent(Event):
+    """event of a type without registered class, attributes are kept in __dict__"""
+
+
+@register_event
 class StartUpEvent(Event):
     type = EventType.STARTUP
+    __slots__ = ()
 
 
+@register_event
 class HeartBeatEvent(Event):
     type = EventType.HEARTBEAT
+    __slots__ = ('counter',)
 
     def __init__(self, hearbeat_count):
         super(HeartBeatEvent, self).__init__()
         self.counter = hearbeat_count
 
 
+@register_event
+class TimerEvent(Event):
+    """a job of event.timer.TimerService is due, scheduled is the slot it fires for, missed the slots skipped"""
+    type = EventType.TIMER
+    __slots__ = ('name', 'scheduled', 'missed')
+
+    def __init__(self, name, scheduled, missed=0):
+        super(TimerEvent, self).__init__()
+        self.name = name
+        self.scheduled = scheduled
+        self.missed = missed
+
+
+@register_event
 class DebugEvent(Event):
     type = EventType.DEBUG
+    __slots__ = ('action',)
 
     def __init__(self, action):
         super(DebugEvent, self).__init__()
         self.action = action
 
 
+@register_event
 class TimeFrameEvent(Event):
     type = EventType.TIMEFRAME
+    __slots__ = ('timeframe', 'current_time', 'previous', 'timezone')
 
     def __init__(self, timeframe, current_time, previous, timezone, time):
         super(TimeFrameEvent, self).__init__()
@@ -110,16 +234,20 @@ class TimeFrameEvent(Event):
         self.time = time
 
 
+@register_event
 class MarketEvent(Event):
     type = EventType.MARKET
+    __slots__ = ('action',)
 
     def __init__(self, action):
         super(MarketEvent, self).__init__()
         self.action = action
 
 
+@register_event
 class TickEvent(Event):
     type = EventType.TICK
+    __slots__ = ('instrument', 'bid', 'ask')
 
     def __init__(self, instrument, time, bid, ask):
         self.instrument = instrument
@@ -135,16 +263,50 @@ class TickEvent(Event):
         )
 
 
+@register_event
 class TickPriceEvent(Event):
+    """
+    Bid and ask of an instrument.
+
+    A tick made with from_points carries the prices as integer points
+    (mt4.constants.to_points) in bid_points and ask_points, bid and ask are
+    only made Decimal when read. Ticks made from Decimals have no points.
+
+    A known instrument, any alias, is replaced by its interned Instrument.
+    """
     type = EventType.TICK_PRICE
+    __slots__ = ('broker', 'instrument', 'bid', 'ask', 'bid_points', 'ask_points')
 
-    def __init__(self, broker, instrument, time, bid, ask):
+    def __init__(self, broker, instrument, time, bid, ask, bid_points=None, ask_points=None):
         super(TickPriceEvent, self).__init__()
         self.broker = broker
-        self.instrument = instrument
+        self.instrument = INSTRUMENTS.get(instrument, instrument)
         self.time = time
         self.bid = bid
         self.ask = ask
+        self.bid_points = bid_points
+        self.ask_points = ask_points
+
+    @classmethod
+    def from_points(cls, broker, instrument, time, bid_points, ask_points):
+        event = cls.__new__(cls)
+        event.time = time
+        event.tried = 0
+        event.broker = broker
+        event.instrument = INSTRUMENTS.get(instrument, instrument)
+        event.bid_points = bid_points
+        event.ask_points = ask_points
+        return event
+
+    def __getattr__(self, name):
+        # only called for unset slots, bid and ask of a tick made from points
+        if name == 'bid' or name == 'ask':
+            points = getattr(self, name + '_points', None)
+            if points is not None:
+                value = from_points(self.instrument, points)
+                object.__setattr__(self, name, value)  # cached, frozen ticks included
+                return value
+        raise AttributeError("'%s' object has no attribute '%s'" % (self.__class__.__name__, name))
 
     def __str__(self):
         return "Type: %s, Instrument: %s, Time: %s, Bid: %s, Ask: %s" % (
@@ -153,8 +315,11 @@ class TickPriceEvent(Event):
         )
 
 
+@register_event
 class SignalEvent(Event):
     type = EventType.SIGNAL
+    __slots__ = ('action', 'strategy', 'version', 'magic_number', 'instrument', 'order_type', 'side', 'price',
+                 'stop_loss', 'take_profit', 'trailing_stop', 'percent', 'trade_id')
 
     def __init__(self, action, strategy_name, version, magic_number, instrument, side, price=None,
                  stop_loss=None, take_profit=None, trailing_stop=None, percent=None, trade_id=None,
@@ -181,9 +346,12 @@ class SignalEvent(Event):
         )
 
 
+@register_event
 class OrderUpdateEvent(Event):
     """order update signal"""
     type = EventType.ORDER_CLOSE
+    __slots__ = ('strategy', 'version', 'magic_number', 'instrument', 'stop_loss', 'take_profit', 'trailing_stop',
+                 'percent')
 
     def __init__(self, strategy_name, version, magic_number, instrument, stop_loss=None, take_profit=None,
                  trailing_stop=None, percent=None):
@@ -198,9 +366,11 @@ class OrderUpdateEvent(Event):
         super(OrderUpdateEvent, self).__init__()
 
 
+@register_event
 class OrderHoldingEvent(Event):
     """order holding, to notify strategy to calculate close signal"""
     type = EventType.ORDER_HOLDING
+    __slots__ = ('orders', 'magic_number')
 
     def __init__(self, magic_number, orders):
         self.orders = orders
@@ -208,8 +378,11 @@ class OrderHoldingEvent(Event):
         super(OrderHoldingEvent, self).__init__()
 
 
+@register_event
 class TradeCloseEvent(Event):
-    type = EventType.ORDER_CLOSE
+    type = EventType.TRADE_CLOSE
+    __slots__ = ('broker', 'account_id', 'trade_id', 'instrument', 'side', 'lots', 'profit', 'close_price',
+                 'close_time', 'open_time', 'pips')
 
     def __init__(self, broker, account_id, trade_id, instrument, side, lots, profit, close_time, close_price, pips=None,
                  open_time=None):
@@ -239,8 +412,11 @@ class TradeCloseEvent(Event):
         return text
 
 
+@register_event
 class TradeOpenEvent(Event):
     type = EventType.TRADE_OPEN
+    __slots__ = ('broker', 'account_id', 'trade_id', 'instrument', 'side', 'lots', 'open_time', 'open_price',
+                 'stop_loss', 'take_profit', 'magic_number')
 
     def __init__(self, broker, account_id, trade_id, instrument, side, lots, open_time, open_price, stop_loss=None,
                  take_profit=None, magic_number=None):
@@ -264,8 +440,11 @@ class TradeOpenEvent(Event):
         return text
 
 
+@register_event
 class OrderEvent(Event):
     type = EventType.ORDER
+    __slots__ = ('instrument', 'units', 'order_type', 'side', 'expiry', 'price', 'lowerBound', 'upperBound',
+                 'stopLoss', 'takeProfit', 'trailingStop')
 
     def __init__(self, instrument, units, order_type, side, expiry=None, price=None, lowerBound=None, upperBound=None,
                  stopLoss=None, takeProfit=None, trailingStop=None):
@@ -289,7 +468,11 @@ class OrderEvent(Event):
         )
 
 
+@register_event
 class ConnectEvent(Event):
+    type = EventType.CONNECT
+    __slots__ = ('action',)
+
     def __init__(self, action):
         self.action = action.upper()
         super(ConnectEvent, self).__init__()
@@ -1,52 +1,107 @@
 import logging
+from datetime import timedelta
 from queue import Empty
 
 from dateutil.relativedelta import relativedelta
 
 import settings
+from event.codec import get_codec
 from event.event import *
-from mt4.constants import PERIOD_CHOICES, get_candle_time, PERIOD_H1, get_mt4_symbol, PERIOD_D1
+from mt4.constants import PERIOD_CHOICES, get_candle_time, PERIOD_H1, get_mt4_symbol, PERIOD_D1, get_next_candle_time
 from utils.market import is_market_open
+from utils import clock
+from utils.dry_run import is_dry_run
 from utils.redis import system_redis, set_last_tick, get_last_tick, price_redis
-from utils.telstra_api_v2 import send_to_admin
+from utils.telstra_api_v2 import send_to_admin_nowait
 import utils.telegram as tg
 
 logger = logging.getLogger(__name__)
+_EPOCH = datetime(1970, 1, 1)
 
 
 class QueueBase(object):
     queue = None
+    codec = None
 
-    def __init__(self, queue):
+    routed = False  # queue routes on event type, eg. event.lanes.LaneQueue
+
+    def __init__(self, queue, codec=None):
         self.queue = queue
+        self.codec = codec or get_codec(queue)
+        self.routed = getattr(queue, 'routed', False)
 
     def set_queue(self, queue):
         if not self.queue:
             self.queue = queue
+            self.codec = get_codec(queue)
+            self.routed = getattr(queue, 'routed', False)
 
     def put(self, event):
         try:
-            data = json.dumps(event.to_dict())
-            self.queue.put(data)
+            data = self.codec.encode(event)
+            if self.routed:
+                self.queue.put(data, event.type)
+            else:
+                self.queue.put(data)
         except Exception as ex:
             logger.error('queue put error=%s' % ex)
 
-    def get(self, block=False):
+    def get(self, block=False, timeout=None):
+        """an event or None, block waits up to timeout seconds, forever if None"""
         try:
-            data = self.queue.get(block)
+            data = self.queue.get(block, timeout)
             if data:
-                data = json.loads(data)
-                return Event.from_dict(data)
+                return self.codec.decode(data)
         except Empty:
             return None
         except Exception as ex:
             logger.error('queue get error=%s' % ex)
         return None
 
+    def put_many(self, events):
+        try:
+            items = [self.codec.encode(event) for event in events]
+            if self.routed:
+                self.queue.put_many(items, [event.type for event in events])
+            elif hasattr(self.queue, 'put_many'):
+                self.queue.put_many(items)
+            else:
+                for item in items:
+                    self.queue.put(item)
+        except Exception as ex:
+            logger.error('queue put_many error=%s' % ex)
+
+    def get_many(self, count):
+        """up to count events without blocking, one round trip on queues supporting get_many"""
+        items = []
+        try:
+            if hasattr(self.queue, 'get_many'):
+                items = self.queue.get_many(count)
+            else:
+                while len(items) < count:
+                    items.append(self.queue.get_nowait())
+        except Empty:
+            pass
+        except Exception as ex:
+            logger.error('queue get_many error=%s' % ex)
+
+        events = []
+        for data in items:
+            if not data:
+                continue
+            try:
+                events.append(self.codec.decode(data))
+            except Exception as ex:
+                logger.error('queue get_many decode error=%s' % ex)
+        return events
+
 
 class BaseHandler(QueueBase):
     subscription = []
     account = None
+    background = False  # process on utils.background.default_pool, for side effects only, never retried
+    concurrent = False  # a sync process safe to run on several AsyncRunner threads at once
+    timers = {}  # {name: seconds or cron expression}, fired by the runner as TimerEvent, subscribe to it
 
     def __init__(self, queue, account=None, *args, **kwargs):
         super(BaseHandler, self).__init__(queue)
@@ -77,7 +132,7 @@ class DebugHandler(BaseHandler):
             elif event.action.lower() == 'test_message':
                 tg.send_me('Test message')
         else:
-            print('[%s] %s' % (event.type, event.__dict__))
+            print('[%s] %s' % (event.type, event.as_dict()))
 
 
 class EventLoggerHandler(DebugHandler):
@@ -85,7 +140,7 @@ class EventLoggerHandler(DebugHandler):
         super(EventLoggerHandler, self).__init__(queue, events, *args, **kwargs)
 
     def process(self, event):
-        logger.info('[%s] %s' % (event.type, event.__dict__))
+        logger.info('[%s] %s' % (event.type, event.as_dict()))
 
 
 class TickPriceHandler(BaseHandler):
@@ -93,67 +148,120 @@ class TickPriceHandler(BaseHandler):
 
     def process(self, event):
         if settings.DEBUG:
-            print(event.__dict__)
+            print(event.as_dict())
         else:
             set_last_tick(event.time.strftime('%Y-%m-%d %H:%M:%S:%f'))
 
 
 class HeartBeatHandler(BaseHandler):
-    subscription = [HeartBeatEvent.type]
+    subscription = [TimerEvent.type]
+    timers = {'heartbeat': settings.HEARTBEAT, 'heartbeat.log': 120 * settings.HEARTBEAT}
 
     def process(self, event):
-        if not event.counter % (settings.HEARTBEAT / settings.LOOP_SLEEP):
+        if event.name == 'heartbeat':
             if settings.DEBUG:
                 pass
                 # print('HeartBeat: %s' % datetime.now())
-            else:
+            elif not is_dry_run():
                 system_redis.set('HEARTBEAT', datetime.now().strftime('%Y-%m-%d %H:%M:%S:%f'))
-
-        if not event.counter % (120 * settings.HEARTBEAT / settings.LOOP_SLEEP):
+        elif event.name == 'heartbeat.log':
             last_tick = get_last_tick()
             logger.info('[HeartBeatHandler] %s, last_tick=%s' % (event.time.strftime('%Y-%m-%d %H:%M:%S:%f'),
                                                                  last_tick))
 
 
 class TimeFrameTicker(BaseHandler):
+    """
+    Puts a TimeFrameEvent when a candle of any PERIOD_CHOICES timeframe opens.
+
+    The next candle boundary is precomputed, an event between the current M1
+    candle and that boundary costs a clock read and a comparison. With
+    use_event_time the time of the ticks and heartbeats drives the candles
+    instead of the clock, for backtests feeding historic ticks.
+    """
     subscription = [HeartBeatEvent.type, TickPriceEvent.type]
     candle_time = {}
     market_open = False
     timezone = 0
 
-    def __init__(self, queue=None, timezone=0):
+    def __init__(self, queue=None, timezone=0, use_event_time=False):
         super(TimeFrameTicker, self).__init__(queue)
         self.timezone = timezone
+        self.offset = timedelta(hours=timezone)
+        self.use_event_time = use_event_time
         self.market_open = is_market_open()
-        now = self.get_now()
-        for timeframe in PERIOD_CHOICES:
-            self.candle_time[timeframe] = get_candle_time(now, timeframe)
+        self.candle_time = {}
+        self.next_candle_time = {}
+        self.synced = not use_event_time  # event time candles are aligned on the first event
+        self.reset(clock.utcnow())
 
     def is_nfp(self):
         # is day of USA NFP
         pass
 
     def get_now(self):
-        now = datetime.utcnow() + relativedelta(hours=self.timezone)
+        now = clock.utcnow() + relativedelta(hours=self.timezone)
         return now
 
+    def reset(self, utc_now):
+        """align the candles with utc_now without putting events"""
+        now = utc_now + self.offset
+        for timeframe in PERIOD_CHOICES:
+            self.candle_time[timeframe] = get_candle_time(now, timeframe)
+            self.next_candle_time[timeframe] = get_next_candle_time(now, timeframe)
+        self.set_bounds()
+
+    def set_bounds(self):
+        """utc range, as datetimes and timestamps, in which no candle opens"""
+        self.floor_time = self.candle_time[PERIOD_CHOICES[0]] - self.offset
+        self.next_time = min(self.next_candle_time.values()) - self.offset
+        self.floor_timestamp = (self.floor_time - _EPOCH).total_seconds()
+        self.next_timestamp = (self.next_time - _EPOCH).total_seconds()
+
     def process(self, event):
-        now = self.get_now()
+        if self.use_event_time:
+            utc_now = event.time
+            if self.floor_time <= utc_now < self.next_time:
+                return
+        else:
+            timestamp = clock.timestamp()
+            if self.floor_timestamp <= timestamp < self.next_timestamp:
+                return
+            utc_now = clock.utcnow()
+
+        if utc_now < self.floor_time:
+            # the clock moved back, a replay starting before the ticker was built, or the first
+            # historic tick. Later out of order ticks are ignored.
+            if not self.use_event_time or not self.synced:
+                self.synced = True
+                self.reset(utc_now)
+            return
+        if not self.synced:
+            self.synced = True
+            self.reset(utc_now)
+            return
+        self.roll(utc_now)
+
+    def roll(self, utc_now):
+        now = utc_now + self.offset
         for timeframe in PERIOD_CHOICES:
+            if now < self.next_candle_time[timeframe]:
+                continue
             new = get_candle_time(now, timeframe)
-            if self.candle_time[timeframe] != new:
-                event = TimeFrameEvent(timeframe, new, self.candle_time[timeframe], self.timezone, now)
-                self.put(event)
-                # print(self.candle_time[timeframe], new)
-                self.candle_time[timeframe] = new
+            event = TimeFrameEvent(timeframe, new, self.candle_time[timeframe], self.timezone, now)
+            self.put(event)
+            self.candle_time[timeframe] = new
+            self.next_candle_time[timeframe] = get_next_candle_time(now, timeframe)
 
-                if timeframe == PERIOD_H1:
-                    last_tick = get_last_tick()
-                    logger.info('TimeFrame H1 , market_open=%s, last_tick=%s' % (self.market_open, last_tick))
+            if timeframe == PERIOD_H1:
+                last_tick = get_last_tick()
+                logger.info('TimeFrame H1 , market_open=%s, last_tick=%s' % (self.market_open, last_tick))
+        self.set_bounds()
 
 
 class PriceAlertHandler(BaseHandler):
-    subscription = [TickPriceEvent.type, TimeFrameEvent.type, HeartBeatEvent.type]
+    subscription = [TickPriceEvent.type, TimeFrameEvent.type, TimerEvent.type]
+    timers = {'price_alert.update': settings.HEARTBEAT}
     resistance_suffix = ['R1', 'R2', 'R3', 'R']
     support_suffix = ['S1', 'S2', 'S3', 'S']
     instruments = ['EURUSD', 'GBPUSD', 'USDJPY', 'USDCHF', 'AUDUSD', 'NZDUSD', 'XAUUSD']
@@ -172,8 +280,8 @@ class PriceAlertHandler(BaseHandler):
         elif event.type == TimeFrameEvent.type:
             if event.timeframe == PERIOD_D1:
                 self.reset_rs(event)
-        elif event.type == HeartBeatEvent.type:
-            if not event.counter % (settings.HEARTBEAT / settings.LOOP_SLEEP):
+        elif event.type == TimerEvent.type:
+            if event.name == 'price_alert.update':
                 self.update_price()
 
     def update_price(self):
@@ -183,7 +291,7 @@ class PriceAlertHandler(BaseHandler):
                 self.prices[key] = price_redis.get(key)
 
     def price_alert(self, event):
-        symbol = get_mt4_symbol(event.instrument)
+        symbol = event.instrument  # interned mt4 name, process only passes self.instruments
         for resistance_level in self.resistance_suffix:
             key = '%s_%s' % (symbol, resistance_level)
             resistance = self.prices.get(key)
@@ -194,8 +302,8 @@ class PriceAlertHandler(BaseHandler):
             if event.bid > price:
                 msg = '%s up corss %s = %s' % (symbol, resistance_level, price)
                 logger.info('[PRICE_ALERT] %s' % msg)
-                send_to_admin(msg)
-                tg.send_me(msg)
+                send_to_admin_nowait(msg)
+                tg.send_me_nowait(msg)
                 self.remove(key)
 
         for support_level in self.support_suffix:
@@ -208,8 +316,8 @@ class PriceAlertHandler(BaseHandler):
             if event.ask < price:
                 msg = '%s down corss %s = %s' % (symbol, support_level, price)
                 logger.info('[PRICE_ALERT] %s' % msg)
-                send_to_admin(msg)
-                tg.send_me(msg)
+                send_to_admin_nowait(msg)
+                tg.send_me_nowait(msg)
                 self.remove(key)
 
     def remove(self, key):
@@ -229,6 +337,7 @@ class PriceAlertHandler(BaseHandler):
 
 class TelegramHandler(BaseHandler):
     subscription = [TradeOpenEvent.type, TradeCloseEvent.type]
+    background = True
 
     def process(self, event):
         tg.send_me(event.to_text())
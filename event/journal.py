@@ -0,0 +1,209 @@
+import bisect
+import glob
+import logging
+import mmap
+import os
+import struct
+import time
+from datetime import datetime, timezone
+
+from event.codec import binary_codec
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'QSJ1'
+_HEADER = struct.Struct('>4sI')  # magic, format version
+_RECORD = struct.Struct('>Iq')  # frame length, event time as epoch ns
+_INDEX = struct.Struct('>qQ')  # event time as epoch ns, record offset
+_EPOCH = datetime(1970, 1, 1)
+VERSION = 1
+
+
+def to_ns(dt):
+    """naive utc or aware datetime to epoch nanoseconds"""
+    if dt is None:
+        return 0
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = dt - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000000 + delta.microseconds * 1000
+
+
+def segment_files(path):
+    return sorted(glob.glob(os.path.join(path, 'journal-*.seg')))
+
+
+def index_path(segment):
+    return segment[:-len('.seg')] + '.idx'
+
+
+class JournalWriter(object):
+    """
+    Append only event journal in rotating memory mapped segment files.
+
+    A segment is preallocated to segment_size and mapped, every event is a
+    record: frame length, event time in epoch ns, the codec frame (binary
+    codec, json for events without a schema). The length is written last and a
+    zero length marks the end, so a segment cut short by a crash still reads
+    up to its last whole record. Pages are msync'ed at most every
+    commit_interval seconds, never per event. Every index_every records the
+    (time, offset) goes to a sparse index, saved next to the segment as .idx.
+    A closed segment is truncated to its used size.
+    """
+    segment_size = 64 * 1024 * 1024
+    index_every = 1000  # records between sparse index entries
+    commit_interval = 1.0  # seconds between msync of the written pages
+
+    def __init__(self, path, codec=binary_codec, segment_size=None, index_every=None, commit_interval=None):
+        self.path = path
+        self.codec = codec
+        if segment_size:
+            self.segment_size = segment_size
+        if index_every:
+            self.index_every = index_every
+        if commit_interval is not None:
+            self.commit_interval = commit_interval
+        os.makedirs(path, exist_ok=True)
+
+        segments = segment_files(path)
+        self.seq = int(os.path.basename(segments[-1])[8:-4]) + 1 if segments else 1
+        self.file = None
+        self.map = None
+        self.name = None
+        self.offset = 0
+        self.committed = 0
+        self.last_commit = 0
+        self.records = 0
+        self.index = []
+        self.appended = 0
+        self.open_segment()
+
+    def open_segment(self):
+        self.name = os.path.join(self.path, 'journal-%06d.seg' % self.seq)
+        self.seq += 1
+        self.file = open(self.name, 'w+b')
+        self.file.truncate(self.segment_size)
+        self.map = mmap.mmap(self.file.fileno(), self.segment_size)
+        _HEADER.pack_into(self.map, 0, MAGIC, VERSION)
+        self.offset = self.committed = _HEADER.size
+        self.last_commit = time.time()
+        self.records = 0
+        self.index = []
+        logger.info('[JOURNAL] open segment %s' % self.name)
+
+    def close_segment(self):
+        self.commit()
+        self.map.close()
+        self.file.truncate(self.offset)
+        self.file.close()
+        self.map = self.file = None
+
+    def append(self, event):
+        try:
+            data = self.codec.encode(event)
+        except Exception as ex:
+            logger.error('[JOURNAL] encode error=%s, event=%s' % (ex, event))
+            return
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        size = _RECORD.size + len(data)
+        # keep room for the zero length end marker
+        if self.offset + size + _RECORD.size > self.segment_size:
+            if self.offset == _HEADER.size:
+                logger.error('[JOURNAL] event of %s bytes larger than a segment, skipped' % size)
+                return
+            self.close_segment()
+            self.open_segment()
+
+        ns = to_ns(event.time)
+        offset = self.offset
+        if not self.records % self.index_every:
+            self.index.append((ns, offset))
+        self.map[offset + _RECORD.size:offset + size] = data
+        _RECORD.pack_into(self.map, offset, len(data), ns)
+        self.offset = offset + size
+        self.records += 1
+        self.appended += 1
+
+        if self.commit_interval >= 0:
+            now = time.time()
+            if now - self.last_commit >= self.commit_interval:
+                self.commit(now)
+
+    def commit(self, now=None):
+        """msync the pages written since the last commit and save the index"""
+        if self.offset > self.committed:
+            start = self.committed - self.committed % mmap.ALLOCATIONGRANULARITY
+            self.map.flush(start, self.offset - start)
+            self.committed = self.offset
+            with open(index_path(self.name) + '.tmp', 'wb') as f:
+                f.write(b''.join(_INDEX.pack(ns, offset) for ns, offset in self.index))
+            os.replace(index_path(self.name) + '.tmp', index_path(self.name))
+        self.last_commit = now or time.time()
+
+    def close(self):
+        if self.map is not None:
+            self.close_segment()
+
+
+class JournalReader(object):
+    """
+    Reads a journal directory back, events in append order.
+
+    start and end (naive utc datetimes) filter on event time, the sparse
+    index skips to the last entry before start, which assumes event times
+    mostly grow within a segment as they do for a live stream.
+    """
+
+    def __init__(self, path, codec=binary_codec):
+        self.path = path
+        self.codec = codec
+
+    def load_index(self, segment):
+        try:
+            with open(index_path(segment), 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return []
+        return [_INDEX.unpack_from(raw, i) for i in range(0, len(raw) - len(raw) % _INDEX.size, _INDEX.size)]
+
+    def records(self, start=None, end=None):
+        """(epoch ns, frame) of the records within start and end"""
+        start_ns = to_ns(start) if start else None
+        end_ns = to_ns(end) if end else None
+        for segment in segment_files(self.path):
+            index = self.load_index(segment)
+            if end_ns is not None and index and index[0][0] > end_ns:
+                break
+            offset = _HEADER.size
+            if start_ns is not None and index:
+                position = bisect.bisect_right([ns for ns, _ in index], start_ns) - 1
+                if position > 0:
+                    offset = index[position][1]
+
+            with open(segment, 'rb') as f:
+                if os.fstat(f.fileno()).st_size <= _HEADER.size:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if data[:4] != MAGIC:
+                        logger.error('[JOURNAL] %s is not a journal segment' % segment)
+                        continue
+                    limit = len(data) - _RECORD.size
+                    while offset <= limit:
+                        length, ns = _RECORD.unpack_from(data, offset)
+                        if not length:
+                            break
+                        begin = offset + _RECORD.size
+                        offset = begin + length
+                        if start_ns is not None and ns < start_ns:
+                            continue
+                        if end_ns is not None and ns > end_ns:
+                            continue
+                        yield ns, data[begin:offset]
+
+    def read(self, start=None, end=None):
+        """decoded events within start and end"""
+        for _, frame in self.records(start, end):
+            yield self.codec.decode(frame)
+
+    __iter__ = read
@@ -0,0 +1,179 @@
+import queue
+import threading
+import time
+
+from event.codec import get_codec
+from event.event import EventType
+
+
+class Lane(object):
+    CONTROL = 'CONTROL'
+    EXECUTION = 'EXECUTION'
+    TRADE = 'TRADE'
+    TIMER = 'TIMER'
+    MARKET_DATA = 'MARKET_DATA'
+
+
+# drain order, highest priority first
+LANES = [Lane.CONTROL, Lane.EXECUTION, Lane.TRADE, Lane.TIMER, Lane.MARKET_DATA]
+
+DEFAULT_ROUTES = {
+    EventType.STARTUP: Lane.CONTROL,
+    EventType.SHUTDOWN: Lane.CONTROL,
+    EventType.DEBUG: Lane.CONTROL,
+    EventType.CONNECT: Lane.CONTROL,
+    EventType.MARKET: Lane.CONTROL,
+    EventType.SIGNAL: Lane.EXECUTION,
+    EventType.ORDER: Lane.EXECUTION,
+    EventType.ORDER_CLOSE: Lane.EXECUTION,
+    EventType.TRADE_OPEN: Lane.TRADE,
+    EventType.TRADE_CLOSE: Lane.TRADE,
+    EventType.ORDER_HOLDING: Lane.TRADE,
+    EventType.HEARTBEAT: Lane.TIMER,
+    EventType.TIMEFRAME: Lane.TIMER,
+    EventType.TIMER: Lane.TIMER,
+    EventType.TICK: Lane.MARKET_DATA,
+    EventType.TICK_PRICE: Lane.MARKET_DATA,
+}
+
+
+class LaneQueue(object):
+    """
+    Queue made of one backing queue per priority lane.
+
+    put routes an event by its type, get and get_many drain the lanes in
+    priority order, so signals and trade events never wait behind a flood of
+    ticks. Backing queues are queue.Queue or RedisQueue, all of the same kind.
+    A blocking get waits on a condition notified by put for in process lanes,
+    on one BLPOP over all the lane keys, in priority order, for redis lanes.
+    """
+    routed = True  # QueueBase passes the event type to put
+
+    def __init__(self, lanes, routes=None, default=Lane.TRADE):
+        """lanes: [(lane name, backing queue)] highest priority first"""
+        self.lanes = list(lanes)
+        self.queues = dict(self.lanes)
+        self.routes = DEFAULT_ROUTES if routes is None else routes
+        self.default = default
+        self.is_redis = all(hasattr(q, 'get_first') for _, q in self.lanes)
+        self.not_empty = threading.Condition()
+        self.codec = get_codec(self.lanes[0][1])
+        self.put_count = dict((name, 0) for name, _ in self.lanes)
+        self.get_count = dict((name, 0) for name, _ in self.lanes)
+
+    @classmethod
+    def local(cls, routes=None, maxsize=0, **kwargs):
+        return cls([(name, queue.Queue(maxsize=maxsize)) for name in LANES], routes, **kwargs)
+
+    @classmethod
+    def redis(cls, name, routes=None, default=Lane.TRADE, **kwargs):
+        """one RedisQueue per lane named <name>:<lane>, kwargs go to RedisQueue"""
+        from utils.redis import RedisQueue
+
+        lanes = [(lane, RedisQueue('%s:%s' % (name, lane), **kwargs)) for lane in LANES]
+        return cls(lanes, routes, default=default)
+
+    def lane_of(self, event_type):
+        lane = self.routes.get(event_type, self.default)
+        return lane if lane in self.queues else self.default
+
+    def qsize(self):
+        return sum(q.qsize() for _, q in self.lanes)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def depth(self):
+        """queued items per lane"""
+        return dict((name, q.qsize()) for name, q in self.lanes)
+
+    def put(self, item, event_type=None):
+        lane = self.lane_of(event_type)
+        self.queues[lane].put(item)
+        self.put_count[lane] += 1
+        if not self.is_redis:
+            with self.not_empty:
+                self.not_empty.notify()
+
+    def put_many(self, items, event_types=None):
+        by_lane = {}
+        for item, event_type in zip(items, event_types or [None] * len(items)):
+            by_lane.setdefault(self.lane_of(event_type), []).append(item)
+        for lane, lane_items in by_lane.items():
+            q = self.queues[lane]
+            if hasattr(q, 'put_many'):
+                q.put_many(lane_items)
+            else:
+                for item in lane_items:
+                    q.put(item)
+            self.put_count[lane] += len(lane_items)
+        if by_lane and not self.is_redis:
+            with self.not_empty:
+                self.not_empty.notify()
+
+    def _get_lane(self, name, q):
+        try:
+            item = q.get_nowait()
+        except queue.Empty:
+            return None
+        if item:
+            self.get_count[name] += 1
+        return item
+
+    def _get_first(self):
+        for name, q in self.lanes:
+            item = self._get_lane(name, q)
+            if item:
+                return item
+        return None
+
+    def get(self, block=False, timeout=None):
+        item = self._get_first()
+        if item:
+            return item
+        if not block:
+            raise queue.Empty
+
+        if self.is_redis:
+            names = dict((id(q), name) for name, q in self.lanes)
+            q, item = self.lanes[0][1].get_first([q for _, q in self.lanes], timeout)
+            if not item:
+                raise queue.Empty
+            self.get_count[names[id(q)]] += 1
+            return item
+
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.not_empty:
+            while True:
+                item = self._get_first()
+                if item:
+                    return item
+                if deadline is None:
+                    self.not_empty.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def get_many(self, count):
+        """up to count items without blocking, higher lanes first"""
+        items = []
+        for name, q in self.lanes:
+            wanted = count - len(items)
+            if wanted <= 0:
+                break
+            if hasattr(q, 'get_many'):
+                lane_items = [item for item in q.get_many(wanted) if item]
+                self.get_count[name] += len(lane_items)
+                items.extend(lane_items)
+            else:
+                for _ in range(wanted):
+                    item = self._get_lane(name, q)
+                    if not item:
+                        break
+                    items.append(item)
+        return items
@@ -0,0 +1,207 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_RESOLUTION = 4  # buckets per power of two
+_BUCKETS = 32 * _RESOLUTION + 1  # 1us up to ~70 minutes
+_QUANTILES = (('0.5', 'p50'), ('0.99', 'p99'))
+_log2 = math.log2
+
+
+class Histogram(object):
+    """
+    Latency histogram in seconds with log spaced buckets.
+
+    Bucket i > 0 holds values up to 2 ** (i / 4) microseconds, so a percentile
+    is off by at most ~19%, and adding a value costs a log2 and a list index.
+    """
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        us = value * 1000000
+        if us <= 1:
+            index = 0
+        else:
+            index = int(_log2(us) * _RESOLUTION) + 1
+            if index >= _BUCKETS:
+                index = _BUCKETS - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """upper bound of the bucket holding the q (0-1) percentile, in seconds"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(2 ** (index / _RESOLUTION) / 1000000, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class HandlerStats(object):
+    __slots__ = ('latency', 'errors')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+
+
+class RunnerMetrics(object):
+    """
+    Per handler and event type timing, calls and errors, and queue wait per event type.
+
+    Runner.run_handler and Runner.handle_event record into it, report sends a
+    snapshot to every sink at most once per interval seconds. Queue wait is
+    measured from Event.time, so it includes the broker's delay for ticks
+    stamped with the server time, and the retry delay for retried events.
+    Handlers running on executor and background threads record at the same
+    time as the runner, recording and snapshots hold a lock.
+    """
+
+    def __init__(self, sinks=None, interval=300, name='runner'):
+        self.sinks = [LogSink()] if sinks is None else sinks
+        self.interval = interval
+        self.name = name
+        self.handlers = {}  # (handler, event type) -> HandlerStats
+        self.waits = {}  # event type -> Histogram
+        self.started = time.time()
+        self.next_report = self.started + interval
+        self.lock = threading.Lock()
+
+    def record(self, handler, event_type, elapsed, failed=False):
+        key = (handler, event_type)
+        with self.lock:
+            stats = self.handlers.get(key)
+            if stats is None:
+                stats = self.handlers[key] = HandlerStats()
+            stats.latency.add(elapsed)
+            if failed:
+                stats.errors += 1
+
+    def record_wait(self, event_type, wait):
+        with self.lock:
+            histogram = self.waits.get(event_type)
+            if histogram is None:
+                histogram = self.waits[event_type] = Histogram()
+            histogram.add(wait if wait > 0 else 0.0)
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            handlers = []
+            for (handler, event_type), stats in sorted(self.handlers.items(),
+                                                       key=lambda x: (x[0][0].__class__.__name__, str(x[0][1]))):
+                latency = stats.latency
+                handlers.append({'handler': handler.__class__.__name__, 'event': event_type, 'count': latency.count,
+                                 'errors': stats.errors, 'rate': latency.count / elapsed, 'mean': latency.mean(),
+                                 'p50': latency.percentile(0.5), 'p99': latency.percentile(0.99), 'max': latency.max})
+            waits = []
+            for event_type, histogram in sorted(self.waits.items(), key=lambda x: str(x[0])):
+                waits.append({'event': event_type, 'count': histogram.count, 'rate': histogram.count / elapsed,
+                              'p50': histogram.percentile(0.5), 'p99': histogram.percentile(0.99),
+                              'max': histogram.max})
+            return {'name': self.name, 'elapsed': elapsed, 'handlers': handlers, 'waits': waits}
+
+    def report(self, now=None):
+        """send a snapshot to the sinks if interval passed since the last one"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if now < self.next_report:
+                return False
+            self.next_report = now + self.interval
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            try:
+                sink.write(snapshot)
+            except Exception as ex:
+                logger.error('[METRICS] %s error=%s' % (sink.__class__.__name__, ex))
+        return True
+
+
+class LogSink(object):
+    """one log line per handler and event type"""
+
+    def __init__(self, log=None):
+        self.log = log or logger
+
+    def write(self, snapshot):
+        for row in snapshot['handlers']:
+            self.log.info('[METRICS] %s %s/%s count=%s errors=%s rate=%.1f/s p50=%.3fms p99=%.3fms max=%.3fms' % (
+                snapshot['name'], row['handler'], row['event'], row['count'], row['errors'], row['rate'],
+                row['p50'] * 1000, row['p99'] * 1000, row['max'] * 1000))
+        for row in snapshot['waits']:
+            self.log.info('[METRICS] %s queue_wait/%s count=%s p50=%.3fms p99=%.3fms max=%.3fms' % (
+                snapshot['name'], row['event'], row['count'], row['p50'] * 1000, row['p99'] * 1000,
+                row['max'] * 1000))
+
+
+class RedisHashSink(object):
+    """a hash METRICS:<runner name>, field <handler>:<event type> or queue_wait:<event type>, value json"""
+
+    def __init__(self, redis=None, prefix='METRICS'):
+        if redis is None:
+            from utils.redis import system_redis as redis
+        self.redis = redis
+        self.prefix = prefix
+
+    def write(self, snapshot):
+        mapping = {}
+        for row in snapshot['handlers']:
+            mapping['%s:%s' % (row['handler'], row['event'])] = json.dumps(row)
+        for row in snapshot['waits']:
+            mapping['queue_wait:%s' % row['event']] = json.dumps(row)
+        if mapping:
+            self.redis.hmset('%s:%s' % (self.prefix, snapshot['name']), mapping)
+
+
+class PrometheusFileSink(object):
+    """prometheus text exposition file, for the node exporter textfile collector"""
+
+    def __init__(self, path, prefix='qsforex'):
+        self.path = path
+        self.prefix = prefix
+
+    def write(self, snapshot):
+        p = self.prefix
+        lines = ['# TYPE %s_handler_seconds summary' % p]
+        for row in snapshot['handlers']:
+            labels = 'runner="%s",handler="%s",event="%s"' % (snapshot['name'], row['handler'], row['event'])
+            for q, field in _QUANTILES:
+                lines.append('%s_handler_seconds{%s,quantile="%s"} %.9f' % (p, labels, q, row[field]))
+            lines.append('%s_handler_seconds_sum{%s} %.9f' % (p, labels, row['mean'] * row['count']))
+            lines.append('%s_handler_seconds_count{%s} %s' % (p, labels, row['count']))
+        lines.append('# TYPE %s_handler_errors_total counter' % p)
+        for row in snapshot['handlers']:
+            labels = 'runner="%s",handler="%s",event="%s"' % (snapshot['name'], row['handler'], row['event'])
+            lines.append('%s_handler_errors_total{%s} %s' % (p, labels, row['errors']))
+        lines.append('# TYPE %s_queue_wait_seconds summary' % p)
+        for row in snapshot['waits']:
+            labels = 'runner="%s",event="%s"' % (snapshot['name'], row['event'])
+            for q, field in _QUANTILES:
+                lines.append('%s_queue_wait_seconds{%s,quantile="%s"} %.9f' % (p, labels, q, row[field]))
+            lines.append('%s_queue_wait_seconds_count{%s} %s' % (p, labels, row['count']))
+
+        tmp = '%s.tmp' % self.path
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, self.path)
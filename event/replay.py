@@ -0,0 +1,103 @@
+import logging
+import time
+from queue import Queue
+
+from event.event import StartUpEvent, TickPriceEvent, HeartBeatEvent, MarketEvent, TradeCloseEvent
+from event.journal import JournalReader
+from event.runner import Runner
+from mt4.constants import get_mt4_symbol
+from utils.clock import VirtualClock, get_clock, set_clock
+from utils.dry_run import is_dry_run, set_dry_run
+
+logger = logging.getLogger(__name__)
+
+# events coming from outside the handler stack, the others are put again by the handlers while replaying
+SOURCE_TYPES = (StartUpEvent.type, TickPriceEvent.type, HeartBeatEvent.type, MarketEvent.type, TradeCloseEvent.type)
+
+
+class ReplayRunner(Runner):
+    """
+    Feeds recorded events to handlers on a virtual clock.
+
+    source is a journal directory, a JournalReader or any iterable of events in
+    time order. The virtual clock is set to each event's time before it's
+    handled, and everything the handlers put in response is drained before the
+    next recorded event, so a run is deterministic and goes as fast as the
+    handlers allow. speed paces the run against the wall clock instead, 1 is
+    real time, 60 a minute per second.
+
+    Build the handlers with runner.queue, or None, and with a paper account.
+    dry_run, on by default, switches utils.dry_run on for the run: telegram,
+    sms, the redis keys read by other processes and the trade database are
+    skipped, orders still go to the account. The clock and dry run are
+    restored when the run ends, even on an error.
+    """
+
+    def __init__(self, source, *args, queue=None, start=None, end=None, instruments=None, types=SOURCE_TYPES,
+                 speed=None, clock=None, dry_run=True, **kwargs):
+        kwargs.setdefault('metrics', False)
+        super(ReplayRunner, self).__init__(queue or Queue(), **kwargs)
+        if isinstance(source, str):
+            source = JournalReader(source)
+        self.source = source
+        self.start = start
+        self.end = end
+        self.instruments = set(get_mt4_symbol(i) for i in instruments) if instruments else None
+        self.types = set(types) if types else None
+        self.speed = speed
+        self.clock = clock or VirtualClock(start)
+        self.dry_run = dry_run
+        self.replayed = 0
+        self.register(*args)
+
+    def events(self):
+        if isinstance(self.source, JournalReader):
+            events = self.source.read(self.start, self.end)
+        else:
+            events = self.source
+        for event in events:
+            if self.types is not None and event.type not in self.types:
+                continue
+            if self.start and event.time < self.start:
+                continue
+            if self.end and event.time > self.end:
+                continue
+            if self.instruments is not None:
+                instrument = getattr(event, 'instrument', None)
+                if instrument and get_mt4_symbol(instrument) not in self.instruments:
+                    continue
+            yield event
+
+    def run(self):
+        logger.info('%s statup.' % self.__class__.__name__)
+        logger.info('Registered handler: %s' % ', '.join([x.__class__.__name__ for x in self.handlers]))
+
+        previous_clock = get_clock()
+        previous_dry_run = set_dry_run(self.dry_run or is_dry_run())
+        set_clock(self.clock)
+        started = time.time()
+        first = None
+        try:
+            for event in self.events():
+                if not self.running:
+                    break
+                if self.speed:
+                    first = first or event.time
+                    delay = (event.time - first).total_seconds() / self.speed - (time.time() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                self.clock.set(event.time)
+                self.handle_event(event)
+                self.drain()
+                self.replayed += 1
+        finally:
+            set_clock(previous_clock)
+            set_dry_run(previous_dry_run)
+
+        elapsed = time.time() - started
+        logger.info('[REPLAY] %s events in %0.1fs, %0.0f events/s' % (
+            self.replayed, elapsed, self.replayed / elapsed if elapsed else 0))
+        return self.replayed
+
+    def stop(self):
+        self.running = False
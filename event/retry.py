@@ -0,0 +1,139 @@
+import heapq
+import itertools
+import logging
+import threading
+
+from event.codec import get_codec, reference_codec
+from utils import clock
+
+logger = logging.getLogger(__name__)
+
+
+class DelayQueue(object):
+    """In process items held until a due time, a heap ordered by due timestamp."""
+    codec = reference_codec
+
+    def __init__(self):
+        self.heap = []
+        self.lock = threading.Lock()
+        self.counter = itertools.count()  # keeps the heap stable for equal due times
+
+    def qsize(self):
+        return len(self.heap)
+
+    def put(self, item, due):
+        with self.lock:
+            heapq.heappush(self.heap, (due, next(self.counter), item))
+
+    def next_due(self):
+        heap = self.heap
+        return heap[0][0] if heap else None
+
+    def get_due(self, now=None):
+        """remove and return [(due, item)] of the items due at now"""
+        now = clock.timestamp() if now is None else now
+        items = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                due, _, item = heapq.heappop(self.heap)
+                items.append((due, item))
+        return items
+
+
+class RetryScheduler(object):
+    """
+    Delays events a handler asked to retry, with exponential backoff.
+
+    The n-th retry of an event is due base_delay * 2 ** n seconds after it
+    failed, capped at max_delay. An event is given up after max_tries or once
+    its deadline, Event.retry_deadline or the scheduler default, passed since
+    it first failed. That time is stamped on the copies held as Event.failed,
+    event.time is the broker's or a historic time and can be old already.
+    Backed by an in process DelayQueue, or a utils.redis.RedisDelayQueue for
+    runners in several processes.
+    """
+    base_delay = 0.5  # seconds
+    max_delay = 30
+    max_tries = 10
+    deadline = 300  # seconds after the first failure
+
+    def __init__(self, delay_queue=None, base_delay=None, max_delay=None, max_tries=None, deadline=None):
+        self.delay_queue = delay_queue or DelayQueue()
+        self.codec = get_codec(self.delay_queue)
+        if base_delay is not None:
+            self.base_delay = base_delay
+        if max_delay is not None:
+            self.max_delay = max_delay
+        if max_tries is not None:
+            self.max_tries = max_tries
+        if deadline is not None:
+            self.deadline = deadline
+
+        self.scheduled = 0
+        self.retried = 0
+        self.aborted = 0
+        self.expired = 0
+        self.delay_total = 0.0  # seconds from failure to re-entry, summed over released events
+        self.lateness_max = 0.0  # worst release after due time
+
+    def __len__(self):
+        return self.delay_queue.qsize()
+
+    def next_due(self):
+        """timestamp the first held event is due, None if there's none"""
+        return self.delay_queue.next_due()
+
+    def backoff(self, tried):
+        return min(self.max_delay, self.base_delay * 2 ** tried)
+
+    def is_expired(self, event):
+        failed = getattr(event, 'failed', None)
+        if failed is None:
+            return False
+        deadline = getattr(event, 'retry_deadline', None) or self.deadline
+        return (clock.utcnow() - failed).total_seconds() > deadline
+
+    def schedule(self, event, now=None):
+        """hold a copy of event with tried + 1 until due, False if given up"""
+        if event.tried >= self.max_tries:
+            self.aborted += 1
+            logger.error('[EVENT_RETRY] tried %s times, abort event=%s' % (event.tried, event))
+            return False
+        if self.is_expired(event):
+            self.expired += 1
+            logger.error('[EVENT_RETRY] deadline passed, abort event=%s' % event)
+            return False
+
+        now = clock.timestamp() if now is None else now
+        due = now + self.backoff(event.tried)
+        failed = getattr(event, 'failed', None) or clock.utcnow()
+        self.delay_queue.put(self.codec.encode(event.replace(tried=event.tried + 1, failed=failed)), due)
+        self.scheduled += 1
+        return True
+
+    def due(self, now=None):
+        """events due at now, in due order"""
+        now = clock.timestamp() if now is None else now
+        events = []
+        for due, data in self.delay_queue.get_due(now):
+            try:
+                event = self.codec.decode(data)
+            except Exception as ex:
+                logger.error('[EVENT_RETRY] decode error=%s' % ex)
+                continue
+            if self.is_expired(event):
+                self.expired += 1
+                logger.error('[EVENT_RETRY] deadline passed, abort event=%s' % event)
+                continue
+            lateness = now - due
+            self.lateness_max = max(self.lateness_max, lateness)
+            self.delay_total += self.backoff(event.tried - 1) + lateness
+            self.retried += 1
+            events.append(event)
+        return events
+
+    def stats(self):
+        return {'scheduled': self.scheduled, 'retried': self.retried, 'aborted': self.aborted,
+                'expired': self.expired, 'pending': len(self),
+                'delay_avg': self.delay_total / self.retried if self.retried else 0.0,
+                'lateness_max': self.lateness_max}
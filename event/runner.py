@@ -2,16 +2,43 @@ import logging
 import sys
 import time
 import traceback
+from collections import deque
 
+from event.conflation import TickConflator
+from event.event import HeartBeatEvent
 from event.handler import BaseHandler, QueueBase
+from event.metrics import RunnerMetrics
+from event.retry import RetryScheduler
+from event.timer import TimerService, IntervalJob, CronJob
+from utils import clock
+from utils.background import default_pool
 
 logger = logging.getLogger(__name__)
 
 
 class Runner(QueueBase):
     handlers = []
+    dispatch = {}  # event type -> handlers subscribed to it, in registration order
+    wildcard = ()  # handlers subscribed to '*', used for types nobody subscribed explicitly
     running = True
     initialized = False
+    batch_size = 64  # events fetched per queue round trip when draining
+    retry = None  # event.retry.RetryScheduler holding events a handler asked to retry
+    pool = default_pool  # utils.background.BackgroundPool running handlers marked background
+    metrics = None  # event.metrics.RunnerMetrics, set to None or pass metrics=False to switch the timing off
+    journal = None  # event.journal.JournalWriter recording every dispatched event
+    timer_service = None  # event.timer.TimerService firing the handlers' timers
+
+    def __init__(self, queue, codec=None, retry=None, metrics=None, journal=None, timer_service=None):
+        super(Runner, self).__init__(queue, codec)
+        self.handlers = []
+        self.dispatch = {}
+        self.wildcard = ()
+        self.retry = RetryScheduler() if retry is None else retry
+        self.metrics = RunnerMetrics(name=self.__class__.__name__) if metrics is None else metrics
+        self.journal = journal
+        self.timer_service = TimerService() if timer_service is None else timer_service
+        self.background_errors = deque()  # failures off the runner thread, for handle_error on the runner thread
 
     def run(self):
         raise NotImplementedError
@@ -21,35 +48,142 @@ class Runner(QueueBase):
             if isinstance(handler, BaseHandler):
                 handler.set_queue(self.queue)
                 self.handlers.append(handler)
+                self.add_timers(handler)
+        self.build_dispatch()
+
+    def unregister(self, *args):
+        for handler in args:
+            if handler in self.handlers:
+                self.handlers.remove(handler)
+                self.remove_timers(handler)
+        self.build_dispatch()
+
+    def add_timers(self, handler):
+        """schedule the handler's timers, handlers declaring the same name share the job"""
+        for name, schedule in handler.timers.items():
+            if name in self.timer_service.jobs:
+                continue
+            if isinstance(schedule, str):
+                self.timer_service.add(CronJob(name, schedule))
+            else:
+                self.timer_service.add(IntervalJob(name, schedule))
+
+    def remove_timers(self, handler):
+        names = set(name for h in self.handlers for name in h.timers)
+        for name in handler.timers:
+            if name not in names:
+                self.timer_service.remove(name)
+
+    def build_dispatch(self):
+        """index handlers by event type, call again if a handler changes its subscription after register"""
+        types = set()
+        for handler in self.handlers:
+            types.update(handler.subscription)
+        types.discard('*')
+
+        self.wildcard = tuple(h for h in self.handlers if '*' in h.subscription)
+        self.dispatch = dict(
+            (event_type, tuple(h for h in self.handlers if '*' in h.subscription or event_type in h.subscription))
+            for event_type in types)
+
+    def drain(self):
+        """handle queued events in batches until the queue is empty, return the count handled"""
+        self.release_retries()
+        self.release_timers()
+        self.release_errors()
+        count = 0
+        while self.running:
+            events = self.get_many(self.batch_size)
+            if not events:
+                break
+            for event in events:
+                self.handle_event(event)
+            count += len(events)
+        if self.metrics:
+            self.metrics.report()
+        return count
+
+    def queue_depth(self):
+        """queued events per lane, a single 'default' lane for plain queues"""
+        if hasattr(self.queue, 'depth'):
+            return self.queue.depth()
+        return {'default': self.queue.qsize()}
 
     def handle_event(self, event):
-        """loop handlers to process event"""
+        """process event by the handlers subscribed to its type, handlers share it read only"""
+        event.freeze()
+        if self.journal is not None:
+            self.journal.append(event)
+        if self.metrics:
+            self.metrics.record_wait(event.type, (clock.utcnow() - event.time).total_seconds())
         re_put = False
-        for handler in self.handlers:
-            if '*' in handler.subscription:
-                result = self.process_event(handler, event)
-                re_put = result or re_put
-                continue
-            elif event.type in handler.subscription:
-                result = self.process_event(handler, event)
-                re_put = result or re_put
+        for handler in self.dispatch.get(event.type, self.wildcard):
+            result = self.process_event(handler, event)
+            re_put = result or re_put
         if re_put:
-            if event.tried > 10:
-                logger.error('[EVENT_RETRY] tried to many times abort, event=%s' % event)
-            else:
-                event.tried += 1
-                self.put(event)
+            self.retry.schedule(event)
+
+    def release_retries(self):
+        """put the retried events that are due back on the queue"""
+        events = self.retry.due()
+        if events:
+            self.put_many(events)
+        return len(events)
+
+    def release_timers(self):
+        """put the TimerEvents of the jobs due"""
+        events = self.timer_service.due() if self.timer_service.jobs else []
+        if events:
+            self.put_many(events)
+        return len(events)
+
+    def skip_timers(self):
+        """pass over the timers due without firing them, while the runner doesn't handle events"""
+        return self.timer_service.skip() if self.timer_service.jobs else 0
+
+    def next_due(self):
+        """timestamp the next retry or timer is due, None if there's none"""
+        dues = [due for due in (self.retry.next_due(), self.timer_service.next_release()) if due is not None]
+        return min(dues) if dues else None
+
+    def release_errors(self):
+        """handle_error the failures of handlers run off the runner thread, on the runner thread"""
+        count = 0
+        while self.background_errors:
+            self.handle_error(self.background_errors.popleft())
+            count += 1
+        return count
 
     def process_event(self, handler, event):
-        """process event by single handler"""
+        """process event by single handler, background handlers are queued on the pool and never retried"""
+        if handler.background:
+            self.pool.submit(self.run_handler, handler, event, True)
+            return None
+        return self.run_handler(handler, event)
+
+    def run_handler(self, handler, event, threaded=False):
+        """threaded: called off the runner thread, on the background pool or an executor"""
+        start = time.perf_counter()
+        failed = False
         try:
             return handler.process(event)
         except Exception as ex:
-            logger.error('[EVENT_PROCESS] %s, event=%s' % (ex, event.__dict__))
-            # print trace stack
-            extracted_list = traceback.extract_tb(ex.__traceback__)
-            for item in traceback.StackSummary.from_list(extracted_list).format()[:8]:
-                logger.error(item.strip())
+            failed = True
+            self.process_error(ex, event, threaded)
+        finally:
+            if self.metrics:
+                self.metrics.record(handler, event.type, time.perf_counter() - start, failed)
+
+    def process_error(self, ex, event, threaded=False):
+        logger.error('[EVENT_PROCESS] %s, event=%s' % (ex, event.as_dict()))
+        # print trace stack
+        extracted_list = traceback.extract_tb(ex.__traceback__)
+        for item in traceback.StackSummary.from_list(extracted_list).format()[:8]:
+            logger.error(item.strip())
+        if threaded:
+            # handle_error may reconnect the broker, leave it to the runner thread, see release_errors
+            self.background_errors.append(ex)
+        else:
             self.handle_error(ex)
 
     def handle_error(self, ex):
@@ -59,6 +193,8 @@ class Runner(QueueBase):
         print(self.handlers)
 
     def stop(self):
+        if self.journal is not None:
+            self.journal.close()
         del self.queue
         self.running = False
         sys.exit(0)
@@ -70,30 +206,37 @@ class HeartbeatRunner(Runner):
         self.heartbeat = heartbeat or 5  # seconds
         self.register(*args)
 
+    def handle_event(self, event):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('New %sEvent: %s' % (event.type, event.as_dict()))
+        super(HeartbeatRunner, self).handle_event(event)
+
     def run(self):
         logger.info('%s statup.' % self.__class__.__name__)
         logger.info('Registered handler: %s' % ', '.join([x.__class__.__name__ for x in self.handlers]))
         logger.info('\n')
 
-        while True:
-            try:
-                event = self.get(False)
-            except queue.Empty:
-                time.sleep(self.heartbeat)
-                self.put(HeartBeatEvent())
-            else:
+        counter = 0
+        next_heartbeat = time.time() + self.heartbeat
+        while self.running:
+            if not self.drain():
+                next_due = self.next_due()
+                timeout = min(next_heartbeat, next_due or next_heartbeat) - time.time()
+                event = self.get(True, timeout) if timeout > 0 else None
                 if event:
-                    if settings.DEBUG:
-                        logger.info("New %sEvent: %s", (event.type, event.__dict__))
-                    else:
-                        logger.debug("New %sEvent: %s", (event.type, event.__dict__))
-
                     self.handle_event(event)
+            if time.time() >= next_heartbeat:
+                next_heartbeat += self.heartbeat
+                counter += 1
+                self.put(HeartBeatEvent(counter))
 
 
 class StreamRunnerBase(Runner):
     broker = ''
     account = None
+    conflator = None  # event.conflation.TickConflator, set by enable_conflation
+    conflation_depth = 0  # flush conflated ticks once the queue is down to this many events
+    conflation_check = 10  # flushes between two reads of the queue depth, qsize is a round trip on a redis queue
 
     def __init__(self, queue, pairs, *args, **kwargs):
         super(StreamRunnerBase, self).__init__(queue)
@@ -102,6 +245,35 @@ class StreamRunnerBase(Runner):
         self.pairs = pairs
         self.prices = self._set_up_prices_dict()
 
+    def enable_conflation(self, depth=0, check=10):
+        """keep only the latest tick per instrument while consumers are behind"""
+        self.conflator = TickConflator()
+        self.conflation_depth = depth
+        self.conflation_check = check
+        self.conflation_ready = True  # the queue was down to conflation_depth at the last read
+        self.conflation_countdown = 0  # flushes left before the next read
+
+    def put_tick(self, tick):
+        if self.conflator is not None:
+            self.conflator.offer(tick)
+            self.flush_ticks()
+        else:
+            self.put(tick)
+
+    def flush_ticks(self):
+        """put the conflated ticks when the consumer is ready, return the count put"""
+        if self.conflator is None or not len(self.conflator):
+            return 0
+        if self.conflation_countdown <= 0:
+            self.conflation_ready = self.queue.qsize() <= self.conflation_depth
+            self.conflation_countdown = self.conflation_check
+        self.conflation_countdown -= 1
+        if not self.conflation_ready:
+            return 0
+        ticks = self.conflator.flush()
+        self.put_many(ticks)
+        return len(ticks)
+
     def _set_up_prices_dict(self):
         prices_dict = dict(
             (k, v) for k, v in [
@@ -1,9 +1,40 @@
+import asyncio
+import copy
+import queue
+import threading
+import time
 import unittest
 import json
+import os
+import pickle
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
 from broker.oanda.common.constants import OrderType
-from event.event import SignalEvent, SignalAction, Event
-from mt4.constants import OrderSide, PERIOD_M5, pip, calculate_price
+from event.conflation import TickConflator
+from event.async_runner import AsyncRunner
+from event.codec import binary_codec, json_codec, reference_codec, SCHEMAS, COMMON_FIELDS, RETRY_FIELDS
+from event.event import SignalEvent, SignalAction, Event, TickPriceEvent, TradeCloseEvent, DebugEvent, EVENT_TYPES, \
+    GenericEvent, FrozenEventError, TimeFrameEvent, TimerEvent, HeartBeatEvent
+from event.handler import QueueBase, BaseHandler, TimeFrameTicker
+from event.metrics import RunnerMetrics, Histogram, PrometheusFileSink
+from event.journal import JournalWriter, JournalReader
+from event.lanes import LaneQueue, Lane
+from event.retry import RetryScheduler
+from event.replay import ReplayRunner
+from event.runner import Runner, StreamRunnerBase, HeartbeatRunner
+from event.timer import TimerService, TimerWheel, CronJob, to_datetime
+from event.worker import WorkerRunner, start_workers, alerting, debug
+from mt4.constants import OrderSide, pip, calculate_price, PERIOD_M1, PERIOD_M5, PERIOD_M15, PERIOD_M30, \
+    PERIOD_H1, PERIOD_H4, PERIOD_D1, PERIOD_W1, PERIOD_MN1, get_instrument
 from strategy.hlhb_trend import HLHBTrendStrategy
+from utils.background import BackgroundPool, DROP
+from utils.clock import get_clock, wall_clock
+from utils.dry_run import side_effect, is_dry_run
+from utils.redis import RedisQueue, RedisStreamQueue
+from utils.tests import fake_redis, fakeredis
 
 
 class EventTest(unittest.TestCase):
@@ -31,13 +62,643 @@ class EventTest(unittest.TestCase):
         open2 = Event.from_dict(data2)
 
         self.assertEqual(open.type, open2.type)
-        for k in open.__dict__.keys():
-            self.assertEqual(open.__dict__[k], open2.__dict__[k])
+        self.assertIsInstance(open2, SignalEvent)
+        for k, v in open.as_dict().items():
+            self.assertEqual(v, getattr(open2, k))
 
         data = json.dumps(close.to_dict())
         data2 = json.loads(data)
         close2 = Event.from_dict(data2)
 
         self.assertEqual(close.type, close2.type)
-        for k in close.__dict__.keys():
-            self.assertEqual(close.__dict__[k], close2.__dict__[k])
+        for k, v in close.as_dict().items():
+            self.assertEqual(v, getattr(close2, k))
+
+    def test_binary_codec(self):
+        signal = SignalEvent(SignalAction.OPEN,
+                             HLHBTrendStrategy.name, HLHBTrendStrategy.version,
+                             HLHBTrendStrategy.magic_number,
+                             instrument='EURUSD',
+                             side=OrderSide.BUY,
+                             stop_loss=30,
+                             take_profit=Decimal('50.10'),
+                             percent=0.5)
+        tick = TickPriceEvent('FXCM', 'EURUSD', datetime(2019, 3, 4, 12, 30, 1, 123456),
+                              Decimal('1.13215'), Decimal('1.13230'))
+        close = TradeCloseEvent('FXCM', 123, 456, 'EUR/USD', OrderSide.SELL, 2, -12.5,
+                                datetime(2019, 3, 4, 13), 1.1322, pips=Decimal('-1.5'))
+
+        for event in (signal, tick, close):
+            data = binary_codec.encode(event)
+            self.assertIsInstance(data, bytes)
+            event2 = binary_codec.decode(data)
+            self.assertIs(event.__class__, event2.__class__)
+            for k, v in event.as_dict().items():
+                self.assertEqual(v, getattr(event2, k))
+
+        self.assertEqual(str(binary_codec.decode(binary_codec.encode(tick)).ask), '1.13230')
+
+        # json frames from debug tooling are still accepted
+        debug = binary_codec.decode(json_codec.encode(DebugEvent('account')))
+        self.assertEqual(debug.type, DebugEvent.type)
+        self.assertEqual(debug.action, 'account')
+
+    def test_tick_points(self):
+        tick = TickPriceEvent.from_points('FXCM', 'EURUSD', datetime(2019, 3, 4), 113215, 113230).freeze()
+        self.assertEqual((tick.bid, tick.ask), (Decimal('1.13215'), Decimal('1.13230')))
+        decoded = binary_codec.decode(binary_codec.encode(tick))
+        self.assertEqual((decoded.bid_points, decoded.ask, decoded.bid), (113215, Decimal('1.13230'), tick.bid))
+        self.assertRaises(AttributeError, getattr, tick, 'volume')
+
+        # frames written before bid_points and ask_points were appended to the schema
+        frame = binary_codec.encode(TickPriceEvent('FXCM', 'EURUSD', datetime(2019, 3, 4), Decimal('1.1'),
+                                                   Decimal('1.2')))
+        old = binary_codec.decode(frame[:-2])
+        self.assertEqual((old.ask, old.ask_points), (Decimal('1.2'), None))
+
+    def test_tick_instrument(self):
+        instrument = get_instrument('EURUSD')
+        tick = TickPriceEvent('OANDA', 'EUR_USD', datetime(2019, 3, 4), Decimal('1.1'), Decimal('1.2'))
+        self.assertIs(tick.instrument, instrument)
+        self.assertIs(binary_codec.decode(binary_codec.encode(tick)).instrument, instrument)
+        self.assertIs(json_codec.decode(json_codec.encode(tick)).instrument, instrument)
+
+    def test_event_registry(self):
+        for event_type, fields in SCHEMAS.items():
+            cls = EVENT_TYPES.get(event_type)
+            if not cls:
+                continue
+            self.assertEqual(set(cls._fields), set(COMMON_FIELDS + RETRY_FIELDS + fields), cls.__name__)
+            self.assertFalse(cls._dynamic, cls.__name__)
+
+        data = {'type': TickPriceEvent.type, 'broker': 'FXCM', 'instrument': 'EURUSD', 'bid': 1.1321, 'ask': 1.1322,
+                'tried': 0}
+        tick = Event.from_dict(data)
+        self.assertIsInstance(tick, TickPriceEvent)
+        self.assertEqual(data['type'], TickPriceEvent.type)  # not changed
+        self.assertEqual(data['bid'], 1.1321)
+        self.assertEqual(tick.bid, Decimal('1.1321'))
+        self.assertRaises(AttributeError, setattr, tick, 'extra', 1)
+
+        dt = datetime(2019, 3, 4, 10, 0, 30, 123456)
+        event = Event.from_dict(TickPriceEvent('FXCM', 'EURUSD', dt, Decimal('1.1'), Decimal('1.2')).to_dict())
+        self.assertEqual(event.time, dt)
+
+        unknown = Event.from_dict({'type': 'CUSTOM', 'value': 1})
+        self.assertIsInstance(unknown, GenericEvent)
+        self.assertEqual(unknown.type, 'CUSTOM')
+        self.assertEqual(unknown.value, 1)
+
+    def test_local_queue(self):
+        q = queue.Queue()
+        base = QueueBase(q)
+        self.assertIs(base.codec, reference_codec)
+        self.assertIs(QueueBase(RedisQueue('test')).codec, json_codec)
+        self.assertIs(QueueBase(RedisQueue('test', codec=binary_codec)).codec, binary_codec)
+
+        tick = TickPriceEvent('FXCM', 'EURUSD', datetime.utcnow(), Decimal('1.1321'), Decimal('1.1322'))
+        base.put(tick)
+        received = base.get()
+        self.assertIs(received, tick)
+        self.assertIsInstance(received, TickPriceEvent)
+        self.assertRaises(FrozenEventError, setattr, received, 'bid', Decimal('1'))
+
+        retry = received.replace(tried=received.tried + 1)
+        self.assertEqual(retry.tried, 1)
+        self.assertEqual(retry.bid, tick.bid)
+        retry.bid = Decimal('1')
+        self.assertEqual(binary_codec.decode(binary_codec.encode(received)).bid, tick.bid)
+
+    def test_frozen_pickle(self):
+        tick = TickPriceEvent.from_points('FXCM', 'EURUSD', datetime(2019, 3, 4), 113215, 113230).freeze()
+        debug = GenericEvent.__new__(GenericEvent)
+        debug.type = 'CUSTOM'
+        debug.note = 'x'
+        debug.freeze()
+        for event in (tick, debug):
+            for loaded in (pickle.loads(pickle.dumps(event)), copy.deepcopy(event), copy.copy(event)):
+                self.assertIsNot(loaded, event)
+                self.assertIs(type(loaded), type(event))
+                self.assertEqual(loaded.as_dict(), event.as_dict())
+                self.assertRaises(FrozenEventError, setattr, loaded, 'time', None)
+        self.assertEqual(pickle.loads(pickle.dumps(tick)).ask, Decimal('1.13230'))
+
+    def test_runner_dispatch(self):
+        class Recorder(BaseHandler):
+            def __init__(self, queue, name, subscription, log):
+                super(Recorder, self).__init__(queue)
+                self.name = name
+                self.subscription = subscription
+                self.log = log
+
+            def process(self, event):
+                self.log.append(self.name)
+
+        q = queue.Queue()
+        log = []
+        runner = Runner(q)
+        ticks = Recorder(q, 'ticks', [TickPriceEvent.type], log)
+        every = Recorder(q, 'every', ['*'], log)
+        debug = Recorder(q, 'debug', [DebugEvent.type, TickPriceEvent.type], log)
+        runner.register(ticks, every, debug)
+
+        runner.handle_event(TickPriceEvent('FXCM', 'EURUSD', datetime.utcnow(), Decimal('1.1'), Decimal('1.2')))
+        runner.handle_event(DebugEvent('account'))
+        runner.handle_event(SignalEvent(SignalAction.OPEN, 'test', '1', '1', 'EURUSD', OrderSide.BUY))
+        self.assertEqual(log, ['ticks', 'every', 'debug', 'every', 'debug', 'every'])
+
+        del log[:]
+        runner.unregister(every)
+        runner.handle_event(SignalEvent(SignalAction.OPEN, 'test', '1', '1', 'EURUSD', OrderSide.BUY))
+        runner.handle_event(DebugEvent('account'))
+        self.assertEqual(log, ['debug'])
+
+    def test_async_runner(self):
+        class SlowAsync(BaseHandler):
+            subscription = [DebugEvent.type]
+
+            async def process(self, event):
+                await asyncio.sleep(0.01)
+                log.append('slow %s' % event.action)
+
+        class Sync(BaseHandler):
+            subscription = [DebugEvent.type, TickPriceEvent.type]
+
+            def process(self, event):
+                log.append('sync %s' % event.type)
+                return event.type == DebugEvent.type and event.tried == 0
+
+        q = queue.Queue()
+        log = []
+        runner = AsyncRunner(q, SlowAsync(q), Sync(q), retry=RetryScheduler(base_delay=0))
+        runner.put(DebugEvent('a'))
+        runner.put(TickPriceEvent('FXCM', 'EURUSD', datetime.utcnow(), Decimal('1.1'), Decimal('1.2')))
+
+        async def run():
+            runner.setup()
+            await runner.drain_async()
+            await runner.join()
+            await runner.drain_async()
+            await runner.join()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+        # the tick isn't held back by the slow handler, the debug event is retried once
+        self.assertEqual(log, ['sync DEBUG', 'sync TICK_PRICE', 'slow a', 'sync DEBUG', 'slow a'])
+
+        class Shared(BaseHandler):
+            subscription = [DebugEvent.type]
+
+            def process(self, event):
+                with lock:
+                    active.append(self)
+                    overlap.append(len(active))
+                time.sleep(0.02)
+                with lock:
+                    active.remove(self)
+
+        class Concurrent(BaseHandler):
+            subscription = [DebugEvent.type]
+            concurrent = True
+
+            def process(self, event):
+                barrier.wait()  # breaks unless both run at once
+
+        def run_events(runner):
+            async def run():
+                runner.setup()
+                await runner.drain_async()
+                await runner.join()
+                runner.executor.shutdown()
+                runner.serial_executor.shutdown()
+
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(run())
+            loop.close()
+
+        # sync handlers share broker clients, they run one at a time unless they opt in
+        lock = threading.Lock()
+        active, overlap = [], []
+        runner = AsyncRunner(q, Shared(q), Shared(q))
+        runner.put_many([DebugEvent('a'), DebugEvent('b')])
+        run_events(runner)
+        self.assertEqual(overlap, [1, 1, 1, 1])
+
+        barrier = threading.Barrier(2, timeout=2)
+        runner = AsyncRunner(q, Concurrent(q), Concurrent(q))
+        runner.put(DebugEvent('a'))
+        run_events(runner)
+        self.assertFalse(barrier.broken)
+
+    def test_batch_queue(self):
+        base = QueueBase(queue.Queue())
+        events = [DebugEvent(str(i)) for i in range(5)]
+        base.put_many(events)
+        self.assertEqual([e.action for e in base.get_many(3)], ['0', '1', '2'])
+        self.assertEqual([e.action for e in base.get_many(3)], ['3', '4'])
+        self.assertEqual(base.get_many(3), [])
+
+    def test_lane_queue(self):
+        lanes = LaneQueue.local()
+        self.assertFalse(lanes.is_redis)
+        self.assertEqual(lanes.redis.__func__, LaneQueue.redis.__func__)  # the factory isn't shadowed by the flag
+        base = QueueBase(lanes)
+        tick = TickPriceEvent('FXCM', 'EURUSD', datetime.utcnow(), Decimal('1.1'), Decimal('1.2'))
+        signal = SignalEvent(SignalAction.OPEN, 'HLHB Trend', '0.1', '20190304', 'EURUSD', OrderSide.BUY)
+        base.put_many([tick, tick])
+        base.put(signal)
+        base.put(DebugEvent('debug'))
+        self.assertEqual(lanes.depth()[Lane.MARKET_DATA], 2)
+        self.assertEqual(lanes.depth()[Lane.EXECUTION], 1)
+        self.assertEqual([e.type for e in base.get_many(3)], [DebugEvent.type, SignalEvent.type, tick.type])
+        self.assertEqual(base.get().type, tick.type)
+        self.assertIsNone(base.get())
+        self.assertEqual(lanes.get_count[Lane.MARKET_DATA], 2)
+
+        # a blocking get wakes up on put instead of polling
+        self.assertIsNone(base.get(True, 0.05))
+        threading.Timer(0.05, base.put, args=(signal,)).start()
+        start = time.time()
+        self.assertEqual(base.get(True, 5).type, SignalEvent.type)
+        self.assertLess(time.time() - start, 1)
+
+    def test_heartbeat_runner_log(self):
+        runner = HeartbeatRunner(queue.Queue())
+        with self.assertLogs('event.runner', 'DEBUG') as logs:
+            runner.handle_event(DebugEvent('ping'))
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('New DEBUGEvent', logs.output[0])
+        self.assertIn('ping', logs.output[0])
+
+    def test_tick_conflation(self):
+        conflator = TickConflator()
+        now = datetime.utcnow()
+        conflator.offer(TickPriceEvent('FXCM', 'EURUSD', now, Decimal('1.1'), Decimal('1.2')))
+        conflator.offer(TickPriceEvent('FXCM', 'GBPUSD', now, Decimal('1.3'), Decimal('1.4')))
+        conflator.offer(TickPriceEvent('FXCM', 'EURUSD', now, Decimal('1.11'), Decimal('1.21')))
+        conflator.offer(TickPriceEvent('FXCM', 'EURUSD', datetime(2019, 1, 1), Decimal('1'), Decimal('1')))
+        ticks = conflator.flush()
+        self.assertEqual([(t.instrument, t.bid) for t in ticks],
+                         [('EURUSD', Decimal('1.11')), ('GBPUSD', Decimal('1.3'))])
+        self.assertEqual(conflator.stats(), {'offered': 4, 'emitted': 2, 'merged': 1, 'dropped': 1, 'pending': 0})
+        self.assertEqual(conflator.flush(), [])
+
+        class Counted(queue.Queue):
+            reads = 0
+
+            def qsize(self):
+                self.reads += 1
+                return super(Counted, self).qsize()
+
+        runner = StreamRunnerBase(Counted(), ['EUR/USD'])
+        runner.enable_conflation(depth=1, check=5)
+        for i in range(10):
+            runner.put_tick(TickPriceEvent('FXCM', 'EURUSD', now, Decimal(i), Decimal(i)))
+        # depth read on the 1st and 6th tick only: 5 put on the first read, then held and merged until the next one
+        self.assertEqual(runner.queue.reads, 2)
+        self.assertEqual(runner.conflator.stats()['merged'], 4)
+        runner.drain()
+        self.assertEqual(runner.flush_ticks(), 1)
+        self.assertEqual(runner.queue.reads, 3)
+
+    def test_retry_scheduler(self):
+        retry = RetryScheduler(base_delay=1, max_tries=2)
+        event = DebugEvent('retry')
+        self.assertTrue(retry.schedule(event, now=100))
+        self.assertEqual(retry.due(now=100.5), [])
+        retried = retry.due(now=101)
+        self.assertEqual([(e.action, e.tried) for e in retried], [('retry', 1)])
+        self.assertTrue(retry.schedule(retried[0], now=101))
+        self.assertEqual(retry.due(now=102.5), [])
+        retried = retry.due(now=103)
+        self.assertEqual(retried[0].tried, 2)
+        self.assertFalse(retry.schedule(retried[0], now=103))
+        self.assertEqual(retry.stats()['aborted'], 1)
+        self.assertEqual(retry.stats()['retried'], 2)
+
+        # the deadline runs from the first failure, not from an old broker or historic time
+        late = DebugEvent('late')
+        late.time = datetime(2019, 1, 1)
+        retry = RetryScheduler(base_delay=1, deadline=60)
+        self.assertTrue(retry.schedule(late, now=100))
+        held = retry.due(now=101)[0]
+        self.assertEqual(held.time, late.time)
+        self.assertTrue((datetime.utcnow() - held.failed).total_seconds() < 5)
+        for codec in (binary_codec, json_codec):
+            self.assertEqual(codec.decode(codec.encode(held)).failed, held.failed)
+
+        self.assertFalse(retry.schedule(held.replace(failed=held.failed - timedelta(seconds=61)), now=101))
+        self.assertEqual(retry.stats()['expired'], 1)
+
+    def test_timer_service(self):
+        timers = TimerService()
+        timers.every('fast', 5, start=1000)
+        timers.cron('quarter', '*/15 * * * *')
+        self.assertEqual(timers.due(now=999), [])
+        self.assertEqual(timers.next_due(), 1000)
+        self.assertEqual([(e.name, e.missed) for e in timers.due(now=1000.05)], [('fast', 0)])
+        self.assertEqual(timers.due(now=1004.9), [])
+        # a slow loop fires once, the skipped slots are counted and the schedule doesn't shift
+        events = timers.due(now=1017)
+        self.assertEqual([(e.name, e.scheduled, e.missed) for e in events], [('fast', to_datetime(1005), 2)])
+        self.assertEqual(timers.next_due(), 1020)
+        self.assertEqual(to_datetime(timers.jobs['quarter'].scheduled), datetime(1970, 1, 1, 0, 30))
+
+        # an hour jump goes through the wheel rebuild
+        events = timers.due(now=1800)
+        self.assertEqual(sorted(e.name for e in events), ['fast', 'quarter'])
+        self.assertEqual(timers.stats()['missed'], 2 + 156)
+        # a paused runner passes slots over without firing or counting them as missed
+        self.assertEqual(timers.skip(now=1900), 1)
+        self.assertEqual(timers.due(now=1900.05), [])
+        self.assertEqual((timers.stats()['missed'], timers.stats()['skipped']), (2 + 156, 1))
+
+        # the same job added again is rescheduled once, not dropped or doubled
+        job = timers.jobs['fast']
+        timers.add(job)
+        self.assertFalse(job.cancelled)
+        self.assertEqual([e.name for e in timers.due(now=1920)], ['fast'])
+        self.assertEqual([e.name for e in timers.due(now=1930)], ['fast'])
+
+        cron = CronJob('weekdays', '30 21 * * 1-5')
+        self.assertEqual(cron.next_time(datetime(2019, 3, 8, 21, 30)), datetime(2019, 3, 11, 21, 30))
+        self.assertEqual(CronJob('month', '0 0 1 */3 *').next_time(datetime(2019, 2, 3)), datetime(2019, 4, 1))
+        self.assertRaises(ValueError, CronJob, 'bad', '0 24 * * *')
+
+        wheel = TimerWheel(now=0)
+        dues = [0.35, 7, 7, 400.2, 30000, 10 ** 8]
+        for i, due in enumerate(dues):
+            wheel.add(due, i)
+        self.assertEqual(wheel.next_due(), 0.35)
+        self.assertAlmostEqual(wheel.next_release(), 0.4)  # released on the tick after its due
+        self.assertEqual(wheel.advance(0.3), [])
+        fired = []
+        for now in range(1, 40000, 3):
+            fired.extend((due, now) for due, i in wheel.advance(now))
+        self.assertEqual([due for due, _ in fired], dues[:5])
+        self.assertTrue(all(due <= now < due + 3 for due, now in fired))
+        self.assertEqual(wheel.next_due(), 10 ** 8)
+
+    def test_background_handler(self):
+        class Notify(BaseHandler):
+            subscription = [DebugEvent.type]
+            background = True
+
+            def process(self, event):
+                release.wait(1)
+                sent.append(event.action)
+                return True
+
+        release = threading.Event()
+        sent = []
+        q = queue.Queue()
+        runner = Runner(q)
+        runner.pool = BackgroundPool(workers=1, maxsize=1, policy=DROP)
+        runner.register(Notify(q))
+        runner.handle_event(DebugEvent('a'))
+        while runner.pool.queue.qsize():
+            time.sleep(0.01)
+        runner.handle_event(DebugEvent('b'))
+        runner.handle_event(DebugEvent('c'))
+        # the handler is busy with a, b waits in the queue, c is dropped, nothing is retried
+        self.assertEqual(sent, [])
+        self.assertEqual(len(runner.retry), 0)
+        release.set()
+        for _ in range(100):
+            if runner.pool.stats()['completed'] == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(sent, ['a', 'b'])
+        self.assertEqual(runner.pool.stats()['dropped'], 1)
+
+        class Failing(BaseHandler):
+            subscription = [DebugEvent.type]
+            background = True
+
+            def process(self, event):
+                raise ValueError(event.action)
+
+        # handle_error of a background failure runs on the runner thread, on its next drain
+        errors = []
+        runner = Runner(q)
+        runner.handle_error = lambda ex: errors.append((str(ex), threading.current_thread()))
+        runner.register(Failing(q))
+        runner.handle_event(DebugEvent('d'))
+        for _ in range(100):
+            if runner.pool.stats()['failed'] or runner.background_errors:
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+        self.assertEqual(errors, [])
+        runner.drain()
+        self.assertEqual(errors, [('d', threading.current_thread())])
+
+    def test_runner_metrics(self):
+        class Failing(BaseHandler):
+            subscription = [DebugEvent.type]
+
+            def process(self, event):
+                if event.action == 'fail':
+                    raise Exception('fail')
+
+        histogram = Histogram()
+        for ms in range(1, 101):
+            histogram.add(ms / 1000.0)
+        self.assertAlmostEqual(histogram.percentile(0.5), 0.05, delta=0.05 * 0.2)
+        self.assertEqual(histogram.percentile(1), 0.1)
+
+        path = os.path.join(tempfile.mkdtemp(), 'qsforex.prom')
+        metrics = RunnerMetrics(sinks=[PrometheusFileSink(path)], interval=0, name='test')
+        q = queue.Queue()
+        runner = Runner(q, metrics=metrics)
+        handler = Failing(q)
+        runner.register(handler)
+        runner.handle_event(DebugEvent('ok'))
+        runner.handle_event(DebugEvent('fail'))
+        self.assertTrue(metrics.report())
+
+        row = metrics.snapshot()['handlers'][0]
+        self.assertEqual((row['handler'], row['event'], row['count'], row['errors']), ('Failing', 'DEBUG', 2, 1))
+        self.assertEqual(metrics.snapshot()['waits'][0]['count'], 2)
+        with open(path) as f:
+            text = f.read()
+        self.assertIn('qsforex_handler_errors_total{runner="test",handler="Failing",event="DEBUG"} 1', text)
+
+        # executor and background threads record at once, no count is lost
+        metrics = RunnerMetrics(sinks=[])
+        handler = Failing(None)
+
+        def record():
+            for i in range(2000):
+                metrics.record(handler, 'DEBUG', 0.001, failed=not i % 2)
+                metrics.record_wait('DEBUG', 0.001)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        snapshot = metrics.snapshot()
+        self.assertEqual((snapshot['handlers'][0]['count'], snapshot['handlers'][0]['errors']), (8000, 4000))
+        self.assertEqual(snapshot['waits'][0]['count'], 8000)
+
+    def test_journal(self):
+        path = tempfile.mkdtemp()
+        journal = JournalWriter(path, segment_size=4096, index_every=10, commit_interval=0)
+        runner = Runner(queue.Queue(), journal=journal)
+        start = datetime(2019, 3, 4)
+        for i in range(200):
+            runner.handle_event(TickPriceEvent('FXCM', 'EURUSD', start + timedelta(seconds=i),
+                                               Decimal('1.13215'), Decimal('1.13230')))
+        runner.handle_event(DebugEvent('last'))
+        self.assertGreater(len(os.listdir(path)), 2)
+
+        # readable while the last segment is still open
+        events = list(JournalReader(path))
+        self.assertEqual(len(events), 201)
+        self.assertEqual(events[-1].action, 'last')
+        journal.close()
+
+        events = list(JournalReader(path).read(start + timedelta(seconds=150), start + timedelta(seconds=159)))
+        self.assertEqual([e.time.second for e in events], list(range(30, 40)))
+        self.assertEqual(events[0].bid, Decimal('1.13215'))
+
+    @mock.patch('event.handler.get_last_tick', return_value=None)
+    def test_timeframe_ticker(self, get_last_tick):
+        q = queue.Queue()
+        ticker = TimeFrameTicker(q, use_event_time=True)
+
+        def tick(time):
+            ticker.process(TickPriceEvent('FXCM', 'EURUSD', time, Decimal('1.1'), Decimal('1.2')))
+            events = []
+            while not q.empty():
+                events.append(q.get_nowait())
+            return [(e.timeframe, e.current_time) for e in events]
+
+        self.assertEqual(tick(datetime(2019, 5, 31, 23, 58, 30)), [])
+        self.assertEqual(tick(datetime(2019, 5, 31, 23, 58, 59)), [])
+        self.assertEqual(tick(datetime(2019, 5, 31, 23, 59, 1)), [(PERIOD_M1, datetime(2019, 5, 31, 23, 59))])
+        self.assertEqual(tick(datetime(2019, 5, 31, 23, 58, 50)), [])  # out of order
+        june = datetime(2019, 6, 1)
+        self.assertEqual(tick(datetime(2019, 6, 1, 0, 0, 2)),
+                         [(PERIOD_M1, june), (PERIOD_M5, june), (PERIOD_M15, june), (PERIOD_M30, june),
+                          (PERIOD_H1, june), (PERIOD_H4, june), (PERIOD_D1, june), (PERIOD_MN1, june)])
+        self.assertEqual(tick(datetime(2019, 6, 3, 0, 0)),
+                         [(PERIOD_M1, datetime(2019, 6, 3)), (PERIOD_M5, datetime(2019, 6, 3)),
+                          (PERIOD_M15, datetime(2019, 6, 3)), (PERIOD_M30, datetime(2019, 6, 3)),
+                          (PERIOD_H1, datetime(2019, 6, 3)), (PERIOD_H4, datetime(2019, 6, 3)),
+                          (PERIOD_D1, datetime(2019, 6, 3)), (PERIOD_W1, datetime(2019, 6, 3))])
+
+    def test_replay(self):
+        class Recorder(BaseHandler):
+            subscription = [TimeFrameEvent.type, TickPriceEvent.type]
+
+            def process(self, event):
+                if event.type == TimeFrameEvent.type and event.timeframe == PERIOD_M5:
+                    log.append(event.current_time)
+                elif event.type == TickPriceEvent.type:
+                    log.append(event.instrument)
+
+        start = datetime(2019, 3, 4, 10, 0, 30)
+        ticks = []
+        for i in range(24):
+            tick_time = start + timedelta(minutes=i)
+            ticks.append(TickPriceEvent('FXCM', 'EURUSD', tick_time, Decimal('1.1'), Decimal('1.2')))
+            ticks.append(TickPriceEvent('FXCM', 'USDJPY', tick_time, Decimal('111'), Decimal('112')))
+        log = []
+        runner = ReplayRunner(ticks, instruments=['EUR/USD'], start=datetime(2019, 3, 4, 10, 4))
+        runner.register(TimeFrameTicker(None), Recorder(None))
+        self.assertEqual(runner.run(), 20)
+        self.assertNotIn('USDJPY', log)
+        self.assertEqual([x for x in log if isinstance(x, datetime)],
+                         [datetime(2019, 3, 4, 10, 5), datetime(2019, 3, 4, 10, 10),
+                          datetime(2019, 3, 4, 10, 15), datetime(2019, 3, 4, 10, 20)])
+        self.assertIs(get_clock(), wall_clock)
+
+        class Periodic(BaseHandler):
+            subscription = [TimerEvent.type]
+            timers = {'minute': 60, 'quarter': '*/15 * * * *'}
+
+            def process(self, event):
+                log.append((event.name, event.scheduled))
+
+        log = []
+        runner = ReplayRunner(ticks, types=[TickPriceEvent.type])
+        runner.register(Periodic(None))
+        runner.run()
+        self.assertEqual(len([x for x in log if x[0] == 'minute']), 23)
+        self.assertEqual([x[1] for x in log if x[0] == 'quarter'],
+                         [datetime(2019, 3, 4, 10, 15)])
+
+        sent = []
+        notify = side_effect(lambda text: sent.append(text))
+
+        class Notifier(BaseHandler):
+            subscription = [TickPriceEvent.type]
+
+            def process(self, event):
+                log.append(is_dry_run())
+                notify(event.instrument)
+
+        log = []
+        ReplayRunner(ticks[:4], Notifier(None)).run()
+        self.assertEqual(log, [True] * 4)
+        self.assertEqual(sent, [])
+        self.assertFalse(is_dry_run())
+        ReplayRunner(ticks[:4], Notifier(None), dry_run=False).run()
+        self.assertEqual(sent, ['EURUSD', 'USDJPY'] * 2)
+
+        def broken():
+            yield ticks[0]
+            raise IOError('journal')
+
+        self.assertRaises(IOError, ReplayRunner(broken(), Notifier(None)).run)
+        self.assertIs(get_clock(), wall_clock)
+        self.assertFalse(is_dry_run())
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis not installed')
+class WorkerRunnerTest(unittest.TestCase):
+    def setUp(self):
+        patcher = fake_redis(fakeredis.FakeServer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_worker(self):
+        class Echo(BaseHandler):
+            subscription = [DebugEvent.type]
+
+            def __init__(self, queue):
+                super(Echo, self).__init__(queue)
+                self.handled = []
+
+            def process(self, event):
+                self.handled.append(event.action)
+                self.put(HeartBeatEvent(len(self.handled)))
+
+        producer = QueueBase(RedisStreamQueue('FXCM', 'stream', codec=binary_codec))
+        producer.put(DebugEvent('account'))
+        producer.put(DebugEvent('trade'))
+
+        echo = Echo(None)
+        worker = WorkerRunner(RedisStreamQueue('FXCM', 'echo', codec=binary_codec), echo)
+        self.assertEqual(worker.drain(), 4)  # the heartbeats it put come back on the stream
+        self.assertEqual(echo.handled, ['account', 'trade'])
+
+        # every group sees every event, the ones put before it first read included
+        other = QueueBase(RedisStreamQueue('FXCM', 'other', codec=binary_codec))
+        self.assertEqual([event.type for event in other.get_many(10)],
+                         [DebugEvent.type, DebugEvent.type, HeartBeatEvent.type, HeartBeatEvent.type])
+
+    def test_start_workers(self):
+        # factories pickle by reference for the spawn start method
+        self.assertIs(pickle.loads(pickle.dumps(alerting)), alerting)
+        self.assertIs(pickle.loads(pickle.dumps(debug)), debug)
+
+        with mock.patch('event.worker.multiprocessing.Process') as process:
+            start_workers('FXCM', {'alerting': alerting, 'debug': debug})
+        self.assertEqual(process.return_value.start.call_count, 2)
+        # the groups exist before any worker runs, a producer started next loses nothing
+        db = RedisStreamQueue('FXCM', 'stream')._RedisStreamQueue__db
+        self.assertEqual(sorted(group['name'] for group in db.xinfo_groups('stream:FXCM')), ['alerting', 'debug'])
@@ -0,0 +1,363 @@
+import itertools
+import logging
+import math
+import random
+from datetime import datetime, timedelta
+
+from event.event import TimerEvent
+from utils import clock
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+_MINUTE = timedelta(minutes=1)
+
+
+def to_datetime(timestamp):
+    return _EPOCH + timedelta(seconds=timestamp)
+
+
+def to_timestamp(dt):
+    return (dt - _EPOCH).total_seconds()
+
+
+class TimerWheel(object):
+    """
+    Hierarchical timing wheel of (due timestamp, item).
+
+    levels wheels of 2 ** bits slots, a slot of level n spans 2 ** (bits * n)
+    ticks of resolution seconds, so add and expiry are O(1) whatever the number
+    of timers. Items of a higher level are cascaded down as the lower wheel
+    turns over, items further than the top wheel wait in its last slot. An item
+    expires within one resolution after its due time.
+    """
+    resolution = 0.1  # seconds per tick
+    bits = 6
+    levels = 5  # 64 ** 5 ticks of 0.1s, three years
+    tolerance = 0.001  # of a tick, float error of timestamp / resolution must not push an exact due a tick later
+
+    def __init__(self, resolution=None, now=None):
+        if resolution:
+            self.resolution = resolution
+        self.slots = 1 << self.bits
+        self.mask = self.slots - 1
+        self.span = 1 << (self.bits * self.levels)
+        self.wheels = [[[] for _ in range(self.slots)] for _ in range(self.levels)]
+        self.current = None if now is None else self.tick_floor(now)
+        self.expired = []
+        self.counter = itertools.count()  # keeps items of equal due time in add order
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, due, item):
+        if self.current is None:
+            self.current = self.tick_floor(clock.timestamp())
+        self.place((due, next(self.counter), item))
+        self.count += 1
+
+    def tick_floor(self, timestamp):
+        return math.floor(timestamp / self.resolution + self.tolerance)
+
+    def place(self, entry):
+        tick = math.ceil(entry[0] / self.resolution - self.tolerance)
+        delta = tick - self.current
+        if delta <= 0:
+            self.expired.append(entry)
+            return
+        if delta >= self.span:
+            tick = self.current + self.span - 1
+            delta = self.span - 1
+        level = 0
+        while delta >= 1 << (self.bits * (level + 1)):
+            level += 1
+        self.wheels[level][(tick >> (self.bits * level)) & self.mask].append(entry)
+
+    def cascade(self, level):
+        """move the items of the level slot current just entered to the lower levels"""
+        slots = self.wheels[level]
+        index = (self.current >> (self.bits * level)) & self.mask
+        entries, slots[index] = slots[index], []
+        for entry in entries:
+            self.place(entry)
+        return index
+
+    def advance(self, now):
+        """[(due, item)] expired at now, in due order"""
+        target = self.tick_floor(now)
+        if self.current is None:
+            self.current = target
+        if target - self.current > self.slots:
+            # long sleep or a replay jump, placing everything again is cheaper than turning the wheels
+            entries = [entry for wheel in self.wheels for slot in wheel for entry in slot]
+            self.wheels = [[[] for _ in range(self.slots)] for _ in range(self.levels)]
+            self.current = target
+            for entry in entries:
+                self.place(entry)
+        while self.current < target:
+            self.current += 1
+            level = 1
+            while level < self.levels and not self.current & ((1 << (self.bits * level)) - 1):
+                self.cascade(level)
+                level += 1
+            index = self.current & self.mask
+            if self.wheels[0][index]:
+                self.expired.extend(self.wheels[0][index])
+                self.wheels[0][index] = []
+
+        if not self.expired:
+            return []
+        expired, self.expired = sorted(self.expired), []
+        self.count -= len(expired)
+        return [(due, item) for due, _, item in expired]
+
+    def next_release(self):
+        """timestamp advance releases the first item, its due rounded up to the tick, None if empty"""
+        due = self.next_due()
+        if due is None or self.expired:
+            return due
+        return math.ceil(due / self.resolution - self.tolerance) * self.resolution
+
+    def next_due(self):
+        """due timestamp of the first item, None if empty"""
+        if self.expired:
+            return min(self.expired)[0]
+        best = None
+        for level, wheel in enumerate(self.wheels):
+            index = (self.current >> (self.bits * level)) & self.mask
+            # slots in the order the wheel reaches them, the current one last for a full turn ahead
+            for offset in range(1, self.slots + 1):
+                slot = wheel[(index + offset) & self.mask]
+                if slot:
+                    due = min(slot)[0]
+                    if best is None or due < best:
+                        best = due
+                    break
+        return best
+
+
+class IntervalJob(object):
+    """every interval seconds from start, the slots stay on start + n * interval however late they fire"""
+
+    def __init__(self, name, interval, jitter=0, start=None):
+        if interval <= 0:
+            raise ValueError('interval must be positive, got %s' % interval)
+        self.name = name
+        self.interval = interval
+        self.jitter = jitter  # fire up to jitter seconds after the slot, spreads processes sharing a schedule
+        self.start = start
+        self.scheduled = None
+        self.entry = None
+        self.cancelled = False
+
+    def first(self, now):
+        return now + self.interval if self.start is None else self.start
+
+    def next_after(self, scheduled, now):
+        """next slot after now and the count of slots skipped to get there"""
+        missed = int((now - scheduled) // self.interval)
+        return scheduled + (missed + 1) * self.interval, missed
+
+    def __repr__(self):
+        return '<IntervalJob %s every %ss>' % (self.name, self.interval)
+
+
+class CronJob(object):
+    """
+    Crontab schedule on utc time: minute hour day month weekday.
+
+    Fields take *, a value, a range a-b, a step */n or a-b/n and comma lists,
+    weekday 0 or 7 is Sunday. As in cron a day matches either the day or the
+    weekday field when both are restricted.
+    """
+    bounds = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+    max_years = 5  # give up looking for a match, eg. 30 February
+
+    def __init__(self, name, expression, jitter=0):
+        self.name = name
+        self.expression = expression
+        self.jitter = jitter
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError('cron expression needs 5 fields, got %r' % expression)
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self.parse_field(field, low, high) for field, (low, high) in zip(fields, self.bounds)]
+        self.weekdays = set(day % 7 for day in weekdays)
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+        self.scheduled = None
+        self.entry = None
+        self.cancelled = False
+
+    @staticmethod
+    def parse_field(field, low, high):
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step = part.split('/')
+                step = int(step)
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = [int(x) for x in part.split('-')]
+            else:
+                start = end = int(part)
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError('cron field %r out of range %s-%s' % (field, low, high))
+            values.update(range(start, end + 1, step))
+        return values
+
+    def day_matches(self, dt):
+        day = dt.day in self.days
+        weekday = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return weekday
+        if self.any_weekday:
+            return day
+        return day or weekday
+
+    def next_time(self, dt):
+        """first matching minute after dt"""
+        dt = dt.replace(second=0, microsecond=0) + _MINUTE
+        limit = dt.year + self.max_years
+        while dt.year <= limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += _MINUTE
+            else:
+                return dt
+        raise ValueError('cron expression %r never matches' % self.expression)
+
+    def first(self, now):
+        return to_timestamp(self.next_time(to_datetime(now)))
+
+    def next_after(self, scheduled, now):
+        missed = 0
+        dt = self.next_time(to_datetime(scheduled))
+        while to_timestamp(dt) <= now:
+            missed += 1
+            dt = self.next_time(dt)
+        return to_timestamp(dt), missed
+
+    def __repr__(self):
+        return '<CronJob %s %r>' % (self.name, self.expression)
+
+
+class TimerService(object):
+    """
+    Interval and cron jobs firing as TimerEvents, on a TimerWheel.
+
+    Runners hold one and put what due() returns, see Runner.release_timers,
+    handlers declare their jobs in BaseHandler.timers and subscribe to
+    TimerEvent. A job fires once per slot on the clock of utils.clock, not on
+    loop counts, so a slow loop delays a run but never shifts the next ones.
+    Slots passed while the runner was busy or the clock jumped are not caught
+    up: the job fires once with the count in TimerEvent.missed. A paused
+    runner calls skip() instead, its slots pass without firing or counting.
+    Jobs are placed on the first call, so a replay starts them on its clock.
+    """
+
+    def __init__(self, resolution=None):
+        self.wheel = TimerWheel(resolution)
+        self.jobs = {}
+        self.entries = itertools.count()  # numbers the wheel entry of each schedule, the job keeps its latest
+        self.started = False
+        self.fired = 0
+        self.missed = 0
+        self.skipped = 0  # runs passed over by skip
+        self.lateness_max = 0.0  # worst fire after due time, jitter included
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def add(self, job):
+        """add or replace the job of the same name, the same job added again is rescheduled"""
+        self.remove(job.name)
+        job.cancelled = False
+        self.jobs[job.name] = job
+        if self.started:
+            self.schedule(job, job.first(clock.timestamp()))
+        return job
+
+    def every(self, name, seconds, jitter=0, start=None):
+        return self.add(IntervalJob(name, seconds, jitter, start))
+
+    def cron(self, name, expression, jitter=0):
+        return self.add(CronJob(name, expression, jitter))
+
+    def remove(self, name):
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            job.cancelled = True  # its entry is dropped when the wheel expires it
+        return job
+
+    def start(self, now):
+        self.started = True
+        self.wheel.advance(now)
+        for job in self.jobs.values():
+            self.schedule(job, job.first(now))
+
+    def schedule(self, job, scheduled):
+        job.scheduled = scheduled
+        job.entry = next(self.entries)
+        due = scheduled + random.uniform(0, job.jitter) if job.jitter else scheduled
+        self.wheel.add(due, (job, job.entry))
+
+    def expire(self, now):
+        """(due, job, scheduled, missed) of the jobs due at now, each rescheduled to its next slot"""
+        if not self.started:
+            self.start(now)
+        expired = []
+        for due, (job, entry) in self.wheel.advance(now):
+            if job.cancelled or job.entry != entry:
+                continue  # removed, or added again since and its entry replaced
+            scheduled = job.scheduled
+            next_scheduled, missed = job.next_after(scheduled, now)
+            self.schedule(job, next_scheduled)
+            expired.append((due, job, scheduled, missed))
+        return expired
+
+    def due(self, now=None):
+        """TimerEvents of the jobs due at now, in due order"""
+        now = clock.timestamp() if now is None else now
+        events = []
+        for due, job, scheduled, missed in self.expire(now):
+            if missed:
+                logger.warning('[TIMER] %s missed %s runs' % (job.name, missed))
+            self.fired += 1
+            self.missed += missed
+            self.lateness_max = max(self.lateness_max, now - due)
+            events.append(TimerEvent(job.name, to_datetime(scheduled), missed))
+        return events
+
+    def skip(self, now=None):
+        """move the jobs due at now to their next slot without firing, while the runner is paused"""
+        now = clock.timestamp() if now is None else now
+        skipped = len(self.expire(now))
+        self.skipped += skipped
+        return skipped
+
+    def next_due(self):
+        """timestamp the first job is due, None if there's none"""
+        if not self.started:
+            if not self.jobs:
+                return None
+            self.start(clock.timestamp())
+        return self.wheel.next_due()
+
+    def next_release(self):
+        """timestamp due() fires the first job, next_due rounded up to the wheel resolution"""
+        if self.next_due() is None:
+            return None
+        return self.wheel.next_release()
+
+    def stats(self):
+        return {'jobs': len(self.jobs), 'fired': self.fired, 'missed': self.missed, 'skipped': self.skipped,
+                'lateness_max': self.lateness_max}
@@ -1,14 +1,15 @@
 import json
 import logging
-from datetime import datetime
 from decimal import Decimal
 
 import settings
 from django_orm import Trade
-from event.event import TickPriceEvent, TradeOpenEvent, TradeCloseEvent, HeartBeatEvent, MarketEvent
+from event.event import TickPriceEvent, TradeOpenEvent, TradeCloseEvent, TimerEvent, MarketEvent
 from event.handler import BaseHandler
-from mt4.constants import profit_pip, OrderSide, get_mt4_symbol
+from mt4.constants import profit_pip, OrderSide, get_mt4_symbol, to_points, profit_points, points_to_pip
+from utils import clock
 from utils import telegram as tg
+from utils.dry_run import side_effect
 from utils.redis import system_redis, OPENING_TRADE_COUNT_KEY
 from utils.time import datetime_to_str, str_to_datetime
 
@@ -21,7 +22,8 @@ class TradeManageHandler(BaseHandler):
                     TradeOpenEvent.type,
                     TradeCloseEvent.type,
                     MarketEvent.type,
-                    HeartBeatEvent.type]
+                    TimerEvent.type]
+    timers = {'trade.refresh': settings.HEARTBEAT, 'trade.save': 30, 'trade.sync': 15 * 60}
     trades = {}
 
     def __init__(self, queue, account=None, *args, **kwargs):
@@ -35,8 +37,13 @@ class TradeManageHandler(BaseHandler):
             self.trade_open(event)
         elif event.type == TradeCloseEvent.type:
             self.trade_close(event)
-        elif event.type == HeartBeatEvent.type:
-            self.heartbeat(event)
+        elif event.type == TimerEvent.type:
+            if event.name == 'trade.refresh':
+                self.heartbeat(event)
+            elif event.name == 'trade.save':
+                self.save_to_db()
+            elif event.name == 'trade.sync':
+                self.sync(event)
         elif event.type == MarketEvent.type:
             self.load_trades()
 
@@ -54,8 +61,16 @@ class TradeManageHandler(BaseHandler):
                 self.process_trade(trade, event)
 
     def process_trade(self, trade, event):
-        price = event.bid if trade['side'] == OrderSide.BUY else event.ask
-        profit_pips = profit_pip(event.instrument, trade.get('open_price'), price, trade.get('side'))
+        if getattr(event, 'bid_points', None) is not None:
+            # integer math, Decimal pips are made once
+            price = event.bid_points if trade['side'] == OrderSide.BUY else event.ask_points
+            open_points = trade.get('open_points')
+            if open_points is None:
+                open_points = trade['open_points'] = to_points(event.instrument, trade.get('open_price'))
+            profit_pips = points_to_pip(profit_points(open_points, price, trade['side']))
+        else:
+            price = event.bid if trade['side'] == OrderSide.BUY else event.ask
+            profit_pips = profit_pip(event.instrument, trade.get('open_price'), price, trade.get('side'))
         trade['current'] = profit_pips
         if profit_pips > trade['max']:
             trade['max'] = profit_pips
@@ -64,7 +79,7 @@ class TradeManageHandler(BaseHandler):
 
         if profit_pips >= 0:
             if not trade['last_profitable_start']:
-                trade['last_profitable_start'] = datetime.utcnow()
+                trade['last_profitable_start'] = clock.utcnow()
         else:
             if trade['last_profitable_start']:
                 self.update_profitable_seconds(trade)
@@ -130,7 +145,7 @@ class TradeManageHandler(BaseHandler):
             logger.error(f'[TRADE_MANAGER] Managed trade missed before trade actual closed, trade_id={event.trade_id}')
 
         self.saved_to_redis()
-        tg.send_me(
+        tg.send_me_nowait(
             '[FOREX_TRADE_CLOSE_ANALYSIS]\n%s, profit_missed=%s, entry_accuracy=%s, exit_accuracy=%s, risk=%s' % (
                 event.trade_id,
                 trade['profit_missed'],
@@ -139,40 +154,36 @@ class TradeManageHandler(BaseHandler):
                 trade['risk']))
 
     def update_profitable_seconds(self, trade):
-        delta = datetime.utcnow() - trade['last_profitable_start']
+        delta = clock.utcnow() - trade['last_profitable_start']
         trade['profitable_seconds'] += delta.seconds
         trade['last_profitable_start'] = None
 
     def heartbeat(self, event):
-        heartbeat_counter = event.counter
         for id, trade in self.account.get_trades().items():
             if str(id) not in self.trades:
                 self._load_trade(id, trade)
 
         for trade_id, trade in self.trades.items():
-            total_time = datetime.utcnow() - trade['open_time']
+            total_time = clock.utcnow() - trade['open_time']
             last_profit_period = 0
             if trade['last_profitable_start']:
-                last_profit_period = (datetime.utcnow() - trade['last_profitable_start']).seconds
+                last_profit_period = (clock.utcnow() - trade['last_profitable_start']).seconds
 
             total_profit_seconds = trade['profitable_seconds'] + last_profit_period
             trade['profitable_time'] = round(total_profit_seconds / float(total_time.seconds), 3)
         self.saved_to_redis()
 
-        if not heartbeat_counter % (30 * int(1 / settings.LOOP_SLEEP)):  # 30 secs
-            self.save_to_db()
-
-        if not heartbeat_counter % (60 * 15 * int(1 / settings.LOOP_SLEEP)):  # 15 mins
-            self.sync_trades()
-            if settings.DEBUG:
-                print(self.trades)
-            else:
-                for trade_id, trade in self.trades.items():
-                    logger.info(
-                        '[Trade_Monitor] %s@%s: max=%s, min=%s, current=%s, last_profit=%s, profit_seconds=%s, profitable_time=%s, last_tick=%s' % (
-                            trade_id, trade['instrument'], trade['max'], trade['min'], trade['current'],
-                            trade['last_profitable_start'],
-                            trade['profitable_seconds'], trade['profitable_time'], trade['last_tick_time']))
+    def sync(self, event):
+        self.sync_trades()
+        if settings.DEBUG:
+            print(self.trades)
+        else:
+            for trade_id, trade in self.trades.items():
+                logger.info(
+                    '[Trade_Monitor] %s@%s: max=%s, min=%s, current=%s, last_profit=%s, profit_seconds=%s, profitable_time=%s, last_tick=%s' % (
+                        trade_id, trade['instrument'], trade['max'], trade['min'], trade['current'],
+                        trade['last_profitable_start'],
+                        trade['profitable_seconds'], trade['profitable_time'], trade['last_tick_time']))
 
     def sync_trades(self):
         for trade_id, trade in self.account.get_trades().items():
@@ -213,10 +224,10 @@ class TradeManageHandler(BaseHandler):
                     self.trades[k]['min'] = Decimal(str(redis_data[k]['min']))
                     self.trades[k]['profitable_seconds'] = redis_data[k]['profitable_seconds']
                     self.trades[k]['last_profitable_start'] = str_to_datetime(redis_data[k]['last_profitable_start'])
-                    total_time = datetime.utcnow() - self.trades[k]['open_time']
+                    total_time = clock.utcnow() - self.trades[k]['open_time']
                     last_profit_period = 0
                     if self.trades[k]['last_profitable_start']:
-                        last_profit_period = (datetime.utcnow() - self.trades[k]['last_profitable_start']).seconds
+                        last_profit_period = (clock.utcnow() - self.trades[k]['last_profitable_start']).seconds
                     total_profit_seconds = self.trades[k]['profitable_seconds'] + last_profit_period
                     self.trades[k]['profitable_time'] = round(total_profit_seconds / float(total_time.seconds), 3)
 
@@ -245,6 +256,7 @@ class TradeManageHandler(BaseHandler):
             'last_tick_time': None,
         }
 
+    @side_effect
     def save_to_db(self):
         for trade_id, trade_data in self.trades.items():
             trade = Trade.objects.filter(account_id=trade_data.get('account_id'),
@@ -271,6 +283,7 @@ class TradeManageHandler(BaseHandler):
 
             trade.save()
 
+    @side_effect
     def close_trade_to_db(self, event, trade_data):
         trade = Trade.objects.filter(account_id=event.account_id,
                                      trade_id=event.trade_id).first()
@@ -286,7 +299,7 @@ class TradeManageHandler(BaseHandler):
                           instrument=event.instrument,
                           open_time=event.open_time)
             trade.pips = Decimal(str(event.pips))
-            trade.close_time = trade_data.get('close_time') or datetime.utcnow()
+            trade.close_time = trade_data.get('close_time') or clock.utcnow()
             trade.close_price = Decimal(str(event.close_price))
             trade.profit = Decimal(str(event.profit))
             if trade_data.get('max'):
@@ -297,6 +310,7 @@ class TradeManageHandler(BaseHandler):
                 trade.open_price = Decimal(str(trade_data['open_price']))
         trade.save()
 
+    @side_effect
     def saved_to_redis(self):
         data = {}
         for trade_id, trade in self.trades.items():
@@ -0,0 +1,84 @@
+import logging
+import multiprocessing
+
+from event.handler import DebugHandler, PriceAlertHandler
+from event.runner import Runner
+from utils.redis import RedisStreamQueue
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerRunner(Runner):
+    """
+    Runs a group of handlers off its own consumer group of a RedisStreamQueue.
+
+    Events the handlers put go back on the shared stream, so every other group
+    (the broker stream process, strategies, trade management, alerting...)
+    sees them. Start more workers on the same group to share its load.
+    """
+
+    def __init__(self, queue, *args, **kwargs):
+        super(WorkerRunner, self).__init__(queue)
+        self.register(*args)
+
+    def run(self):
+        logger.info('%s statup, group=%s, consumer=%s.' % (
+            self.__class__.__name__, getattr(self.queue, 'group', None), getattr(self.queue, 'consumer', None)))
+        logger.info('Registered handler: %s' % ', '.join([x.__class__.__name__ for x in self.handlers]))
+
+        while self.running:
+            if not self.drain():
+                # wait on the stream instead of polling
+                event = self.get(True)
+                if event:
+                    self.handle_event(event)
+
+
+def run_worker(stream, group, factory, consumer=None, codec=None):
+    """process entry, factory(queue) returns the handlers of the group"""
+    queue = RedisStreamQueue(stream, group, consumer=consumer, codec=codec)
+    handlers = factory(queue)
+    WorkerRunner(queue, *handlers).run()
+
+
+def start_workers(stream, groups, codec=None):
+    """
+    Start one process per handler group.
+
+    groups: {group name: factory}, a factory is a module level function taking the
+    queue and returning the handlers, it runs inside the worker process so
+    connections (broker, redis, db) are opened there.
+
+    The groups are created before any worker starts, start the producers of
+    the stream after this returns so each group sees every event.
+    """
+    for group in groups:
+        RedisStreamQueue(stream, group, codec=codec).ensure_group()
+    processes = []
+    for group, factory in groups.items():
+        process = multiprocessing.Process(target=run_worker, name='worker-%s' % group,
+                                          args=(stream, group, factory), kwargs={'codec': codec})
+        process.start()
+        processes.append(process)
+        logger.info('[WORKER] started group=%s pid=%s' % (group, process.pid))
+    return processes
+
+
+def alerting(queue):
+    return [PriceAlertHandler(queue)]
+
+
+def debug(queue):
+    return [DebugHandler(queue, events=['*'])]
+
+
+if __name__ == '__main__':
+    # python -m event.worker
+    # the stream runner process publishes ticks on stream:FXCM through its own group, eg.
+    # queue = RedisStreamQueue('FXCM', 'stream', codec=binary_codec)
+    # runner = FXCMStreamRunner(queue, pairs=pairs, api=fxcm.fxcmpy, handlers=[timeframe_ticker, heartbeat_handler])
+    from event.codec import binary_codec
+
+    workers = start_workers('FXCM', {'alerting': alerting, 'debug': debug}, codec=binary_codec)
+    for worker in workers:
+        worker.join()
@@ -92,7 +92,7 @@ class FXCMExecutionHandler(BaseExecutionHandler):
 
         # check order exist
         if self.check_trade_exist(event.instrument, event.side):
-            logger.info('[ORDER_OPEN_SKIP] %s' % event.__dict__)
+            logger.info('[ORDER_OPEN_SKIP] %s' % event.as_dict())
             return
 
         spread_pips = self.get_spread(event.instrument)
@@ -134,7 +134,7 @@ class FXCMExecutionHandler(BaseExecutionHandler):
             logger.error('[TRADE_OPEN_FAILED] %s, event=%s' % (ex,event))
             return
 
-        event_dict = event.__dict__.copy()
+        event_dict = event.as_dict()
         event_dict.pop('time')
         logger.info('[TRADE_OPEN] event = %s' % event_dict)
 
@@ -149,15 +149,16 @@ class FXCMExecutionHandler(BaseExecutionHandler):
                            take_profit=trade.get_limitRate(),
                            magic_number=event.magic_number)
         self.put(e)
-        tg.send_me('[FOREX_TRADE_OPEN]\n%s@%s#%s %s@%s lots=%s' % (event.strategy, event.instrument,
-                                                                   event.trade_id, event.side, open_price, lots))
+        tg.send_me_nowait('[FOREX_TRADE_OPEN]\n%s@%s#%s %s@%s lots=%s' % (event.strategy, event.instrument,
+                                                                         event.trade_id, event.side, open_price,
+                                                                         lots))
 
     def close(self, event):
         closed_trade = self.account.close_symbol(event.instrument, event.side, event.percent)
         for trade in closed_trade:
             pass
             # todo pop OrderClosedEvent
-        logger.info('[ORDER_CLOSED] event = %s' % event.__dict__)
+        logger.info('[ORDER_CLOSED] event = %s' % event.as_dict())
 
     def update(self, event):
         if event.trade_id:
@@ -166,7 +167,7 @@ class FXCMExecutionHandler(BaseExecutionHandler):
             self.account.update_trade(event.trade_id, is_stop=True, rate=event.stop_loss, is_in_pips=True)
             self.account.update_trade(event.trade_id, is_stop=False, rate=event.take_profit, is_in_pips=True)
 
-        logger.info('[ORDER_UPDATE] event = %s' % event.__dict__)
+        logger.info('[ORDER_UPDATE] event = %s' % event.as_dict())
 
     def check_trade_exist(self, instrument, side):
         instrument = get_fxcm_symbol(instrument)
@@ -1,4 +1,6 @@
+from datetime import timedelta
 from decimal import Decimal
+from functools import lru_cache
 
 from dateutil.relativedelta import relativedelta, MO
 
@@ -175,16 +177,91 @@ PIP_DICT = {
 }
 
 
-def get_mt4_symbol(symbol):
+# Instrument registry, built once at import from PIP_DICT. Every instrument is
+# interned, one immutable object per symbol reachable from any of its aliases
+# in a single dict lookup, so the tick path doesn't re-normalize strings.
+# Instrument is a str of the MT4 name, it compares, hashes and serializes as
+# the plain symbol did.
+
+class Instrument(str):
+    """interned symbol with its broker names, pip and precision, see get_instrument"""
+
+    def __new__(cls, symbol, pip_unit):
+        self = str.__new__(cls, symbol)
+        base, quote = symbol[:-3], symbol[-3:]
+        pip_exponent = pip_unit.adjusted()
+        for name, value in (('mt4', symbol),
+                            ('fxcm', '%s/%s' % (base, quote)),
+                            ('oanda', '%s_%s' % (base, quote)),
+                            ('base', base),
+                            ('quote', quote),
+                            ('pip', pip_unit),
+                            ('pip_exponent', pip_exponent),  # -4 for EURUSD, pip is 10 ** pip_exponent
+                            ('precision', max(0, 1 - pip_exponent))):  # decimal places of a quote, one point
+            object.__setattr__(self, name, value)
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Instrument %s is immutable.' % self)
+
+    def __delattr__(self, name):
+        raise AttributeError('Instrument %s is immutable.' % self)
+
+    def __reduce__(self):
+        return get_instrument, (str(self),)
+
+    @property
+    def aliases(self):
+        return self.mt4, self.fxcm, self.oanda
+
+
+INSTRUMENTS = {}  # any alias -> Instrument, fixed once built, other spellings are cached by _lookup_alias
+
+
+def _normalize_symbol(symbol):
     symbol = str(symbol)
     return symbol.replace(' ', '').replace('_', '').replace('-', '').replace('/', '')
 
+
+@lru_cache(maxsize=1024)
+def _lookup_alias(symbol):
+    """Instrument of a spelling that isn't an alias, like eur-usd"""
+    return INSTRUMENTS.get(_normalize_symbol(symbol).upper())
+
+
+def register_instrument(instrument, *aliases):
+    """add an instrument, extra aliases are broker names not derived from the symbol"""
+    for alias in instrument.aliases + aliases:
+        INSTRUMENTS[alias] = instrument
+    _lookup_alias.cache_clear()
+    return instrument
+
+
+for _symbol, _pip_unit in PIP_DICT.items():
+    register_instrument(Instrument(_symbol, _pip_unit))
+
+
+def get_instrument(symbol):
+    """interned Instrument for any alias, None for a symbol not in PIP_DICT"""
+    instrument = INSTRUMENTS.get(symbol)
+    if instrument is None and isinstance(symbol, str):
+        instrument = _lookup_alias(symbol)
+    return instrument
+
+
+def get_mt4_symbol(symbol):
+    instrument = get_instrument(symbol)
+    if instrument is not None:
+        return instrument
+    return _normalize_symbol(symbol)
+
+
 def pip(symbol, price=None, _abs=False):
-    symbol = get_mt4_symbol(symbol)
-    if symbol not in PIP_DICT:
-        raise Exception('%s not in PIP_DICT.' % symbol)
+    instrument = get_instrument(symbol)
+    if instrument is None:
+        raise Exception('%s not in PIP_DICT.' % get_mt4_symbol(symbol))
 
-    pip_unit = PIP_DICT[symbol]
+    pip_unit = instrument.pip
     if price:
         price = Decimal(str(price))
         if _abs:
@@ -205,9 +282,60 @@ def profit_pip(symbol, open, close, side, abs=False):
     return pip(symbol, profit)
 
 
+# Integer prices for the tick hot path. A price is carried as a count of
+# points, a tenth of a pip, so a points distance is pip() of that distance
+# times ten and the math is plain int. Decimal is made only at the order and
+# accounting boundary with from_points and points_to_pip.
+POINTS_PER_PIP = 10
+_POINT_SCALE = {}  # symbol -> (points per unit of price, decimal places of a point)
+
+
+def point_scale(symbol):
+    """(points per unit of price, decimal places), (100000, 5) for EURUSD"""
+    scale = _POINT_SCALE.get(symbol)
+    if scale is None:
+        points = int(POINTS_PER_PIP / pip(symbol))
+        scale = _POINT_SCALE[symbol] = (points, len(str(points)) - 1)
+    return scale
+
+
+def to_points(symbol, price):
+    """price as integer points, float, int, str or Decimal"""
+    points = point_scale(symbol)[0]
+    if type(price) is float or type(price) is int:
+        return int(round(price * points))
+    return int((Decimal(str(price)) * points).to_integral_value())
+
+
+def from_points(symbol, points):
+    """integer points to the Decimal price, exact to the point"""
+    return Decimal(points).scaleb(-point_scale(symbol)[1])
+
+
+def points_to_pip(points):
+    """points distance to Decimal pips, the value pip(symbol, distance) gives"""
+    return Decimal(points).scaleb(-1)
+
+
+def profit_points(open, close, side):
+    """profit_pip in integer points, open and close in points"""
+    if side == OrderSide.BUY:
+        return close - open
+    return open - close
+
+
+def calculate_points(base_points, side, pip):
+    """calculate_price in integer points, pip may be fractional"""
+    offset = int(round(pip * POINTS_PER_PIP))
+    if side == OrderSide.BUY:
+        return base_points + offset
+    elif side == OrderSide.SELL:
+        return base_points - offset
+
+
 def calculate_price(base_price, side, pip, instrument):
     instrument = get_mt4_symbol(instrument)
-    pip_unit = pip(instrument)
+    pip_unit = PIP_DICT[instrument]  # the pip argument shadows pip()
     base_price = Decimal(str(base_price))
     pip = Decimal(str(pip))
 
@@ -237,3 +365,11 @@ def get_candle_time(time, timeframe):
         return t.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
     raise NotImplementedError
+
+
+def get_next_candle_time(time, timeframe):
+    """open time of the candle after the one time is in"""
+    candle_time = get_candle_time(time, timeframe)
+    if timeframe == PERIOD_MN1:
+        return candle_time + relativedelta(months=1)
+    return candle_time + timedelta(minutes=timeframe)
@@ -0,0 +1,42 @@
+import pickle
+import unittest
+from decimal import Decimal
+
+from mt4.constants import OrderSide, calculate_price, to_points, from_points, points_to_pip, profit_points, \
+    profit_pip, calculate_points, get_instrument, get_mt4_symbol, INSTRUMENTS, _lookup_alias
+
+
+class ConstantsTest(unittest.TestCase):
+    def test_points(self):
+        self.assertEqual(to_points('EURUSD', 1.13215), 113215)
+        self.assertEqual(to_points('USD/JPY', Decimal('111.123')), 111123)
+        self.assertEqual(to_points('XAUUSD', '1301.57'), 1301570)
+        self.assertEqual(from_points('EURUSD', 113215), Decimal('1.13215'))
+        self.assertEqual(points_to_pip(profit_points(113215, 113080, OrderSide.SELL)),
+                         profit_pip('EURUSD', Decimal('1.13215'), Decimal('1.13080'), OrderSide.SELL))
+        self.assertEqual(from_points('EURUSD', calculate_points(113215, OrderSide.BUY, 30)),
+                         calculate_price(Decimal('1.13215'), OrderSide.BUY, 30, 'EURUSD'))
+        self.assertEqual(calculate_points(111123, OrderSide.SELL, Decimal('2.5')), 111098)
+
+    def test_instrument(self):
+        instrument = get_instrument('EURUSD')
+        for alias in ('EUR/USD', 'EUR_USD', 'eur-usd', instrument):
+            self.assertIs(get_instrument(alias), instrument)
+        self.assertEqual((instrument.fxcm, instrument.oanda, instrument.base, instrument.quote),
+                         ('EUR/USD', 'EUR_USD', 'EUR', 'USD'))
+        self.assertEqual((instrument.pip, instrument.pip_exponent, instrument.precision), (Decimal('0.0001'), -4, 5))
+        self.assertEqual(get_instrument('USD_JPY').precision, 3)
+        self.assertIsNone(get_instrument('FOO/BAR'))
+        self.assertEqual(get_mt4_symbol('FOO/BAR'), 'FOOBAR')
+        self.assertRaises(AttributeError, setattr, instrument, 'pip', Decimal('1'))
+        self.assertIs(pickle.loads(pickle.dumps(instrument)), instrument)
+
+        # other spellings don't go into the registry, nor depend on an earlier lookup
+        _lookup_alias.cache_clear()
+        registered = dict(INSTRUMENTS)
+        self.assertIs(get_mt4_symbol('eur_usd'), instrument)
+        self.assertIs(get_instrument('Eur Usd'), instrument)
+        for i in range(2000):
+            get_instrument('FOO%s' % i)
+        self.assertEqual(INSTRUMENTS, registered)
+        self.assertLessEqual(_lookup_alias.cache_info().currsize, 1024)
@@ -0,0 +1,121 @@
+"""
+Background loading of the days a historic price handler streams next.
+"""
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def nbytes(data):
+    """bytes of the numpy arrays in a loaded day, a list of tuples"""
+    return sum(getattr(value, 'nbytes', 0) for entry in data for value in entry)
+
+
+class DayPrefetcher(object):
+    """
+    Loads days ahead of the one being streamed on a background thread.
+
+    load(day) returns the decoded data of a day, a list of tuples of numpy
+    arrays. Up to depth days are held ready, fewer once the ready days and the
+    one taken last hold max_bytes, one day ahead is always loaded. With
+    processes the load runs in a worker process, load must be picklable then.
+
+    get(day) hands the days over in order, the time it blocks is the I/O wait
+    of the run, stats() sums it up.
+    """
+
+    def __init__(self, load, days, depth=1, max_bytes=None, processes=False):
+        self.load = load
+        self.days = list(days)
+        self.depth = max(1, depth)
+        self.max_bytes = max_bytes
+        self.executor = None
+        if processes:
+            self.executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'))
+        self.future = None  # load running in the worker process
+        self.ready = {}  # day -> (data, bytes)
+        self.held = 0  # bytes of the ready days and the current one
+        self.current = 0  # bytes of the day taken last
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.loaded = 0
+        self.load_time = 0.0  # seconds spent loading, in the background
+        self.wait = 0.0  # seconds get blocked, the stream stalled on I/O
+        self.waits = 0  # gets that blocked
+        self.peak = 0
+        self.thread = threading.Thread(target=self.run, name='prefetch', daemon=True)
+        self.thread.start()
+
+    def has_room(self):
+        if not self.ready:
+            return True
+        if len(self.ready) >= self.depth:
+            return False
+        return not self.max_bytes or self.held < self.max_bytes
+
+    def run(self):
+        for day in self.days:
+            with self.condition:
+                while not self.closed and not self.has_room():
+                    self.condition.wait()
+                if self.closed:
+                    return
+            start = time.perf_counter()
+            try:
+                if self.executor:
+                    self.future = self.executor.submit(self.load, day)
+                    data = self.future.result()
+                else:
+                    data = self.load(day)
+                size = nbytes(data)
+            except Exception as ex:
+                logger.error('[PREFETCH] %s load error=%s' % (day, ex))
+                data, size = ex, 0
+            self.load_time += time.perf_counter() - start
+            with self.condition:
+                if self.closed:
+                    return
+                self.loaded += 1
+                self.ready[day] = (data, size)
+                self.held += size
+                self.peak = max(self.peak, self.held)
+                self.condition.notify_all()
+
+    def get(self, day):
+        if day not in self.days:
+            return self.load(day)
+        start = time.perf_counter()
+        with self.condition:
+            blocked = day not in self.ready
+            while day not in self.ready:
+                self.condition.wait()
+            data, size = self.ready.pop(day)
+            self.held -= self.current  # the previous day is done with
+            self.current = size
+            self.condition.notify_all()
+        if blocked:
+            self.waits += 1
+            self.wait += time.perf_counter() - start
+        if isinstance(data, Exception):
+            raise data
+        return data
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.ready.clear()
+            self.condition.notify_all()
+        if self.executor:
+            # shutdown(cancel_futures=True) needs python 3.9
+            if self.future is not None:
+                self.future.cancel()
+            self.executor.shutdown(wait=False)
+
+    def stats(self):
+        return {'days': self.loaded, 'wait': self.wait, 'waits': self.waits, 'load': self.load_time,
+                'peak_bytes': self.peak}
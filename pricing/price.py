@@ -1,6 +1,9 @@
 from __future__ import print_function
 
 import datetime
+import functools
+import heapq
+import logging
 from decimal import Decimal, getcontext, ROUND_HALF_DOWN
 import os
 import os.path
@@ -15,6 +18,44 @@ from datetime import timedelta
 
 from qsforex import settings
 from qsforex.event.event import TickEvent
+from qsforex.pricing.prefetch import DayPrefetcher
+from qsforex.pricing.tickstore import TickStore
+from qsforex.utils.time import parse_dukascopy_array
+
+logger = logging.getLogger(__name__)
+CSV_DECIMALS = 5  # ticks from CSV are quantized to 0.00001
+
+
+def csv_points(prices):
+    """
+    CSV prices as integers of CSV_DECIMALS places, rounded like Decimal(str(price))
+    quantized ROUND_HALF_DOWN: a price written with half a point more rounds
+    toward zero, anything else to the nearest. Both the direct and the
+    prefetch path convert with it, so they stream the same ticks.
+    """
+    scaled = np.asarray(prices, dtype=np.float64) * 10 ** CSV_DECIMALS
+    lower = np.floor(scaled)
+    half = np.abs(scaled - lower - 0.5) < 1e-6  # float error of a written half, far below a written digit
+    return np.where(half, np.where(scaled < 0, lower + 1, lower), np.rint(scaled)).astype(np.int64)
+
+
+def load_csv_day(csv_dir, pairs, date_str):
+    """
+    The CSV files of a day decoded for the merge, a list of
+    (k, pair, epoch ns, bid points, ask points, exponent) with
+    prices as integers of CSV_DECIMALS places.
+    """
+    _dt = dt.strptime(date_str, '%Y%m%d')
+    data = []
+    for k, p in enumerate(pairs):
+        pair_path = os.path.join(csv_dir, '%s/tick/%d/%s_%s.csv' % (p, int(_dt.year), p, date_str))
+        if not os.path.isfile(pair_path):
+            continue
+        frame = pd.read_csv(pair_path, header=None, names=['Time', 'Bid', 'Ask', 'BidVolume', 'AskVolume'],
+                            usecols=['Time', 'Bid', 'Ask'])
+        data.append((k, p, parse_dukascopy_array(frame['Time'].values).view(np.int64),
+                     csv_points(frame['Bid'].values), csv_points(frame['Ask'].values), -CSV_DECIMALS))
+    return data
 
 
 class PriceHandler(object):
@@ -80,8 +121,10 @@ class HistoricCSVPriceHandler(PriceHandler):
     tick data for each requested currency pair and stream those
     to the provided events queue.
     """
+    chunk_size = 10000  # rows of a pair's file read at once
 
-    def __init__(self, pairs, events_queue, csv_dir, startday, endday):
+    def __init__(self, pairs, events_queue, csv_dir, startday, endday, prefetch=0, prefetch_bytes=None,
+                 prefetch_processes=False):
         """
         Initialises the historic data handler by requesting
         the location of the CSV files and a list of symbols.
@@ -92,16 +135,25 @@ class HistoricCSVPriceHandler(PriceHandler):
         pairs - The list of currency pairs to obtain.
         events_queue - The events queue to send the ticks to.
         csv_dir - Absolute directory path to the CSV files.
+        prefetch - Days loaded ahead on a background thread, 0
+        streams each day from its files when it's reached.
+        prefetch_bytes - Stop loading ahead once the loaded days
+        hold this many bytes, one day ahead is always loaded.
+        prefetch_processes - Load in a worker process instead of
+        the thread.
         """
         self.pairs = pairs
         self.events_queue = events_queue
         self.csv_dir = csv_dir
         self.prices = self._set_up_prices_dict()
-        self.pair_frames = {}
         self.file_dates = self._list_all_file_dates(pairs, startday, endday)
         self.continue_backtest = True
         self.cur_date_idx = 0
-        self.cur_date_pairs = self._open_convert_csv_files_for_day(
+        self.prefetcher = None
+        if prefetch:
+            self.prefetcher = DayPrefetcher(self._day_loader(), self.file_dates, prefetch, prefetch_bytes,
+                                            prefetch_processes)
+        self.cur_date_pairs = self._open_day(
             self.file_dates[self.cur_date_idx]
         )
 
@@ -135,24 +187,61 @@ class HistoricCSVPriceHandler(PriceHandler):
 
     def _open_convert_csv_files_for_day(self, date_str):
         """
-        Opens the CSV files from the data directory, converting
-        them into pandas DataFrames within a pairs dictionary.
+        Opens the CSV files of the day for every pair and merges
+        them into one time ordered stream of ticks.
 
-        The function then concatenates all of the separate pairs
-        for a single day into a single data frame that is time 
-        ordered, allowing tick data events to be added to the queue 
-        in a chronological fashion.
+        Each file is read chunk_size rows at a time and the pairs
+        are merged with a heap over their next tick, so only a
+        chunk per pair is held instead of the whole day. Files are
+        expected in time order, as dukascopy writes them. Ticks of
+        the same time come in the order of self.pairs.
+
+        A pair with no file for the day is left out of that day,
+        the other pairs still stream. Before the merge a missing
+        file raised an IOError from read_csv and ended the run.
         """
-        for p in self.pairs:
-            _dt = dt.strptime(date_str, '%Y%m%d')
+        _dt = dt.strptime(date_str, '%Y%m%d')
+        streams = []
+        for k, p in enumerate(self.pairs):
             pair_path = os.path.join(self.csv_dir, '%s/tick/%d/%s_%s.csv' % (p, int(_dt.year), p, date_str))
-            self.pair_frames[p] = pd.read_csv(
-                pair_path, header=None, index_col='Time',
-                parse_dates=True, dayfirst=False,
-                names=['Time', 'Bid', 'Ask', 'BidVolume', 'AskVolume']
-            )
-            self.pair_frames[p]["Pair"] = p
-        return pd.concat(self.pair_frames.values()).sort_index().iterrows()
+            if os.path.isfile(pair_path):
+                streams.append(self._csv_ticks(k, p, pair_path))
+        return heapq.merge(*streams)
+
+    def _csv_ticks(self, k, pair, pair_path):
+        """(epoch ns, k, time, pair, bid, ask) of every row of a CSV file, k orders pairs of the same time"""
+        reader = pd.read_csv(pair_path, header=None, names=['Time', 'Bid', 'Ask', 'BidVolume', 'AskVolume'],
+                             usecols=['Time', 'Bid', 'Ask'], chunksize=self.chunk_size)
+        for frame in reader:
+            # fixed format dukascopy times, parsed in bulk instead of inferred row by row
+            times = parse_dukascopy_array(frame['Time'].values).view(np.int64)
+            for tick in self._array_ticks(k, pair, times, csv_points(frame['Bid'].values),
+                                          csv_points(frame['Ask'].values), -CSV_DECIMALS):
+                yield tick
+
+    def _day_loader(self):
+        """load(date_str) of the prefetcher, picklable for prefetch_processes"""
+        return functools.partial(load_csv_day, self.csv_dir, self.pairs)
+
+    def _open_day(self, date_str):
+        if self.prefetcher is None:
+            return self._open_convert_csv_files_for_day(date_str)
+        return heapq.merge(*[self._array_ticks(*entry) for entry in self.prefetcher.get(date_str)])
+
+    def _array_ticks(self, k, pair, times, bids, asks, exponent):
+        """(epoch ns, k, time, pair, bid, ask) of decoded columns, chunk_size ticks boxed at a time"""
+        for start in range(0, len(times), self.chunk_size):
+            end = start + self.chunk_size
+            chunk = np.asarray(times[start:end])
+            index = pd.DatetimeIndex(chunk.view('datetime64[ns]'))
+            for ns, stamp, bid, ask in zip(chunk.tolist(), index, bids[start:end].tolist(), asks[start:end].tolist()):
+                yield ns, k, stamp, pair, Decimal(bid).scaleb(exponent), Decimal(ask).scaleb(exponent)
+
+    def _close_prefetch(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            logger.info('[PREFETCH] days=%(days)s wait=%(wait).3fs in %(waits)s stalls, load=%(load).3fs, '
+                        'peak=%(peak_bytes)s bytes' % self.prefetcher.stats())
 
     def _update_csv_for_day(self):
         try:
@@ -160,7 +249,7 @@ class HistoricCSVPriceHandler(PriceHandler):
         except IndexError:  # End of file dates
             return False
         else:
-            self.cur_date_pairs = self._open_convert_csv_files_for_day(dt)
+            self.cur_date_pairs = self._open_day(dt)
             self.cur_date_idx += 1
             return True
 
@@ -175,25 +264,18 @@ class HistoricCSVPriceHandler(PriceHandler):
         of this class and places a single tick onto the queue, as
         well as updating the current bid/ask and inverse bid/ask.
         """
+        getcontext().rounding = ROUND_HALF_DOWN
         try:
-            index, row = next(self.cur_date_pairs)
+            _, _, index, pair, bid, ask = next(self.cur_date_pairs)
         except StopIteration:
             # End of the current days data
             if self._update_csv_for_day():
-                index, row = next(self.cur_date_pairs)
+                _, _, index, pair, bid, ask = next(self.cur_date_pairs)
             else:  # End of the data
                 self.continue_backtest = False
+                self._close_prefetch()
                 return
 
-        getcontext().rounding = ROUND_HALF_DOWN
-        pair = row["Pair"]
-        bid = Decimal(str(row["Bid"])).quantize(
-            Decimal("0.00001")
-        )
-        ask = Decimal(str(row["Ask"])).quantize(
-            Decimal("0.00001")
-        )
-
         # Create decimalised prices for traded pair
         self.prices[pair]["bid"] = bid
         self.prices[pair]["ask"] = ask
@@ -208,3 +290,38 @@ class HistoricCSVPriceHandler(PriceHandler):
         # Create the tick event for the queue
         tev = TickEvent(pair, index, bid, ask)
         self.events_queue.put(tev)
+
+
+class HistoricTickStorePriceHandler(HistoricCSVPriceHandler):
+    """
+    HistoricCSVPriceHandler reading a pricing.tickstore.TickStore, built from
+    the CSV tree with pricing.tickstore.convert_csv_tree.
+
+    The columns of each day are memory-mapped and merged by time like the
+    CSV files, ticks are made from the integer points, nothing is parsed.
+    """
+
+    def __init__(self, pairs, events_queue, store_dir, startday, endday, **kwargs):
+        self.store = TickStore(store_dir)
+        super(HistoricTickStorePriceHandler, self).__init__(pairs, events_queue, store_dir, startday, endday,
+                                                            **kwargs)
+
+    def _list_all_file_dates(self, pairs, startday, endday):
+        start = dt.strptime(str(startday), '%Y%m%d').date()
+        end = dt.strptime(str(endday), '%Y%m%d').date()
+        days = set()
+        for pair in pairs:
+            days.update(self.store.days(pair, start, end))
+        return [day.strftime('%Y%m%d') for day in sorted(days)]
+
+    def _open_convert_csv_files_for_day(self, date_str):
+        day = dt.strptime(date_str, '%Y%m%d').date()
+        streams = []
+        for k, p in enumerate(self.pairs):
+            if self.store.exists(p, day):
+                ticks = self.store.read(p, day)
+                streams.append(self._array_ticks(k, p, ticks.time, ticks.bid, ticks.ask, -ticks.decimals))
+        return heapq.merge(*streams)
+
+    def _day_loader(self):
+        return functools.partial(self.store.load_day, self.pairs)
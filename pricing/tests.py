@@ -0,0 +1,275 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date, datetime, timedelta
+from decimal import Decimal, ROUND_HALF_DOWN
+from unittest import mock
+
+import numpy as np
+
+from qsforex import settings
+from qsforex.pricing.prefetch import DayPrefetcher
+from qsforex.pricing.price import HistoricCSVPriceHandler, HistoricTickStorePriceHandler
+from qsforex.pricing.tickstore import TickStore, convert_csv_tree
+
+DAY = date(2019, 3, 4)
+
+
+def wait_for(condition, timeout=2):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+class PrefetchTest(unittest.TestCase):
+    def load(self, day):
+        self.loads.append(day)
+        if day == 'bad':
+            raise ValueError('no data for %s' % day)
+        return [(day, np.zeros(10, dtype=np.int64))]  # 80 bytes
+
+    def setUp(self):
+        self.loads = []
+
+    def test_in_order(self):
+        prefetcher = DayPrefetcher(self.load, ['1', '2', '3'], depth=2)
+        self.assertEqual([prefetcher.get(day)[0][0] for day in ['1', '2', '3']], ['1', '2', '3'])
+        self.assertEqual(self.loads, ['1', '2', '3'])
+        # a day it wasn't given is loaded on the spot
+        self.assertEqual(prefetcher.get('4')[0][0], '4')
+        prefetcher.close()
+        self.assertEqual(prefetcher.stats()['days'], 3)
+
+    def test_depth(self):
+        prefetcher = DayPrefetcher(self.load, ['1', '2', '3', '4'], depth=2)
+        self.assertTrue(wait_for(lambda: len(self.loads) == 2))
+        time.sleep(0.05)
+        self.assertEqual(self.loads, ['1', '2'])  # two days ready, it waits for room
+        prefetcher.get('1')
+        self.assertTrue(wait_for(lambda: len(self.loads) == 3))
+        time.sleep(0.05)
+        self.assertEqual(self.loads, ['1', '2', '3'])
+        prefetcher.close()
+
+    def test_max_bytes(self):
+        prefetcher = DayPrefetcher(self.load, ['1', '2', '3', '4'], depth=3, max_bytes=50)
+        self.assertTrue(wait_for(lambda: len(self.loads) == 1))
+        time.sleep(0.05)
+        self.assertEqual(self.loads, ['1'])  # one day ahead is always loaded, its 80 bytes pass max_bytes
+        prefetcher.get('1')
+        self.assertTrue(wait_for(lambda: len(self.loads) == 2))
+        time.sleep(0.05)
+        self.assertEqual(self.loads, ['1', '2'])  # day 1 is held until day 2 is taken
+        prefetcher.get('2')
+        self.assertTrue(wait_for(lambda: len(self.loads) == 3))
+        self.assertLessEqual(prefetcher.stats()['peak_bytes'], 160)
+        prefetcher.close()
+
+    def test_load_error(self):
+        prefetcher = DayPrefetcher(self.load, ['1', 'bad', '3'], depth=3)
+        self.assertEqual(prefetcher.get('1')[0][0], '1')
+        self.assertRaises(ValueError, prefetcher.get, 'bad')
+        self.assertEqual(prefetcher.get('3')[0][0], '3')  # later days still come
+        prefetcher.close()
+
+    def test_close(self):
+        release = threading.Event()
+
+        def slow(day):
+            release.wait(2)
+            return []
+
+        prefetcher = DayPrefetcher(slow, ['1', '2'], depth=1)
+        prefetcher.close()
+        release.set()
+        prefetcher.thread.join(2)
+        self.assertFalse(prefetcher.thread.is_alive())
+        self.assertEqual(prefetcher.ready, {})
+
+
+class ListQueue(list):
+    put = list.append
+
+
+def write_csv(csv_dir, pair, day, rows):
+    """a dukascopy CSV day of (time, bid, ask) rows"""
+    folder = os.path.join(csv_dir, pair, 'tick', str(day.year))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(os.path.join(folder, '%s_%s.csv' % (pair, day.strftime('%Y%m%d'))), 'w') as f:
+        for tick_time, bid, ask in rows:
+            f.write('%s,%s,%s,1.5,2.25\n' % (tick_time.strftime('%Y.%m.%d %H:%M:%S.%f')[:23], bid, ask))
+
+
+class TickStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.store = TickStore(os.path.join(self.root, 'store'))
+        self.times = np.array(['2019-03-04T10:00:00.123', '2019-03-04T10:00:01'], dtype='datetime64[ns]')
+
+    def test_round_trip(self):
+        self.store.write('EURUSD', DAY, self.times, [1.13001, 1.13002], [1.13011, 1.13012], [1.5, 2], [2.25, 3])
+        self.store.write('USDJPY', DAY, self.times.view(np.int64), [111.001, 111.1], [111.011, 111.2])
+
+        ticks = self.store.read('EURUSD', DAY)
+        self.assertEqual(len(ticks), 2)
+        self.assertEqual(ticks.time.tolist(), self.times.view(np.int64).tolist())
+        self.assertEqual(ticks.bid.dtype, np.int32)
+        self.assertEqual(ticks.bid.tolist(), [113001, 113002])
+        np.testing.assert_allclose(ticks.prices('ask'), [1.13011, 1.13012])
+        self.assertEqual(ticks.bid_volume.tolist(), [1.5, 2])
+        self.assertEqual(self.store.read('USDJPY', DAY).ask.tolist(), [111011, 111200])
+        self.assertEqual(self.store.read('USDJPY', DAY).decimals, 3)
+
+        self.assertEqual(self.store.days('EURUSD'), [DAY])
+        self.assertEqual(self.store.days('EURUSD', start=DAY + timedelta(1)), [])
+        self.assertEqual(self.store.days('GBPUSD'), [])
+        loaded = self.store.load_day(['GBPUSD', 'USDJPY', 'EURUSD'], '20190304')
+        self.assertEqual([(k, pair, exponent) for k, pair, _, _, _, exponent in loaded],
+                         [(1, 'USDJPY', -3), (2, 'EURUSD', -5)])
+
+    def test_int32_overflow(self):
+        self.assertRaises(ValueError, self.store.write, 'EURUSD', DAY, self.times, [1.1, 30000.0], [1.1, 1.1])
+        self.assertFalse(self.store.exists('EURUSD', DAY))
+
+        # checked before anything is written, the stored day is kept
+        self.store.write('EURUSD', DAY, self.times, [1.1, 1.2], [1.1, 1.2])
+        self.assertRaises(ValueError, self.store.write, 'EURUSD', DAY, self.times, [1.1, 1.1], [1.1, -30000.0])
+        self.assertEqual(self.store.read('EURUSD', DAY).bid.tolist(), [110000, 120000])
+
+    def test_replace(self):
+        self.store.write('EURUSD', DAY, self.times, [1.1, 1.2], [1.1, 1.2])
+        mapped = self.store.read('EURUSD', DAY)
+        # left over by a write that died half way
+        os.makedirs(os.path.join(self.store.path('EURUSD', DAY) + '.tmp', 'junk'))
+
+        self.store.write('EURUSD', DAY, self.times[:1], [1.3], [1.3])
+        self.assertEqual(self.store.read('EURUSD', DAY).bid.tolist(), [130000])
+        self.assertEqual(os.listdir(os.path.dirname(self.store.path('EURUSD', DAY))), ['EURUSD_20190304'])
+        self.assertEqual(self.store.days('EURUSD'), [DAY])
+        self.assertEqual(mapped.bid.tolist(), [110000, 120000])  # a day already read keeps its columns
+
+    def test_convert_csv_tree(self):
+        csv_dir = os.path.join(self.root, 'csv')
+        start = datetime(2019, 3, 4, 10)
+        write_csv(csv_dir, 'EURUSD', DAY, [(start, '1.13001', '1.13011'), (start + timedelta(seconds=1), '1.13002',
+                                                                           '1.13012')])
+        write_csv(csv_dir, 'EURUSD', DAY + timedelta(1), [(start + timedelta(1), '1.13003', '1.13013')])
+        write_csv(csv_dir, 'USDJPY', DAY, [(start, '111.001', '111.011')])
+        with open(os.path.join(csv_dir, 'EURUSD', 'tick', '2019', 'notes.txt'), 'w') as f:
+            f.write('not a day')
+
+        self.assertEqual(convert_csv_tree(csv_dir, self.store.root), 3)
+        ticks = self.store.read('EURUSD', DAY)
+        self.assertEqual(ticks.bid.tolist(), [113001, 113002])
+        self.assertEqual(ticks.ask_volume.tolist(), [2.25, 2.25])
+        self.assertEqual(ticks.time[0], np.datetime64(start, 'ns').view(np.int64))
+
+        # days in the store are skipped unless overwrite
+        write_csv(csv_dir, 'USDJPY', DAY, [(start, '112.001', '112.011')])
+        self.assertEqual(convert_csv_tree(csv_dir, self.store.root), 0)
+        self.assertEqual(self.store.read('USDJPY', DAY).bid.tolist(), [111001])
+        self.assertEqual(convert_csv_tree(csv_dir, self.store.root, pairs=['USDJPY'], overwrite=True), 1)
+        self.assertEqual(self.store.read('USDJPY', DAY).bid.tolist(), [112001])
+        self.assertEqual(convert_csv_tree(csv_dir, self.store.root, overwrite=True), 3)
+
+
+class TickStorePriceHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        store = TickStore(self.root)
+        times = np.array(['2019-03-04T10:00:00', '2019-03-04T10:00:01'], dtype='datetime64[ns]')
+        store.write('EURUSD', DAY, times, [1.13001, 1.13002], [1.13011, 1.13012])
+        store.write('USDJPY', DAY, times[:1], [111.001], [111.011])
+        store.write('EURUSD', DAY + timedelta(1), times[:1] + np.timedelta64(1, 'D'), [1.13003], [1.13013])
+
+    def stream(self, **kwargs):
+        queue = ListQueue()
+        handler = HistoricTickStorePriceHandler(['USDJPY', 'EURUSD', 'GBPUSD'], queue, self.root, '20190301',
+                                                '20190310', **kwargs)
+        self.assertEqual(handler.file_dates, ['20190304', '20190305'])
+        while handler.continue_backtest:
+            handler.stream_next_tick()
+        return handler, [(tick.instrument, tick.bid, tick.ask) for tick in queue]
+
+    def test_stream(self):
+        handler, ticks = self.stream()
+        self.assertEqual(ticks, [
+            ('USDJPY', Decimal('111.001'), Decimal('111.011')),
+            ('EURUSD', Decimal('1.13001'), Decimal('1.13011')),
+            ('EURUSD', Decimal('1.13002'), Decimal('1.13012')),
+            ('EURUSD', Decimal('1.13003'), Decimal('1.13013')),
+        ])
+        self.assertEqual(handler.prices['EURUSD']['bid'], Decimal('1.13003'))
+        self.assertEqual(str(handler.prices['EURUSD']['time']), '2019-03-05 10:00:00')
+        self.assertEqual(str(handler.prices['USDJPY']['time']), '2019-03-04 10:00:00')
+        self.assertEqual(handler.prices['USDEUR']['bid'], (1 / Decimal('1.13003')).quantize(Decimal('0.00001')))
+
+        self.assertEqual(self.stream(prefetch=1)[1], ticks)
+
+
+class CSVMergeTest(unittest.TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.csv_dir = os.path.join(root, 'csv') + os.sep
+        patcher = mock.patch.object(settings, 'CSV_DATA_DIR', self.csv_dir)  # the days are listed from it
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        start = datetime(2019, 3, 4, 10)
+        second = timedelta(seconds=1)
+        write_csv(self.csv_dir, 'EURUSD', DAY, [(start, '1.13001', '1.13011'),
+                                                (start + second, '1.13002', '1.13012'),
+                                                (start + 3 * second, '1.13003', '1.13013')])
+        write_csv(self.csv_dir, 'GBPUSD', DAY, [(start, '1.30001', '1.30011'),
+                                                (start + 2 * second, '1.30002', '1.30012'),
+                                                (start + 3 * second, '1.30003', '1.30013')])
+        # no GBPUSD the next day
+        write_csv(self.csv_dir, 'EURUSD', DAY + timedelta(1), [(start + timedelta(1), '1.13004', '1.13014')])
+
+    def stream(self, pairs, chunk_size=None, **kwargs):
+        queue = ListQueue()
+        handler = HistoricCSVPriceHandler(pairs, queue, self.csv_dir, '20190304', '20190305', **kwargs)
+        if chunk_size:
+            handler.chunk_size = chunk_size
+        while handler.continue_backtest:
+            handler.stream_next_tick()
+        return [(tick.instrument, str(tick.bid)) for tick in queue]
+
+    def test_merge(self):
+        ticks = self.stream(['GBPUSD', 'EURUSD'])
+        # ties at 10:00:00 and 10:00:03 in the order of the pairs, EURUSD alone on the 5th
+        self.assertEqual(ticks, [('GBPUSD', '1.30001'), ('EURUSD', '1.13001'), ('EURUSD', '1.13002'),
+                                 ('GBPUSD', '1.30002'), ('GBPUSD', '1.30003'), ('EURUSD', '1.13003'),
+                                 ('EURUSD', '1.13004')])
+        self.assertEqual(self.stream(['EURUSD', 'GBPUSD'])[:2], [('EURUSD', '1.13001'), ('GBPUSD', '1.30001')])
+
+        # files read a row at a time merge the same, as do prefetched days
+        self.assertEqual(self.stream(['GBPUSD', 'EURUSD'], chunk_size=1), ticks)
+        self.assertEqual(self.stream(['GBPUSD', 'EURUSD'], chunk_size=2, prefetch=1), ticks)
+
+    def test_half_points(self):
+        # half a point above each price, float binary values land on both sides of the half
+        prices = ['1.130005', '1.130015', '1.130025', '1.130035', '1.000045', '0.999995', '1.1300051', '1.13']
+        start = datetime(2019, 3, 4, 10)
+        write_csv(self.csv_dir, 'AUDUSD', DAY, [(start + timedelta(seconds=i), price, price)
+                                                for i, price in enumerate(prices)])
+        unit = Decimal('0.00001')
+        expected = [('AUDUSD', str(Decimal(price).quantize(unit, rounding=ROUND_HALF_DOWN))) for price in prices]
+        self.assertEqual(expected[:2], [('AUDUSD', '1.13000'), ('AUDUSD', '1.13001')])
+        for kwargs in ({}, {'prefetch': 1}, {'prefetch': 1, 'prefetch_processes': True}):
+            self.assertEqual(self.stream(['AUDUSD'], **kwargs), expected)
+
+    def test_missing_pair(self):
+        # GBPUSD has no file on the 5th, it's skipped instead of failing the day
+        for kwargs in ({}, {'prefetch': 1}):
+            ticks = self.stream(['GBPUSD', 'EURUSD'], **kwargs)
+            self.assertEqual(len(ticks), 7)
+            self.assertEqual(ticks[-1], ('EURUSD', '1.13004'))
@@ -0,0 +1,183 @@
+"""
+Columnar tick store, one directory of column files per pair and day.
+
+    <root>/<pair>/<year>/<pair>_<yyyymmdd>/time.npy    int64, epoch nanoseconds utc
+                                          bid.npy     int32, integer points (mt4.constants.to_points)
+                                          ask.npy     int32
+                                          bid_volume.npy  float32
+                                          ask_volume.npy  float32
+                                          meta.json   decimal places of a point, tick count
+
+Columns are plain .npy files, read back memory-mapped so a backtest doesn't
+parse anything and only touches the pages it streams. A day is written to a
+temporary directory and renamed into place, a partition that exists is
+complete.
+
+convert_csv_tree builds a store from the dukascopy CSV tree of
+settings.CSV_DATA_DIR, <pair>/tick/<year>/<pair>_<yyyymmdd>.csv.
+"""
+from __future__ import print_function
+
+import json
+import os
+import os.path
+import re
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from qsforex.mt4.constants import point_scale
+from qsforex.utils.time import parse_dukascopy_array
+
+COLUMNS = (
+    ('time', np.int64),
+    ('bid', np.int32),
+    ('ask', np.int32),
+    ('bid_volume', np.float32),
+    ('ask_volume', np.float32),
+)
+_INT32_MAX = np.iinfo(np.int32).max
+_DAY_DIR = re.compile(r'^(?P<pair>\w+)_(?P<date>\d{8})$')
+_CSV_FILE = re.compile(r'^(?P<pair>\w+)_(?P<date>\d{8})\.csv$')
+
+
+class TickDay(object):
+    """the memory-mapped columns of one pair and day"""
+
+    def __init__(self, pair, day, path):
+        self.pair = pair
+        self.day = day
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.decimals = meta['decimals']
+        for name, dtype in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, '%s.npy' % name), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.time)
+
+    def prices(self, name):
+        """bid or ask as float64 prices"""
+        return np.asarray(getattr(self, name), dtype=np.float64) / 10 ** self.decimals
+
+
+class TickStore(object):
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, pair, day):
+        return os.path.join(self.root, pair, '%d' % day.year, '%s_%s' % (pair, day.strftime('%Y%m%d')))
+
+    def exists(self, pair, day):
+        return os.path.isdir(self.path(pair, day))
+
+    def days(self, pair, start=None, end=None):
+        """sorted dates stored for pair, start and end inclusive"""
+        days = []
+        pair_dir = os.path.join(self.root, pair)
+        if not os.path.isdir(pair_dir):
+            return days
+        for year in os.listdir(pair_dir):
+            for name in os.listdir(os.path.join(pair_dir, year)):
+                match = _DAY_DIR.match(name)
+                if not match or match.group('pair') != pair:
+                    continue
+                day = datetime.strptime(match.group('date'), '%Y%m%d').date()
+                if (start is None or day >= start) and (end is None or day <= end):
+                    days.append(day)
+        return sorted(days)
+
+    def read(self, pair, day):
+        return TickDay(pair, day, self.path(pair, day))
+
+    def load_day(self, pairs, date_str):
+        """
+        The ticks of a day read into memory for the merge of the price
+        handler, a list of (k, pair, epoch ns, bid points, ask points, exponent).
+        """
+        day = datetime.strptime(date_str, '%Y%m%d').date()
+        data = []
+        for k, pair in enumerate(pairs):
+            if self.exists(pair, day):
+                ticks = self.read(pair, day)
+                data.append((k, pair, np.array(ticks.time), np.array(ticks.bid), np.array(ticks.ask),
+                             -ticks.decimals))
+        return data
+
+    def write(self, pair, day, time, bid, ask, bid_volume=None, ask_volume=None):
+        """
+        Store one day of ticks, time as datetime64 or epoch nanoseconds, bid and ask
+        as float prices. An existing day is replaced.
+        """
+        points, decimals = point_scale(pair)
+        time = np.asarray(time)
+        if time.dtype.kind == 'M':
+            time = time.astype('datetime64[ns]').view(np.int64)
+        count = len(time)
+        columns = {
+            'time': time,
+            'bid': np.rint(np.asarray(bid, dtype=np.float64) * points),
+            'ask': np.rint(np.asarray(ask, dtype=np.float64) * points),
+            'bid_volume': np.zeros(count) if bid_volume is None else bid_volume,
+            'ask_volume': np.zeros(count) if ask_volume is None else ask_volume,
+        }
+        for name in ('bid', 'ask'):
+            if count and np.abs(columns[name]).max() > _INT32_MAX:
+                raise ValueError('%s %s out of int32 points range.' % (pair, name))
+
+        path = self.path(pair, day)
+        temp = path + '.tmp'
+        if os.path.exists(temp):
+            shutil.rmtree(temp)
+        os.makedirs(temp)
+        for name, dtype in COLUMNS:
+            np.save(os.path.join(temp, '%s.npy' % name), np.ascontiguousarray(columns[name], dtype=dtype))
+        with open(os.path.join(temp, 'meta.json'), 'w') as f:
+            json.dump({'decimals': decimals, 'count': count}, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(temp, path)
+        return path
+
+    def convert_csv(self, pair, day, csv_path):
+        """one dukascopy CSV day, Time,Bid,Ask,BidVolume,AskVolume without a header"""
+        frame = pd.read_csv(csv_path, header=None, names=['Time', 'Bid', 'Ask', 'BidVolume', 'AskVolume'])
+        time = parse_dukascopy_array(frame['Time'].values)
+        return self.write(pair, day, time, frame['Bid'].values, frame['Ask'].values, frame['BidVolume'].values,
+                          frame['AskVolume'].values)
+
+
+def convert_csv_tree(csv_dir, root, pairs=None, overwrite=False):
+    """convert <csv_dir>/<pair>/tick/<year>/<pair>_<yyyymmdd>.csv into a TickStore at root, the days converted"""
+    store = TickStore(root)
+    converted = 0
+    for pair in sorted(os.listdir(csv_dir)):
+        tick_dir = os.path.join(csv_dir, pair, 'tick')
+        if (pairs and pair not in pairs) or not os.path.isdir(tick_dir):
+            continue
+        for year in sorted(os.listdir(tick_dir)):
+            year_dir = os.path.join(tick_dir, year)
+            if not os.path.isdir(year_dir):
+                continue
+            for name in sorted(os.listdir(year_dir)):
+                match = _CSV_FILE.match(name)
+                if not match or match.group('pair') != pair:
+                    continue
+                day = datetime.strptime(match.group('date'), '%Y%m%d').date()
+                if not overwrite and store.exists(pair, day):
+                    continue
+                store.convert_csv(pair, day, os.path.join(year_dir, name))
+                converted += 1
+    return converted
+
+
+if __name__ == '__main__':
+    import sys
+
+    from qsforex import settings
+
+    # python -m qsforex.pricing.tickstore [pair ...]
+    count = convert_csv_tree(settings.CSV_DATA_DIR, settings.TICK_STORE_DIR, pairs=sys.argv[1:] or None)
+    print('Converted %d days to %s' % (count, settings.TICK_STORE_DIR))
@@ -0,0 +1,110 @@
+"""
+Tick latency of a fast handler sharing a runner with a slow I/O handler.
+
+The slow handler stands for a telegram / sms send: it waits io_delay seconds
+on every SignalEvent. Latency is from TickPriceEvent.time to the moment the
+fast handler sees the tick, with Runner (everything in line), AsyncRunner
+running the slow handler as a legacy sync handler in its thread pool, and
+AsyncRunner awaiting an async version of it.
+
+python -m scripts.benchmark_async_runner [ticks] [io_delay]
+"""
+import asyncio
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from event.async_runner import AsyncRunner
+from event.event import TickPriceEvent, SignalEvent, SignalAction
+from event.handler import BaseHandler
+from event.runner import Runner
+from mt4.constants import OrderSide
+
+IO_DELAY = 0.05
+
+
+class TickLatencyHandler(BaseHandler):
+    subscription = [TickPriceEvent.type]
+
+    def __init__(self, queue):
+        super(TickLatencyHandler, self).__init__(queue)
+        self.latencies = []
+
+    def process(self, event):
+        self.latencies.append((datetime.utcnow() - event.time).total_seconds())
+
+
+class SlowSyncHandler(BaseHandler):
+    subscription = [SignalEvent.type]
+
+    def process(self, event):
+        time.sleep(IO_DELAY)
+
+
+class SlowAsyncHandler(BaseHandler):
+    subscription = [SignalEvent.type]
+
+    async def process(self, event):
+        await asyncio.sleep(IO_DELAY)
+
+
+def feed(runner, count, interval=0.001):
+    """ticks every interval seconds, a signal every 10 ticks"""
+    for i in range(count):
+        runner.put(TickPriceEvent('FXCM', 'EURUSD', datetime.utcnow(), Decimal('1.13215'), Decimal('1.13230')))
+        if not i % 10:
+            runner.put(SignalEvent(SignalAction.OPEN, 'HLHB Trend', '0.1', '20190304', 'EURUSD', OrderSide.BUY))
+        time.sleep(interval)
+
+
+def run_sync(count, slow_class):
+    q = queue.Queue()
+    fast = TickLatencyHandler(q)
+    runner = Runner(q)
+    runner.register(fast, slow_class(q))
+    feeder = threading.Thread(target=feed, args=(runner, count))
+    feeder.start()
+    while feeder.is_alive() or not q.empty():
+        if not runner.drain():
+            time.sleep(0.001)
+    return fast.latencies
+
+
+def run_async(count, slow_class):
+    q = queue.Queue()
+    fast = TickLatencyHandler(q)
+    runner = AsyncRunner(q, fast, slow_class(q))
+    runner.idle_sleep = 0.001
+    feeder = threading.Thread(target=feed, args=(runner, count))
+
+    def stop_when_fed():
+        feeder.join()
+        while not q.empty():
+            time.sleep(0.01)
+        runner.running = False
+
+    feeder.start()
+    threading.Thread(target=stop_when_fed).start()
+    runner.run()
+    return fast.latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    n = len(latencies)
+    print('%-22s %6d ticks  p50 %8.2f ms  p99 %8.2f ms  max %8.2f ms' % (
+        name, n, latencies[n // 2] * 1000, latencies[int(n * 0.99)] * 1000, latencies[-1] * 1000))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    if len(sys.argv) > 2:
+        IO_DELAY = float(sys.argv[2])
+
+    print('slow handler waits %s ms per signal' % (IO_DELAY * 1000))
+    report('Runner', run_sync(count, SlowSyncHandler))
+    report('AsyncRunner sync', run_async(count, SlowSyncHandler))
+    report('AsyncRunner async', run_async(count, SlowAsyncHandler))
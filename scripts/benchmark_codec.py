@@ -0,0 +1,52 @@
+"""
+Round trip benchmark of the event codecs used by QueueBase.put/get.
+
+Encodes then decodes the same TickPriceEvent / SignalEvent mix with the
+json codec and the binary codec and prints per event cost and frame size.
+
+python -m scripts.benchmark_codec [count]
+"""
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from event.codec import json_codec, binary_codec
+from event.event import TickPriceEvent, SignalEvent, SignalAction
+from mt4.constants import OrderSide
+
+
+def make_events(count):
+    events = []
+    now = datetime.utcnow()
+    for i in range(count):
+        if i % 100:
+            bid = Decimal('1.13215') + Decimal(i % 50) / 100000
+            events.append(TickPriceEvent('FXCM', 'EURUSD', now, bid, bid + Decimal('0.00015')))
+        else:
+            events.append(SignalEvent(SignalAction.OPEN, 'HLHB Trend', '0.1', '20190304', 'EURUSD',
+                                       OrderSide.BUY, stop_loss=30, take_profit=50, trailing_stop=40))
+    return events
+
+
+def run(codec, events):
+    size = 0
+    start = time.perf_counter()
+    for event in events:
+        data = codec.encode(event)
+        size += len(data)
+        codec.decode(data)
+    return time.perf_counter() - start, size / len(events)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    events = make_events(count)
+
+    results = {}
+    for name, codec in (('json', json_codec), ('binary', binary_codec)):
+        elapsed, avg_size = run(codec, events)
+        results[name] = elapsed
+        print('%-6s %8.2f us/event  %6.1f bytes/event  %10.0f events/sec' % (
+            name, elapsed / count * 1e6, avg_size, count / elapsed))
+    print('binary speedup: %0.1fx' % (results['json'] / results['binary']))
@@ -0,0 +1,85 @@
+"""
+Dispatch cost of Runner.handle_event, precomputed dispatch table against
+the old loop testing every handler subscription per event.
+
+Handlers subscribe to a random subset of the event types, one in ten
+subscribes to '*'.
+
+python -m scripts.benchmark_dispatch [events]
+"""
+import queue
+import random
+import sys
+import time
+
+from event.event import GenericEvent
+from event.handler import BaseHandler
+from event.runner import Runner
+
+EVENT_TYPES = ['TYPE_%s' % i for i in range(20)]
+
+
+class NoopHandler(BaseHandler):
+    def __init__(self, queue, subscription):
+        super(NoopHandler, self).__init__(queue)
+        self.subscription = subscription
+        self.count = 0
+
+    def process(self, event):
+        self.count += 1
+
+
+def legacy_handle_event(runner, event):
+    """Runner.handle_event before the dispatch table"""
+    re_put = False
+    for handler in runner.handlers:
+        if '*' in handler.subscription:
+            result = runner.process_event(handler, event)
+            re_put = result or re_put
+            continue
+        elif event.type in handler.subscription:
+            result = runner.process_event(handler, event)
+            re_put = result or re_put
+
+
+def make_runner(handler_count, rand):
+    q = queue.Queue()
+    runner = Runner(q)
+    for i in range(handler_count):
+        if i % 10 == 9:
+            subscription = ['*']
+        else:
+            subscription = rand.sample(EVENT_TYPES, rand.randint(1, 4))
+        runner.register(NoopHandler(q, subscription))
+    return runner
+
+
+def make_events(count, rand):
+    events = []
+    for i in range(count):
+        event = GenericEvent.__new__(GenericEvent)
+        # ticks dominate the live stream
+        event.type = EVENT_TYPES[0] if i % 4 else rand.choice(EVENT_TYPES)
+        event.tried = 0
+        events.append(event.freeze())
+    return events
+
+
+def timeit(handle, runner, events):
+    start = time.perf_counter()
+    for event in events:
+        handle(runner, event)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rand = random.Random(42)
+    events = make_events(count, rand)
+
+    for handler_count in (8, 25, 50, 100):
+        runner = make_runner(handler_count, rand)
+        legacy = timeit(legacy_handle_event, runner, events)
+        table = timeit(Runner.handle_event, runner, events)
+        print('%3d handlers, %d types: legacy %7.2f us/event, table %7.2f us/event, %0.1fx' % (
+            handler_count, len(EVENT_TYPES), legacy / count * 1e6, table / count * 1e6, legacy / table))
@@ -0,0 +1,75 @@
+"""
+Memory and attribute access cost of slotted events against the old
+__dict__ backed events.
+
+LegacyTickPriceEvent below is the event as it was before __slots__: a plain
+class whose fields live in a per instance dict. Both variants are built from
+the same decoded json payload, the way Event.from_dict rebuilds them.
+
+python -m scripts.benchmark_event_alloc [count]
+"""
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from decimal import Decimal
+
+from event.event import Event, TickPriceEvent
+
+
+class LegacyTickPriceEvent(object):
+    type = TickPriceEvent.type
+
+
+def build_legacy(payload):
+    instance = LegacyTickPriceEvent()
+    for k, v in payload.items():
+        setattr(instance, k, v)
+    return instance
+
+
+def build_slotted(payload):
+    instance = Event.new(TickPriceEvent.type)
+    for k, v in payload.items():
+        setattr(instance, k, v)
+    return instance
+
+
+def measure(build, payload, count, chunk=100000):
+    """allocated blocks and bytes per event while holding chunk events alive"""
+    tracemalloc.start()
+    blocks = size = 0
+    done = 0
+    while done < count:
+        before_blocks = sys.getallocatedblocks()
+        before_size = tracemalloc.get_traced_memory()[0]
+        events = [build(payload) for _ in range(min(chunk, count - done))]  # alive until both are measured
+        blocks += sys.getallocatedblocks() - before_blocks
+        size += tracemalloc.get_traced_memory()[0] - before_size
+        done += len(events)
+        del events
+    tracemalloc.stop()
+    return blocks, size
+
+
+def access(events):
+    start = time.perf_counter()
+    total = 0
+    for event in events:
+        if event.instrument == 'EURUSD' and event.bid:
+            total += 1
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    payload = {'time': datetime.utcnow(), 'tried': 0, 'broker': 'FXCM', 'instrument': 'EURUSD',
+               'bid': Decimal('1.13215'), 'ask': Decimal('1.13230')}
+
+    print('%s ticks' % count)
+    for name, build in (('dict', build_legacy), ('slots', build_slotted)):
+        blocks, size = measure(build, payload, count)
+        events = [build(payload) for _ in range(min(count, 100000))]
+        elapsed = access(events)
+        print('%-6s %12d blocks %8.2f blocks/tick %14d bytes %8.1f bytes/tick %8.1f ns/access' % (
+            name, blocks, blocks / count, size, size / count, elapsed / len(events) * 1e9))
@@ -0,0 +1,79 @@
+"""
+Journal append cost and size for a tick stream of 7 pairs.
+
+Runs the same ticks through Runner.handle_event with and without a journal,
+reads the journal back, and extrapolates the size of a trading week at the
+given ticks per second per pair.
+
+python -m scripts.benchmark_journal [count] [ticks_per_second_per_pair]
+"""
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from event.event import TickPriceEvent
+from event.handler import BaseHandler
+from event.journal import JournalWriter, JournalReader
+from event.runner import Runner
+
+PAIRS = ['EURUSD', 'GBPUSD', 'USDJPY', 'USDCHF', 'AUDUSD', 'NZDUSD', 'XAUUSD']
+WEEK_SECONDS = 5 * 24 * 3600
+
+
+class NoopHandler(BaseHandler):
+    subscription = [TickPriceEvent.type]
+
+    def process(self, event):
+        return None
+
+
+def make_ticks(count):
+    start = datetime.utcnow()
+    ticks = []
+    for i in range(count):
+        bid = Decimal('1.13215') + Decimal(i % 50) / 100000
+        ticks.append(TickPriceEvent('FXCM', PAIRS[i % len(PAIRS)], start + timedelta(milliseconds=i), bid,
+                                    bid + Decimal('0.00015')))
+    return ticks
+
+
+def run(ticks, journal):
+    q = queue.Queue()
+    runner = Runner(q, metrics=False, journal=journal)
+    runner.register(NoopHandler(q))
+    start = time.perf_counter()
+    for tick in ticks:
+        runner.handle_event(tick)
+    if journal:
+        journal.close()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    ticks = make_ticks(count)
+    path = tempfile.mkdtemp()
+    try:
+        off = run(ticks, None)
+        on = run(ticks, JournalWriter(path))
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+        start = time.perf_counter()
+        read = sum(1 for _ in JournalReader(path))
+        read_time = time.perf_counter() - start
+
+        print('no journal   %8.2f us/event' % (off / count * 1e6))
+        print('journal      %8.2f us/event, %0.2f us journal append' % (on / count * 1e6, (on - off) / count * 1e6))
+        print('size         %8.1f bytes/event, %s files' % (size / count, len(os.listdir(path))))
+        print('read back    %8.2f us/event, %s events' % (read_time / read * 1e6, read))
+        week = rate * len(PAIRS) * WEEK_SECONDS
+        print('week at %s ticks/s/pair: %d ticks, %0.1f MB, %0.1f s of journal appends' % (
+            rate, week, week * size / count / 1e6, week * (on - off) / count))
+    finally:
+        shutil.rmtree(path)
@@ -0,0 +1,93 @@
+"""
+Historic CSV streaming, concat + sort_index + iterrows against the heap merge.
+
+7 pairs over a month of synthetic dukascopy CSV files, every tick streamed
+through stream_next_tick:
+- concat: the handler before the heap merge, every pair of a day loaded,
+  concatenated, sorted and walked with iterrows
+- merge: HistoricCSVPriceHandler, chunked reads merged with heapq
+- store: HistoricTickStorePriceHandler on the converted tree, merged the same way
+Each runs in its own process, peak RSS is that process's ru_maxrss.
+
+Run from the parent directory of the repository, the pricing modules import qsforex:
+python -m qsforex.scripts.benchmark_merge [days] [ticks per pair and day]
+"""
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import pandas as pd
+
+PAIRS = ['EURUSD', 'GBPUSD', 'USDJPY', 'USDCHF', 'USDCAD', 'AUDUSD', 'NZDUSD']
+
+
+def concat_handler():
+    from qsforex.pricing.price import HistoricCSVPriceHandler
+    from qsforex.utils.time import parse_dukascopy_array
+
+    class ConcatCSVPriceHandler(HistoricCSVPriceHandler):
+        def _open_convert_csv_files_for_day(self, date_str):
+            frames = []
+            for p in self.pairs:
+                pair_path = os.path.join(self.csv_dir, '%s/tick/%s/%s_%s.csv' % (p, date_str[:4], p, date_str))
+                frame = pd.read_csv(pair_path, header=None, names=['Time', 'Bid', 'Ask', 'BidVolume', 'AskVolume'])
+                frame.index = pd.DatetimeIndex(parse_dukascopy_array(frame.pop('Time').values), name='Time')
+                frame['Pair'] = p
+                frames.append(frame)
+            return self._rows(pd.concat(frames).sort_index())
+
+        def _rows(self, frame):
+            for index, row in frame.iterrows():
+                yield (0, 0, index, row['Pair'], Decimal(str(row['Bid'])).quantize(Decimal('0.00001')),
+                       Decimal(str(row['Ask'])).quantize(Decimal('0.00001')))
+
+    return ConcatCSVPriceHandler
+
+
+def run(name, directory, start, end, results):
+    from qsforex.pricing.price import HistoricCSVPriceHandler, HistoricTickStorePriceHandler
+    from qsforex.scripts.benchmark_tickstore import CountQueue
+
+    handler_class = {'concat': concat_handler(), 'merge': HistoricCSVPriceHandler,
+                     'store': HistoricTickStorePriceHandler}[name]
+    queue = CountQueue()
+    began = time.perf_counter()
+    handler = handler_class(PAIRS, queue, directory, start, end)
+    while handler.continue_backtest:
+        handler.stream_next_tick()
+    elapsed = time.perf_counter() - began
+    results.put((name, queue.count, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+
+
+if __name__ == '__main__':
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    root = tempfile.mkdtemp()
+    csv_dir = os.path.join(root, 'csv') + os.sep
+    store_dir = os.path.join(root, 'store')
+    os.environ['QSFOREX_CSV_DATA_DIR'] = csv_dir  # read by settings, the csv handlers list days from it
+    try:
+        from qsforex.scripts.benchmark_tickstore import write_csv_tree, START
+        from qsforex.pricing.tickstore import convert_csv_tree
+
+        write_csv_tree(csv_dir, days, ticks, PAIRS)
+        convert_csv_tree(csv_dir, store_dir)
+        start, end = START.strftime('%Y%m%d'), (START + timedelta(days=days - 1)).strftime('%Y%m%d')
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        print('%-7s %10s %9s %11s %10s' % ('', 'ticks', 'seconds', 'ticks/s', 'peak RSS'))
+        for name, directory in (('concat', csv_dir), ('merge', csv_dir), ('store', store_dir)):
+            process = context.Process(target=run, args=(name, directory, start, end, results))
+            process.start()
+            name, count, elapsed, rss = results.get()
+            process.join()
+            print('%-7s %10d %8.2fs %11.0f %7.1f MB' % (name, count, elapsed, count / elapsed, rss))
+    finally:
+        shutil.rmtree(root)
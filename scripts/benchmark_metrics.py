@@ -0,0 +1,48 @@
+"""
+Cost of the per handler timing in Runner.handle_event.
+
+Handles the same ticks through three cheap handlers with metrics on and off
+and prints the added cost per event.
+
+python -m scripts.benchmark_metrics [count]
+"""
+import queue
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from event.event import TickPriceEvent
+from event.handler import BaseHandler
+from event.metrics import RunnerMetrics
+from event.runner import Runner
+
+
+class NoopHandler(BaseHandler):
+    subscription = [TickPriceEvent.type]
+
+    def process(self, event):
+        return None
+
+
+def run(metrics, events):
+    q = queue.Queue()
+    runner = Runner(q, metrics=metrics)
+    runner.register(NoopHandler(q), NoopHandler(q), NoopHandler(q))
+    start = time.perf_counter()
+    for event in events:
+        runner.handle_event(event)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    now = datetime.utcnow()
+    events = [TickPriceEvent('FXCM', 'EURUSD', now, Decimal('1.13215'), Decimal('1.13230')) for _ in range(count)]
+
+    off = run(False, events)
+    on = run(RunnerMetrics(sinks=[]), events)
+    print('metrics off %8.2f us/event' % (off / count * 1e6))
+    print('metrics on  %8.2f us/event' % (on / count * 1e6))
+    print('overhead    %8.2f us/event, %0.2f us per handler call' % ((on - off) / count * 1e6,
+                                                                     (on - off) / count / 3 * 1e6))
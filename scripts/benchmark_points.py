@@ -0,0 +1,70 @@
+"""
+Tick hot path throughput, Decimal prices against integer points.
+
+Per tick: bid and ask from the broker floats, a TickPriceEvent, and the profit
+of an open trade as TradeManageHandler computes it.
+- decimal: Decimal(str(float)).quantize(pip), profit_pip
+- points: to_points, TickPriceEvent.from_points, profit_points then points_to_pip
+- points int: the same without the Decimal pips, for handlers staying in points
+
+python -m scripts.benchmark_points [count]
+"""
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from event.event import TickPriceEvent
+from mt4.constants import pip, profit_pip, to_points, profit_points, points_to_pip, OrderSide
+
+INSTRUMENT = 'EURUSD'
+BUY = OrderSide.BUY
+
+
+def make_rates(count=1000):
+    return [(1.13215 + (i % 97) / 100000, 1.13230 + (i % 97) / 100000) for i in range(count)]
+
+
+def run_decimal(rates, count, now):
+    unit = pip(INSTRUMENT)
+    open_price = Decimal('1.13200')
+    size = len(rates)
+    for i in range(count):
+        bid, ask = rates[i % size]
+        tick = TickPriceEvent('FXCM', INSTRUMENT, now, Decimal(str(bid)).quantize(unit),
+                              Decimal(str(ask)).quantize(unit))
+        profit_pip(INSTRUMENT, open_price, tick.bid, BUY)
+
+
+def run_points(rates, count, now):
+    open_points = to_points(INSTRUMENT, Decimal('1.13200'))
+    size = len(rates)
+    for i in range(count):
+        bid, ask = rates[i % size]
+        tick = TickPriceEvent.from_points('FXCM', INSTRUMENT, now, to_points(INSTRUMENT, bid),
+                                          to_points(INSTRUMENT, ask))
+        points_to_pip(profit_points(open_points, tick.bid_points, BUY))
+
+
+def run_points_int(rates, count, now):
+    open_points = to_points(INSTRUMENT, Decimal('1.13200'))
+    size = len(rates)
+    for i in range(count):
+        bid, ask = rates[i % size]
+        tick = TickPriceEvent.from_points('FXCM', INSTRUMENT, now, to_points(INSTRUMENT, bid),
+                                          to_points(INSTRUMENT, ask))
+        profit_points(open_points, tick.bid_points, BUY)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    rates = make_rates()
+    now = datetime.utcnow()
+    results = []
+    for name, run in (('decimal', run_decimal), ('points', run_points), ('points int', run_points_int)):
+        start = time.perf_counter()
+        run(rates, count, now)
+        elapsed = time.perf_counter() - start
+        results.append(elapsed)
+        print('%-11s %8.2fs %10.0f ticks/s %6.2f us/tick %5.2fx' % (
+            name, elapsed, count / elapsed, elapsed / count * 1e6, results[0] / elapsed))
@@ -0,0 +1,73 @@
+"""
+Historic CSV streaming with the next days loaded in the background.
+
+7 pairs over a couple of weeks of synthetic dukascopy CSV files, every tick
+streamed through stream_next_tick of HistoricCSVPriceHandler:
+- off: prefetch=0, each day read in chunks when the stream reaches it
+- thread 1 / thread 2: one or two days ahead loaded on the prefetch thread
+- process 1: one day ahead loaded in a worker process, parsing off the GIL
+wait is the time stream_next_tick stalled for a day that wasn't ready,
+peak the most bytes of decoded days held at once.
+Each runs in its own process.
+
+Run from the parent directory of the repository, the pricing modules import qsforex:
+python -m qsforex.scripts.benchmark_prefetch [days] [ticks per pair and day]
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+PAIRS = ['EURUSD', 'GBPUSD', 'USDJPY', 'USDCHF', 'USDCAD', 'AUDUSD', 'NZDUSD']
+MODES = (
+    ('off', {}),
+    ('thread 1', {'prefetch': 1}),
+    ('thread 2', {'prefetch': 2}),
+    ('process 1', {'prefetch': 1, 'prefetch_processes': True}),
+)
+
+
+def run(kwargs, csv_dir, start, end, results):
+    from qsforex.pricing.price import HistoricCSVPriceHandler
+    from qsforex.scripts.benchmark_tickstore import CountQueue
+
+    queue = CountQueue()
+    began = time.perf_counter()
+    handler = HistoricCSVPriceHandler(PAIRS, queue, csv_dir, start, end, **kwargs)
+    while handler.continue_backtest:
+        handler.stream_next_tick()
+    elapsed = time.perf_counter() - began
+    stats = handler.prefetcher.stats() if handler.prefetcher else None
+    results.put((queue.count, elapsed, stats))
+
+
+if __name__ == '__main__':
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 14
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    root = tempfile.mkdtemp()
+    csv_dir = os.path.join(root, 'csv') + os.sep
+    os.environ['QSFOREX_CSV_DATA_DIR'] = csv_dir  # read by settings, the csv handler lists days from it
+    try:
+        from qsforex.scripts.benchmark_tickstore import write_csv_tree, START
+
+        write_csv_tree(csv_dir, days, ticks, PAIRS)
+        start, end = START.strftime('%Y%m%d'), (START + timedelta(days=days - 1)).strftime('%Y%m%d')
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        print('%-10s %10s %9s %11s %9s %7s %10s' % ('', 'ticks', 'seconds', 'ticks/s', 'wait', 'stalls', 'peak'))
+        for name, kwargs in MODES:
+            process = context.Process(target=run, args=(kwargs, csv_dir, start, end, results))
+            process.start()
+            count, elapsed, stats = results.get()
+            process.join()
+            if stats:
+                prefetch = '%8.2fs %7d %7.1f MB' % (stats['wait'], stats['waits'], stats['peak_bytes'] / 2.0 ** 20)
+            else:
+                prefetch = '%9s %7s %10s' % ('-', '-', '-')
+            print('%-10s %10d %8.2fs %11.0f %s' % (name, count, elapsed, count / elapsed, prefetch))
+    finally:
+        shutil.rmtree(root)
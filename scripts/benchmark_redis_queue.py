@@ -0,0 +1,52 @@
+"""
+RedisQueue throughput against a local redis-server at batch sizes 1, 16
+and 256: events are put with put_many and drained with get_many through
+QueueBase, batch size 1 uses the plain put/get path.
+
+python -m scripts.benchmark_redis_queue [events] [json|binary]
+"""
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from event.codec import binary_codec
+from event.event import TickPriceEvent
+from event.handler import QueueBase
+from utils.redis import RedisQueue
+
+
+def run(base, events, batch_size):
+    start = time.perf_counter()
+    received = 0
+    if batch_size == 1:
+        for event in events:
+            base.put(event)
+        while base.get():
+            received += 1
+    else:
+        for i in range(0, len(events), batch_size):
+            base.put_many(events[i:i + batch_size])
+        while True:
+            batch = base.get_many(batch_size)
+            if not batch:
+                break
+            received += len(batch)
+    elapsed = time.perf_counter() - start
+    assert received == len(events), received
+    return elapsed
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    codec = binary_codec if len(sys.argv) > 2 and sys.argv[2] == 'binary' else None
+
+    queue = RedisQueue('benchmark', codec=codec)
+    base = QueueBase(queue)
+    now = datetime.utcnow()
+    events = [TickPriceEvent('FXCM', 'EURUSD', now, Decimal('1.13215'), Decimal('1.13230')) for _ in range(count)]
+
+    print('%s events, %s codec' % (count, 'binary' if codec else 'json'))
+    for batch_size in (1, 16, 256):
+        elapsed = run(base, events, batch_size)
+        print('batch %3d: %10.0f events/sec' % (batch_size, count / elapsed))
@@ -0,0 +1,48 @@
+"""
+Parameter sweep scaling, HLHBTrendStrategy on H1 candles of every pair.
+
+The grid runs once in this process (processes=0) and then on pools of 1, 2,
+4 ... workers up to the cores of the box. Seconds include starting the pool
+and copying the candles to shared memory, speedup and efficiency are against
+the pool of 1.
+
+python -m scripts.benchmark_sweep [bars per pair]
+"""
+import os
+import sys
+
+from backtest.sweep import ParameterSweep
+from scripts.benchmark_vectorized import make_candles, PAIRS
+from strategy.hlhb_trend import HLHBTrendStrategy
+
+GRID = {'short_ema': [3, 5, 8, 12], 'long_ema': [10, 20, 30, 50], 'take_profit': [30, 50, 100],
+        'trailing_stop': [None, 40]}
+
+
+def workers(cores):
+    counts = [0, 1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 6240  # 52 weeks of 5 days
+    data = dict((symbol, make_candles(symbol, count, seed=i)) for i, symbol in enumerate(PAIRS))
+
+    print('%-9s %6s %9s %9s %8s %11s' % ('processes', 'runs', 'seconds', 'runs/s', 'speedup', 'efficiency'))
+    single = None
+    best = None
+    for processes in workers(os.cpu_count()):
+        sweep = ParameterSweep(HLHBTrendStrategy, GRID, processes=processes)
+        results = list(sweep.run(data))
+        if processes == 1:
+            single = sweep.elapsed
+        speedup = single / sweep.elapsed if single and processes else None
+        print('%-9s %6d %8.2fs %9.1f %8s %11s' % (
+            processes or 'inline', len(results), sweep.elapsed, len(results) / sweep.elapsed,
+            '%0.2fx' % speedup if speedup else '-', '%0.0f%%' % (speedup / processes * 100) if speedup else '-'))
+        best = max(results, key=lambda result: result.profit_pips)
+    print('best %s' % best)
@@ -0,0 +1,91 @@
+"""
+Historic tick loading, the CSV tree against the memory-mapped TickStore.
+
+A synthetic dukascopy CSV tree of a few pairs and days is written to a
+temporary directory and converted with convert_csv_tree, then both handlers
+stream every tick:
+- csv: HistoricCSVPriceHandler, read_csv and timestamp parsing per pair and day
+- store: HistoricTickStorePriceHandler, memory-mapped columns merged by time
+load is the time to open every day, stream the time to put every TickEvent.
+
+Run from the parent directory of the repository, the pricing modules import qsforex:
+python -m qsforex.scripts.benchmark_tickstore [days] [ticks per pair and day]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+PAIRS = ['EURUSD', 'GBPUSD', 'USDJPY']
+START = datetime(2019, 3, 4)
+
+
+class CountQueue(object):
+    def __init__(self):
+        self.count = 0
+        self.last = None
+
+    def put(self, event):
+        self.count += 1
+        self.last = event
+
+
+def write_csv_tree(csv_dir, days, ticks, pairs=PAIRS):
+    random = np.random.RandomState(0)
+    for pair in pairs:
+        base = 111.0 if pair.endswith('JPY') else 1.13
+        decimals = 3 if pair.endswith('JPY') else 5
+        for d in range(days):
+            day = START + timedelta(days=d)
+            folder = os.path.join(csv_dir, pair, 'tick', str(day.year))
+            os.makedirs(folder, exist_ok=True)
+            offsets = np.sort(random.randint(0, 86400000, ticks))
+            bids = np.round(base + np.cumsum(random.standard_normal(ticks)) * 10 ** -decimals, decimals)
+            with open(os.path.join(folder, '%s_%s.csv' % (pair, day.strftime('%Y%m%d'))), 'w') as f:
+                for offset, bid in zip(offsets.tolist(), bids.tolist()):
+                    stamp = (day + timedelta(milliseconds=offset)).strftime('%Y.%m.%d %H:%M:%S.%f')[:23]
+                    f.write('%s,%.*f,%.*f,1.5,2.25\n' % (stamp, decimals, bid, decimals, bid + 2 * 10 ** -decimals))
+
+
+def run(handler_class, directory, days):
+    queue = CountQueue()
+    end = (START + timedelta(days=days - 1)).strftime('%Y%m%d')
+    start = time.perf_counter()
+    handler = handler_class(PAIRS, queue, directory, START.strftime('%Y%m%d'), end)
+    load = time.perf_counter() - start
+    while handler.continue_backtest:
+        handler.stream_next_tick()
+    total = time.perf_counter() - start
+    return queue, load, total
+
+
+if __name__ == '__main__':
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    root = tempfile.mkdtemp()
+    csv_dir = os.path.join(root, 'csv') + os.sep
+    store_dir = os.path.join(root, 'store')
+    os.environ['QSFOREX_CSV_DATA_DIR'] = csv_dir  # read by settings, the csv handler lists days from it
+    try:
+        write_csv_tree(csv_dir, days, ticks)
+
+        from qsforex.pricing.price import HistoricCSVPriceHandler, HistoricTickStorePriceHandler
+        from qsforex.pricing.tickstore import convert_csv_tree
+
+        start = time.perf_counter()
+        converted = convert_csv_tree(csv_dir, store_dir)
+        print('convert  %8.3fs  %d days, once' % (time.perf_counter() - start, converted))
+
+        for name, handler_class, directory in (('csv', HistoricCSVPriceHandler, csv_dir),
+                                               ('store', HistoricTickStorePriceHandler, store_dir)):
+            queue, load, total = run(handler_class, directory, days)
+            # the csv handler opens the first day in __init__, opening the others is part of streaming
+            print('%-8s %8.3fs first day %8.3fs total %10.0f ticks/s  %s ticks, last %s %s %s' % (
+                name, load, total, queue.count / total, queue.count, queue.last.instrument, queue.last.bid,
+                queue.last.ask))
+    finally:
+        shutil.rmtree(root)
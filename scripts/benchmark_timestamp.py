@@ -0,0 +1,63 @@
+"""
+Timestamp parsing, dateparser against the fixed format parsers of utils.time.
+
+One row per format: dateparser.parse, datetime.strptime, the fixed format
+parser, and per string cost of the array variant against pandas.to_datetime
+with an explicit format.
+
+python -m scripts.benchmark_timestamp [count]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+import dateparser
+import pandas as pd
+
+from utils.time import parse_rfc3339, parse_internal, parse_dukascopy, parse_rfc3339_array, \
+    parse_internal_array, parse_dukascopy_array
+
+FORMATS = [
+    # name, strftime of the samples, strptime format, parser, array parser
+    ('rfc3339', lambda dt: dt.strftime('%Y-%m-%dT%H:%M:%S.%f') + '123Z', '%Y-%m-%dT%H:%M:%S.%f123Z',
+     parse_rfc3339, parse_rfc3339_array),
+    ('internal', lambda dt: dt.strftime('%Y-%m-%d %H:%M:%S:%f'), '%Y-%m-%d %H:%M:%S:%f',
+     parse_internal, parse_internal_array),
+    ('dukascopy', lambda dt: dt.strftime('%Y.%m.%d %H:%M:%S.%f')[:23], '%Y.%m.%d %H:%M:%S.%f',
+     parse_dukascopy, parse_dukascopy_array),
+]
+
+
+def timed(func, values):
+    start = time.perf_counter()
+    for value in values:
+        func(value)
+    return (time.perf_counter() - start) / len(values) * 1e6
+
+
+def timed_array(func, values):
+    start = time.perf_counter()
+    func(values)
+    return (time.perf_counter() - start) / len(values) * 1e6
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    start = datetime(2019, 3, 4, 10)
+    times = [start + timedelta(milliseconds=i * 137) for i in range(count)]
+    few = max(1, count // 100)  # dateparser is too slow for the full set
+
+    print('%-10s %12s %12s %12s %12s %12s %9s' % ('format', 'dateparser', 'strptime', 'fixed', 'array',
+                                                  'pandas', 'speedup'))
+    for name, render, strptime_format, parser, array_parser in FORMATS:
+        values = [render(dt) for dt in times]
+        assert [parser(value) for value in values[:10]] == times[:10]
+        assert array_parser(values[:10]).astype('datetime64[us]').tolist() == times[:10]
+
+        slow = timed(dateparser.parse, values[:few])
+        strptime = timed(lambda value: datetime.strptime(value, strptime_format), values)
+        fast = timed(parser, values)
+        array = timed_array(array_parser, values)
+        pandas = timed_array(lambda v: pd.to_datetime(v, format=strptime_format), values)
+        print('%-10s %9.2f us %9.2f us %9.2f us %9.3f us %9.3f us %8.0fx' % (
+            name, slow, strptime, fast, array, pandas, slow / fast))
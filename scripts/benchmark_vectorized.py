@@ -0,0 +1,101 @@
+"""
+Vectorized bar backtest against the event-driven backtest.backtest.Backtest,
+MovingAverageCrossStrategy on H1 candles.
+
+events: Backtest with CandlePriceHandler replaying the candles, a TickEvent
+per bar through calculate_signals and Portfolio.
+vectorized: MovingAverageCrossStrategy.signals and exits over the whole
+history and VectorizedBacktest.
+
+Both run the same candles, a seeded random walk, a year of H1 bars for each
+pair, priced to 5 decimals as the Decimal ticks of Backtest. The last bar is
+flat, Backtest closes what's left at its open and VectorizedBacktest at its
+close. Parity is the trade, win and loss counts and the profit of Portfolio
+against the trades of VectorizedBacktest.
+
+python -m scripts.benchmark_vectorized [bars per pair]
+"""
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from backtest.backtest import Backtest
+from backtest.portfolio import Portfolio
+from backtest.price import CandlePriceHandler
+from backtest.strategy import MovingAverageCrossStrategy
+from backtest.vectorized import VectorizedBacktest
+from mt4.constants import pip
+
+PAIRS = ['EURUSD', 'GBPUSD', 'USDJPY', 'USDCHF', 'USDCAD', 'AUDUSD', 'NZDUSD']
+START_PRICES = {'EURUSD': 1.13, 'GBPUSD': 1.30, 'USDJPY': 111.0, 'USDCHF': 1.0, 'USDCAD': 1.33, 'AUDUSD': 0.71,
+                'NZDUSD': 0.68}
+PARAMS = {'short_window': 10, 'long_window': 50}
+
+
+def make_candles(symbol, count, seed=0, start=datetime(2018, 1, 1)):
+    """H1 bid and ask candles of a random walk, a 1.5 pip spread"""
+    random = np.random.RandomState(seed)
+    unit = float(pip(symbol))
+    steps = random.standard_normal((count, 4)) * 8 * unit
+    path = np.round(START_PRICES.get(symbol, 1.0) + np.cumsum(steps.ravel()).reshape(count, 4), 5)
+    bid_open = np.concatenate([[path[0, 0]], path[:-1, 3]])
+    bid_close = path[:, 3]
+    bid_high = np.maximum(path.max(axis=1), bid_open)
+    bid_low = np.minimum(path.min(axis=1), bid_open)
+    spread = 1.5 * unit
+    index = pd.date_range(start, periods=count, freq='h', name='date')
+    return pd.DataFrame({'bidopen': bid_open, 'bidhigh': bid_high, 'bidlow': bid_low, 'bidclose': bid_close,
+                         'askopen': np.round(bid_open + spread, 5), 'askhigh': np.round(bid_high + spread, 5),
+                         'asklow': np.round(bid_low + spread, 5), 'askclose': np.round(bid_close + spread, 5)},
+                        index=index)
+
+
+def flat_last_bar(candles):
+    candles = candles.copy()
+    for side in ('bid', 'ask'):
+        last = candles[side + 'open'].iloc[-1]
+        for name in ('high', 'low', 'close'):
+            candles.iloc[-1, candles.columns.get_loc(side + name)] = last
+    return candles
+
+
+def run_events(data):
+    with redirect_stdout(io.StringIO()):
+        backtest = Backtest(list(data), 'H1', None, partial(CandlePriceHandler, candles=data),
+                            MovingAverageCrossStrategy, PARAMS, Portfolio)
+        backtest._run_backtest()
+    return backtest.portfolio
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 6240  # 52 weeks of 5 days
+    data = dict((symbol, flat_last_bar(make_candles(symbol, count, seed=i))) for i, symbol in enumerate(PAIRS))
+    bars = count * len(PAIRS)
+
+    start = time.perf_counter()
+    portfolio = run_events(data)
+    events = time.perf_counter() - start
+
+    backtest = VectorizedBacktest(MovingAverageCrossStrategy(PAIRS, None, **PARAMS))
+    results = backtest.run(data)
+
+    print('%-11s %9s %12s' % ('', 'seconds', 'bars/s'))
+    print('%-11s %9.3f %12.0f' % ('events', events, bars / events))
+    print('%-11s %9.3f %12.0f %7.1fx' % ('vectorized', backtest.elapsed, backtest.bars_per_second,
+                                         events / backtest.elapsed))
+    for symbol in PAIRS:
+        print(results[symbol])
+
+    counts = tuple(sum(getattr(result, name) for result in results.values())
+                   for name in ('trade_count', 'win_count', 'loss_count'))
+    profit = sum(result.profit_pips * float(pip(symbol)) for symbol, result in results.items()) * portfolio.trade_units
+    print('events trades=%s win=%s loss=%s profit=%0.2f' % (
+        portfolio.trade_count, portfolio.win_count, portfolio.loss_count, portfolio.balance - portfolio.equity))
+    print('parity=%s' % ((portfolio.trade_count, portfolio.win_count, portfolio.loss_count) == counts and
+                         abs(portfolio.balance - portfolio.equity - profit) < 0.01))
@@ -0,0 +1,81 @@
+"""
+Tick to handler latency of a polling runner loop against a blocking one.
+
+A feeder thread stands for the broker socket thread and puts ticks at random
+intervals. The polling loop is the old FXCMStreamRunner loop: drain, then
+sleep LOOP_SLEEP. The blocking loop drains then waits in get(True, timeout)
+until the next tick, on a plain queue.Queue and on a LaneQueue.
+
+python -m scripts.benchmark_wakeup [ticks] [mean_interval]
+"""
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import settings
+from event.event import TickPriceEvent
+from event.handler import BaseHandler
+from event.lanes import LaneQueue
+from event.runner import Runner
+
+
+class TickLatencyHandler(BaseHandler):
+    subscription = [TickPriceEvent.type]
+
+    def __init__(self, queue):
+        super(TickLatencyHandler, self).__init__(queue)
+        self.latencies = []
+
+    def process(self, event):
+        self.latencies.append((datetime.utcnow() - event.time).total_seconds())
+
+
+def feed(runner, count, interval):
+    random.seed(1)
+    for _ in range(count):
+        time.sleep(random.expovariate(1 / interval))
+        runner.put(TickPriceEvent('FXCM', 'EURUSD', datetime.utcnow(), Decimal('1.13215'), Decimal('1.13230')))
+
+
+def polling(runner, feeder):
+    while feeder.is_alive() or runner.queue.qsize():
+        runner.drain()
+        time.sleep(settings.LOOP_SLEEP)
+
+
+def blocking(runner, feeder, timeout=1):
+    while feeder.is_alive() or runner.queue.qsize():
+        if not runner.drain():
+            event = runner.get(True, timeout)
+            if event:
+                runner.handle_event(event)
+
+
+def run(loop, backend, count, interval):
+    handler = TickLatencyHandler(backend)
+    runner = Runner(backend, metrics=False)
+    runner.register(handler)
+    feeder = threading.Thread(target=feed, args=(runner, count, interval))
+    feeder.start()
+    loop(runner, feeder)
+    return handler.latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    n = len(latencies)
+    print('%-18s %5d ticks  p50 %8.3f ms  p99 %8.3f ms  max %8.3f ms' % (
+        name, n, latencies[n // 2] * 1000, latencies[int(n * 0.99)] * 1000, latencies[-1] * 1000))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    print('%s ticks, %s ms mean interval, LOOP_SLEEP=%ss' % (count, interval * 1000, settings.LOOP_SLEEP))
+    report('polling', run(polling, queue.Queue(), count, interval))
+    report('blocking queue', run(blocking, queue.Queue(), count, interval))
+    report('blocking lanes', run(blocking, LaneQueue.local(), count, interval))
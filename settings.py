@@ -16,6 +16,7 @@ OANDA_ACCESS_TOKEN = env.str('OANDA_ACCESS_TOKEN', None)
 OANDA_ACCOUNT_ID = env.str('OANDA_ACCOUNT_ID', None)
 
 CSV_DATA_DIR = env.str('QSFOREX_CSV_DATA_DIR', None)
+TICK_STORE_DIR = env.str('QSFOREX_TICK_STORE_DIR', None)  # pricing.tickstore, built from CSV_DATA_DIR
 OUTPUT_RESULTS_DIR = env.str('QSFOREX_OUTPUT_RESULTS_DIR', None)
 
 TELSTRA_CLIENT_KEY = env.str('TELSTRA_CLIENT_KEY', '')
@@ -1,8 +1,11 @@
 import logging
-from datetime import datetime
+
+import numpy as np
+import pandas as pd
 
 from event.event import TimeFrameEvent, OrderHoldingEvent, StartUpEvent
 from event.handler import QueueBase, BaseHandler
+from utils import clock
 
 logger = logging.getLogger(__name__)
 
@@ -44,14 +47,27 @@ class StrategyBase(BaseHandler, QueueBase):
     def signal_pair(self, symbol):
         raise NotImplementedError
 
+    def signals(self, candles):
+        """entries for every bar of a candle history, 1 BUY, -1 SELL, 0 none, see backtest.vectorized"""
+        raise NotImplementedError
+
+    def exits(self, candles):
+        """bars closing the open position in backtest.vectorized, None to leave it to stops and targets"""
+        return None
+
     def can_open(self):
-        now = datetime.utcnow()
+        now = clock.utcnow()
         if now.weekday() not in self.weekdays:
             return False
         if now.hour not in self.hours:
             return False
         return True
 
+    def can_open_array(self, times):
+        """can_open at each of an array of times"""
+        times = pd.DatetimeIndex(times)
+        return np.isin(times.weekday, self.weekdays) & np.isin(times.hour, self.hours)
+
     def process(self, event):
         if event.type == TimeFrameEvent.type and event.timeframe in self.timeframes:
             self.signal()
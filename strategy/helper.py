@@ -1,3 +1,5 @@
+import numpy as np
+
 from mt4.constants import OrderSide
 
 
@@ -11,6 +13,18 @@ def check_cross(data1, data2, shift=1):
     return None
 
 
+def cross(data1, data2):
+    """check_cross(shift=0) at every bar, 1 for BUY, -1 for SELL, 0 for none"""
+    data1 = np.asarray(data1, dtype=np.float64)
+    data2 = np.asarray(data2, dtype=np.float64)
+    above = data1 > data2
+    below = data1 < data2
+    result = np.zeros(len(data1), dtype=np.int8)
+    result[1:][above[1:] & below[:-1]] = 1
+    result[1:][below[1:] & above[:-1]] = -1
+    return result
+
+
 def check_reverse(data, shift=1):
     first = -1 - shift
     second = -2 - shift
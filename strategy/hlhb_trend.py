@@ -1,11 +1,13 @@
 import logging
+from datetime import timedelta
 
+import numpy as np
 import talib as ta
 
 from event.event import SignalEvent, SignalAction, TimeFrameEvent, OrderHoldingEvent, StartUpEvent
 from mt4.constants import PERIOD_H1, OrderSide
 from strategy.base import StrategyBase
-from strategy.helper import check_cross
+from strategy.helper import check_cross, cross
 
 logger = logging.getLogger(__name__)
 
@@ -43,25 +45,37 @@ class HLHBTrendStrategy(StrategyBase):
     trailing_stop = 40
 
     def signal_pair(self, symbol):
-        short_ema = self.params.get('short_ema')
-        long_ema = self.params.get('long_ema')
-        adx_period = self.params.get('adx')
-        rsi = self.params.get('rsi')
-
         candles = self.data_reader.get_candle(symbol, PERIOD_H1, count=50, fromTime=None, toTime=None,
                                               price_type='M', smooth=False)
-
-        adx = ta.ADX(candles['askhigh'], candles['bidlow'], candles['bidclose'], timeperiod=adx_period)
-        ema_short = ta.EMA(candles['bidclose'], timeperiod=short_ema)
-        ema_long = ta.EMA(candles['bidclose'], timeperiod=long_ema)
-        mean = (candles['askhigh'] + candles['bidlow']) / 2
-        rsi = ta.RSI(mean, timeperiod=rsi)
-        # upper, middle, lower = ta.BBANDS(h1_candles['close'], matype=MA_Type.T3)
+        ema_short, ema_long, adx, rsi = self.indicators(candles)
 
         if self.can_open():
             self.open(symbol, ema_short, ema_long, adx, rsi)
         self.close(symbol, ema_short, ema_long, adx, rsi)
 
+    def indicators(self, candles):
+        adx = ta.ADX(candles['askhigh'], candles['bidlow'], candles['bidclose'], timeperiod=self.params.get('adx'))
+        ema_short = ta.EMA(candles['bidclose'], timeperiod=self.params.get('short_ema'))
+        ema_long = ta.EMA(candles['bidclose'], timeperiod=self.params.get('long_ema'))
+        mean = (candles['askhigh'] + candles['bidlow']) / 2
+        rsi = ta.RSI(mean, timeperiod=self.params.get('rsi'))
+        # upper, middle, lower = ta.BBANDS(h1_candles['close'], matype=MA_Type.T3)
+        return ema_short, ema_long, adx, rsi
+
+    def signals(self, candles):
+        """open() for every H1 candle, decided at its close"""
+        ema_short, ema_long, adx, rsi = (np.asarray(x, dtype=np.float64) for x in self.indicators(candles))
+        side = cross(ema_short, ema_long)
+        trend = ~(adx <= 25)  # open() goes on with a nan adx
+        buy = (side == 1) & trend & (rsi > 50) & (rsi < 70)
+        sell = (side == -1) & trend & (rsi > 30) & (rsi < 50)
+        index = getattr(candles, 'index', None)
+        if index is None:
+            can_open = True  # arrays without bar times, can_open's weekdays and hours aren't applied
+        else:
+            can_open = self.can_open_array(index + timedelta(minutes=PERIOD_H1))
+        return np.where(buy & can_open, 1, np.where(sell & can_open, -1, 0)).astype(np.int8)
+
     def open(self, symbol, ema_short, ema_long, adx, rsi):
         if adx[-1] <= 25:
             return
@@ -0,0 +1,125 @@
+import functools
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# what submit does when the pool queue is full
+DROP = 'DROP'  # drop the new call
+DROP_OLDEST = 'DROP_OLDEST'  # drop the oldest queued call to make room
+BLOCK = 'BLOCK'  # wait up to block_timeout for room, then drop
+
+
+class BackgroundPool(object):
+    """
+    Bounded thread pool for fire and forget side effects, eg. telegram and sms.
+
+    Calls queue up to maxsize and are run by a few daemon threads started on
+    first use, results are discarded and exceptions logged. stats() reports
+    the backpressure: depth, drops and how long calls waited to start.
+    """
+
+    def __init__(self, workers=2, maxsize=100, policy=DROP_OLDEST, block_timeout=1):
+        self.workers = workers
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.threads = []
+        self.lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.wait_total = 0.0  # seconds calls spent queued before running
+        self.wait_max = 0.0
+
+    def start(self):
+        with self.lock:
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.work, name='background-%s' % len(self.threads), daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, func, *args, **kwargs):
+        """queue func(*args, **kwargs), False if dropped"""
+        if len(self.threads) < self.workers:
+            self.start()
+        item = (time.time(), func, args, kwargs)
+        with self.lock:
+            self.submitted += 1
+        try:
+            if self.policy == BLOCK:
+                self.queue.put(item, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(item)
+        except queue.Full:
+            if self.policy != DROP_OLDEST:
+                return self.drop(func)
+            try:
+                _, old_func, _, _ = self.queue.get_nowait()
+                self.drop(old_func)
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                return self.drop(func)
+        depth = self.queue.qsize()
+        with self.lock:
+            self.max_depth = max(self.max_depth, depth)
+        return True
+
+    def drop(self, func):
+        with self.lock:
+            self.dropped += 1
+        logger.warning('[BACKGROUND] queue full, dropped %s' % getattr(func, '__name__', func))
+        return False
+
+    def work(self):
+        while True:
+            submitted_at, func, args, kwargs = self.queue.get()
+            wait = time.time() - submitted_at
+            try:
+                func(*args, **kwargs)
+                failed = 0
+            except Exception as ex:
+                failed = 1
+                logger.error('[BACKGROUND] %s error=%s' % (getattr(func, '__name__', func), ex))
+            with self.lock:
+                self.completed += 1 - failed
+                self.failed += failed
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+
+    def stats(self):
+        started = self.completed + self.failed
+        return {'submitted': self.submitted, 'completed': self.completed, 'failed': self.failed,
+                'dropped': self.dropped, 'depth': self.queue.qsize(), 'max_depth': self.max_depth,
+                'wait_avg': self.wait_total / started if started else 0.0, 'wait_max': self.wait_max}
+
+
+default_pool = BackgroundPool()
+
+
+def fire_and_forget(func=None, pool=None):
+    """
+    decorator, calling the function queues it on a BackgroundPool and returns at once.
+
+    @fire_and_forget
+    def notify(text): ...
+
+    send_me_nowait = fire_and_forget(send_me)
+    """
+    if func is None:
+        return functools.partial(fire_and_forget, pool=pool)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return (pool or default_pool).submit(func, *args, **kwargs)
+
+    wrapper.run_now = func
+    return wrapper
@@ -0,0 +1,60 @@
+import time
+from datetime import datetime
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class WallClock(object):
+    """the real utc time"""
+
+    def utcnow(self):
+        return datetime.utcnow()
+
+    def time(self):
+        return time.time()
+
+
+class VirtualClock(object):
+    """
+    Time driven by replayed events, see event.replay.ReplayRunner.
+
+    It only moves forward: set ignores a time before the current one, so an
+    out of order tick can't send the handlers back in time.
+    """
+
+    def __init__(self, now=None):
+        self.now = now or _EPOCH
+
+    def set(self, now):
+        if now > self.now:
+            self.now = now
+
+    def utcnow(self):
+        return self.now
+
+    def time(self):
+        return (self.now - _EPOCH).total_seconds()
+
+
+wall_clock = WallClock()
+_clock = wall_clock
+
+
+def set_clock(clock=None):
+    """make clock the time source of utcnow and timestamp, None for the wall clock"""
+    global _clock
+    _clock = clock or wall_clock
+
+
+def get_clock():
+    return _clock
+
+
+def utcnow():
+    """naive utc now of the current clock, use in place of datetime.utcnow in handlers"""
+    return _clock.utcnow()
+
+
+def timestamp():
+    """unix timestamp of the current clock, use in place of time.time for scheduling"""
+    return _clock.time()
@@ -0,0 +1,48 @@
+"""
+Switch for side effects while replaying, see event.replay.ReplayRunner.
+
+Functions reaching outside the process (telegram, sms, redis keys read by
+other processes, the trade database) are decorated with side_effect: while
+dry run is on they return their default instead of running. Handlers with
+side effects of their own check is_dry_run().
+"""
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+_dry_run = False
+
+
+def set_dry_run(enabled=True):
+    """switch dry run on or off, return the previous setting"""
+    global _dry_run
+    previous, _dry_run = _dry_run, enabled
+    return previous
+
+
+def is_dry_run():
+    return _dry_run
+
+
+def side_effect(func=None, result=None):
+    """
+    decorator, the function is skipped and returns result while dry run is on.
+
+    @side_effect
+    def set_last_tick(dt): ...
+
+    @side_effect(result=(False, 'DRY_RUN'))
+    def send_au_sms(to, body, app_name=None): ...
+    """
+    if func is None:
+        return functools.partial(side_effect, result=result)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _dry_run:
+            logger.debug('[DRY_RUN] skipped %s' % func.__name__)
+            return result
+        return func(*args, **kwargs)
+
+    return wrapper
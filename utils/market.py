@@ -1,10 +1,10 @@
-from datetime import datetime
-
 from dateutil.relativedelta import relativedelta
 
+from utils import clock
+
 
 def is_market_open():
-    now = datetime.utcnow()
+    now = clock.utcnow()
 
     close_hour = 19
     open_hour = 23
@@ -7,7 +7,6 @@ import numpy as np
 from datetime import datetime, timedelta
 from decimal import Decimal, ROUND_HALF_EVEN
 import matplotlib.pyplot as plt
-from dateparser import parse
 from dateutil.relativedelta import relativedelta
 
 import settings
@@ -19,6 +18,7 @@ from event.event import TimeFrameEvent
 from event.handler import BaseHandler
 from mt4.constants import pip, get_mt4_symbol
 from utils.redis import price_redis
+from utils.time import parse_datetime
 
 TIME_SUFFIX = '_LAST_TIME'
 
@@ -79,7 +79,7 @@ def init_density(symbol, start=datetime(2019, 1, 18, 18, 1), account=None):
 def update_density(symbol, account=None):
     symbol = get_mt4_symbol(symbol)
     last_time = price_redis.get(symbol + TIME_SUFFIX)
-    last_time = parse(last_time) if last_time else None
+    last_time = parse_datetime(last_time) if last_time else None
     now = datetime.utcnow()
     data = price_redis.get('%s_H1' % symbol)
     data = json.loads(data) if data else {}
@@ -1,9 +1,15 @@
 import json
+import math
+import os
+import socket
+import time
+import uuid
 from datetime import datetime
 from decimal import Decimal
 
 import redis
 import settings
+from utils.dry_run import side_effect
 from utils.time import str_to_datetime
 
 LAST_TICK_TIME_KEY = 'LAST_TICK_TIME'
@@ -26,6 +32,7 @@ order_redis = redis.StrictRedis(host=settings.REDIS_HOST,
                                 decode_responses=True)
 
 
+@side_effect
 def set_last_tick(dt):
     if isinstance(dt, datetime):
         dt = dt.strftime('%Y-%m-%d %H:%M:%S:%f')
@@ -51,6 +58,7 @@ def get_tick_price(instrument):
     return None
 
 
+@side_effect
 def set_tick_price(instrument, data):
     key = instrument.upper() + TICK_PRICE_SUFFIX
     if not isinstance(data, str):
@@ -59,14 +67,20 @@ def set_tick_price(instrument, data):
 
 
 class RedisQueue(object):
-    """Simple Queue with Redis Backend"""
+    """Simple Queue with Redis Backend
+
+    codec is the wire format of the items, picked up by event.handler.QueueBase,
+    eg. RedisQueue('FXCM', codec=event.codec.binary_codec)."""
+
+    chunk_size = 1000  # max items per RPUSH command in put_many
 
     def __init__(self, name, db=settings.SYSTEM_CHANNEL, host=settings.REDIS_HOST,
-                 port=settings.REDIS_PORT):
+                 port=settings.REDIS_PORT, codec=None):
+        self.codec = codec
         self.__db = redis.StrictRedis(host=host,
                                       port=port,
                                       db=db,
-                                      decode_responses=True)
+                                      decode_responses=not getattr(codec, 'binary', False))
         self.key = 'queue:%s' % name
 
     def qsize(self):
@@ -86,9 +100,11 @@ class RedisQueue(object):
         """Remove and return an item from the queue.
 
         If optional args block is true and timeout is None (the default), block
-        if necessary until an item is available."""
+        if necessary until an item is available. BLPOP takes whole seconds, a
+        shorter timeout waits one second."""
         if block:
-            item = self.__db.blpop(self.key, timeout=timeout)
+            item = self.__db.blpop(self.key, timeout=self.blpop_timeout(timeout))
+            item = item[1] if item else None
         else:
             item = self.__db.lpop(self.key)
 
@@ -97,6 +113,202 @@ class RedisQueue(object):
         else:
             return None
 
+    def get_first(self, queues, timeout=None):
+        """Remove and return (queue, item) from the first non empty of queues, blocking
+        up to timeout, queues on the same redis db as this one, (None, None) on timeout."""
+        keys = [q.key for q in queues]
+        item = self.__db.blpop(keys, timeout=self.blpop_timeout(timeout))
+        if not item:
+            return None, None
+        key = item[0] if isinstance(item[0], str) else item[0].decode()
+        return queues[keys.index(key)], item[1]
+
+    @staticmethod
+    def blpop_timeout(timeout):
+        """0 blocks forever"""
+        if timeout is None:
+            return 0
+        return max(1, int(math.ceil(timeout)))
+
+    def get_nowait(self):
+        """Equivalent to get(False)."""
+        return self.get(False)
+
+    def put_many(self, items):
+        """Put items into the queue, pipelined in one round trip."""
+        items = [item for item in items if item]
+        if not items:
+            return
+        pipe = self.__db.pipeline(transaction=False)
+        for start in range(0, len(items), self.chunk_size):
+            pipe.rpush(self.key, *items[start:start + self.chunk_size])
+        pipe.execute()
+
+    def get_many(self, count):
+        """Remove and return up to count items from the head of the queue in one round trip.
+
+        LRANGE + LTRIM in MULTI/EXEC, LPOP with a count needs redis server 6.2."""
+        pipe = self.__db.pipeline(transaction=True)
+        pipe.lrange(self.key, 0, count - 1)
+        pipe.ltrim(self.key, count, -1)
+        items, _ = pipe.execute()
+        return items
+
+
+class RedisStreamQueue(object):
+    """Queue over a Redis Stream read through a consumer group.
+
+    Every group sees every event put on the stream, consumers sharing a group
+    split its events between them. Delivered entries are acked on the next
+    read, once the runner has handled them, and a restarted consumer first
+    re-reads its own pending entries.
+
+    A group this queue creates starts at start_id, '0' by default so the
+    events put before the first read are delivered too, as far back as the
+    stream is kept (maxlen). '$' skips what is already on the stream."""
+
+    chunk_size = 1000  # max XADD per pipeline in put_many
+    block_timeout = 1  # seconds a blocking get waits when no timeout is given
+
+    def __init__(self, name, group, consumer=None, db=settings.SYSTEM_CHANNEL, host=settings.REDIS_HOST,
+                 port=settings.REDIS_PORT, codec=None, maxlen=100000, start_id='0'):
+        self.codec = codec
+        binary = getattr(codec, 'binary', False)
+        self.__db = redis.StrictRedis(host=host,
+                                      port=port,
+                                      db=db,
+                                      decode_responses=not binary)
+        self.key = 'stream:%s' % name
+        self.group = group
+        self.consumer = consumer or '%s-%s' % (socket.gethostname(), os.getpid())
+        self.maxlen = maxlen
+        self.start_id = start_id
+        self.field = b'data' if binary else 'data'
+        self.pending_ids = []
+        self.group_ready = False
+        self.read_id = '0'  # own pending entries first, then '>' for new ones
+
+    def ensure_group(self):
+        if self.group_ready:
+            return
+        try:
+            self.__db.xgroup_create(self.key, self.group, id=self.start_id, mkstream=True)
+        except redis.exceptions.ResponseError as ex:
+            if 'BUSYGROUP' not in str(ex):
+                raise
+        self.group_ready = True
+
+    def qsize(self):
+        """Return the length of the stream, an upper bound of the events not read by this group."""
+        return self.__db.xlen(self.key)
+
+    def empty(self):
+        """Return True if the stream is empty, False otherwise."""
+        return self.qsize() == 0
+
+    def put(self, item):
+        """Append item to the stream."""
+        if item:
+            self.__db.xadd(self.key, {'data': item}, maxlen=self.maxlen, approximate=True)
+
+    def put_many(self, items):
+        """Append items to the stream, pipelined."""
+        items = [item for item in items if item]
+        for start in range(0, len(items), self.chunk_size):
+            pipe = self.__db.pipeline(transaction=False)
+            for item in items[start:start + self.chunk_size]:
+                pipe.xadd(self.key, {'data': item}, maxlen=self.maxlen, approximate=True)
+            pipe.execute()
+
+    def ack(self):
+        """Acknowledge the entries handed out by the previous read."""
+        if self.pending_ids:
+            self.__db.xack(self.key, self.group, *self.pending_ids)
+            self.pending_ids = []
+
+    def get(self, block=False, timeout=None):
+        """Remove and return an item from the stream for this consumer."""
+        items = self.get_many(1, block=block, timeout=timeout)
+        return items[0] if items else None
+
     def get_nowait(self):
         """Equivalent to get(False)."""
         return self.get(False)
+
+    def get_many(self, count, block=False, timeout=None):
+        """Return up to count items for this consumer, acking the previous read."""
+        self.ensure_group()
+        self.ack()
+
+        # pending entries are there already, never wait for them
+        wait = block and self.read_id == '>'
+        block_ms = int((timeout or self.block_timeout) * 1000) if wait else None
+
+        response = self.__db.xreadgroup(self.group, self.consumer, {self.key: self.read_id},
+                                        count=count, block=block_ms)
+        entries = response[0][1] if response else []
+        if self.read_id == '0' and len(entries) < count:
+            self.read_id = '>'
+            if not entries:
+                return self.get_many(count, block, timeout)
+
+        items = []
+        for entry_id, fields in entries:
+            self.pending_ids.append(entry_id)
+            if fields:  # entries trimmed away while pending come back empty
+                items.append(fields.get(self.field))
+        return items
+
+
+class RedisDelayQueue(object):
+    """Items held until a due time, a sorted set of ids scored by due timestamp
+    plus a hash of id -> item.
+
+    Due items are read under WATCH and taken out of both in one MULTI/EXEC, so
+    runners sharing the queue never release the same item twice and a crash
+    never leaves an item in one without the other."""
+
+    def __init__(self, name, db=settings.SYSTEM_CHANNEL, host=settings.REDIS_HOST,
+                 port=settings.REDIS_PORT, codec=None):
+        self.codec = codec
+        self.__db = redis.StrictRedis(host=host,
+                                      port=port,
+                                      db=db,
+                                      decode_responses=not getattr(codec, 'binary', False))
+        self.key = 'delay:%s' % name
+        self.data_key = 'delay:%s:data' % name
+
+    def qsize(self):
+        """Return the count of items waiting, due or not."""
+        return self.__db.zcard(self.key)
+
+    def put(self, item, due):
+        """Hold item until due, a unix timestamp."""
+        item_id = uuid.uuid4().hex
+        pipe = self.__db.pipeline(transaction=True)
+        pipe.hset(self.data_key, item_id, item)
+        pipe.zadd(self.key, {item_id: due})
+        pipe.execute()
+
+    def next_due(self):
+        """Due timestamp of the first item, None if empty."""
+        first = self.__db.zrange(self.key, 0, 0, withscores=True)
+        return first[0][1] if first else None
+
+    def get_due(self, now=None):
+        """Remove and return [(due, item)] of the items due at now."""
+        now = time.time() if now is None else now
+
+        def take(pipe):
+            # read under WATCH, the ids and their items go in one MULTI/EXEC, retried when another runner was first
+            entries = pipe.zrangebyscore(self.key, '-inf', now, withscores=True)
+            if not entries:
+                return []
+            ids = [item_id for item_id, _ in entries]
+            items = pipe.hmget(self.data_key, ids)
+            pipe.multi()
+            pipe.zrem(self.key, *ids)
+            pipe.hdel(self.data_key, *ids)
+            return [(due, item) for (_, due), item in zip(entries, items) if item]
+
+        return self.__db.transaction(take, self.key, value_from_callable=True)
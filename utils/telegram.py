@@ -3,6 +3,8 @@ import logging
 import settings
 from telegram.bot import Bot
 
+from utils.background import fire_and_forget
+from utils.dry_run import side_effect
 from utils.singleton import SingletonDecorator
 
 logger = logging.getLogger(__name__)
@@ -12,9 +14,15 @@ MY_CHAT_ID = 772974581
 b = SingletonTelegramBot(settings.TELEGRAM_TOKEN)
 
 
+@side_effect
 def send_message(chat_id, text):
     return b.send_message(chat_id, text)
 
 
+@side_effect
 def send_me(text):
     return b.send_message(MY_CHAT_ID, text)
+
+
+# queued on utils.background.default_pool, for handlers on the event loop
+send_me_nowait = side_effect(fire_and_forget(send_me))  # skipped on submit, the pool may run it later
@@ -6,6 +6,9 @@ import redis
 import settings
 from Telstra_Messaging.rest import ApiException
 
+from utils.background import fire_and_forget
+from utils.dry_run import side_effect
+
 
 log = logging.getLogger(__name__)
 r = redis.StrictRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0,
@@ -74,6 +77,7 @@ def validate_au_mobile(mobile):
     return ''
 
 
+@side_effect(result=(False, 'DRY_RUN'))
 def send_au_sms(to, body, app_name=None):
     counter = r.get(TELSTRA_SMS_MONTHLY_COUNTER) or 0
     counter = int(counter)
@@ -125,5 +129,9 @@ def send_au_sms(to, body, app_name=None):
         return False, str(e)
 
 
+@side_effect
 def send_to_admin(body, app_name=None):
     send_au_sms(settings.ADMIN_MOBILE_NUMBER, body, app_name)
+
+
+send_to_admin_nowait = side_effect(fire_and_forget(send_to_admin))
@@ -0,0 +1,132 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from utils.redis import RedisStreamQueue, RedisDelayQueue
+from utils.time import parse_rfc3339, parse_internal, parse_dukascopy, parse_datetime, parse_internal_array, \
+    parse_rfc3339_array, parse_dukascopy_array
+
+
+def fake_redis(server):
+    """redis.StrictRedis replaced by a fakeredis client of server"""
+    return mock.patch('utils.redis.redis.StrictRedis',
+                      lambda decode_responses=False, **kwargs: fakeredis.FakeStrictRedis(
+                          server=server, decode_responses=decode_responses))
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis not installed')
+class RedisStreamQueueTest(unittest.TestCase):
+    def setUp(self):
+        patcher = fake_redis(fakeredis.FakeServer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_put_before_first_read(self):
+        producer = RedisStreamQueue('test', 'producer')
+        producer.put_many(['1', '2', '3'])
+        producer.put('4')
+        # the groups are created on the first read, after the puts
+        self.assertEqual(RedisStreamQueue('test', 'alerting', consumer='a').get_many(10), ['1', '2', '3', '4'])
+        self.assertEqual(RedisStreamQueue('test', 'debug', consumer='a').get_many(10), ['1', '2', '3', '4'])
+        self.assertEqual(RedisStreamQueue('test', 'late', consumer='a', start_id='$').get_many(10), [])
+
+    def test_pending_and_ack(self):
+        queue = RedisStreamQueue('test', 'workers', consumer='a')
+        queue.put_many(['1', '2', '3'])
+        self.assertEqual(queue.get_many(2), ['1', '2'])
+        self.assertEqual(queue._RedisStreamQueue__db.xpending(queue.key, queue.group)['pending'], 2)
+
+        # restarted before handling them, its pending entries come first
+        restarted = RedisStreamQueue('test', 'workers', consumer='a')
+        self.assertEqual(restarted.get_many(2), ['1', '2'])
+        self.assertEqual(restarted.get_many(2), ['3'])  # acks 1 and 2
+        db = restarted._RedisStreamQueue__db
+        self.assertEqual(db.xpending(restarted.key, restarted.group)['pending'], 1)
+        self.assertEqual(restarted.get_many(2), [])
+        self.assertEqual(db.xpending(restarted.key, restarted.group)['pending'], 0)
+
+        # another consumer of the group shares it, it doesn't read them again
+        queue.put('4')
+        self.assertEqual(RedisStreamQueue('test', 'workers', consumer='b').get_many(10), ['4'])
+
+    def test_trimmed_pending(self):
+        queue = RedisStreamQueue('test', 'workers', consumer='a')
+        queue.put_many(['1', '2'])
+        self.assertEqual(queue.get_many(10), ['1', '2'])
+        db = queue._RedisStreamQueue__db
+        db.xtrim(queue.key, maxlen=0, approximate=False)
+
+        # entries trimmed while pending come back empty, they're skipped and acked
+        restarted = RedisStreamQueue('test', 'workers', consumer='a')
+        self.assertEqual(restarted.get_many(10), [])
+        restarted.put('3')
+        self.assertEqual(restarted.get_many(10), ['3'])
+        self.assertEqual(db.xpending(restarted.key, restarted.group)['pending'], 1)
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis not installed')
+class RedisDelayQueueTest(unittest.TestCase):
+    def setUp(self):
+        patcher = fake_redis(fakeredis.FakeServer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_due(self):
+        queue = RedisDelayQueue('test')
+        other = RedisDelayQueue('test')
+        for item, due in (('a', 1), ('b', 2), ('c', 5)):
+            queue.put(item, due)
+
+        # another runner takes a between the read and the removal, the read is retried
+        pipeline = type(queue._RedisDelayQueue__db.pipeline())
+        hmget = pipeline.hmget
+        taken = []
+
+        def racing(pipe, *args):
+            if not taken:
+                taken.append(None)
+                taken.extend(other.get_due(1))
+            return hmget(pipe, *args)
+
+        with mock.patch.object(pipeline, 'hmget', racing):
+            self.assertEqual(queue.get_due(2), [(2.0, 'b')])
+        self.assertEqual(taken, [None, (1.0, 'a')])
+
+        db = queue._RedisDelayQueue__db
+        self.assertEqual((queue.qsize(), db.hlen(queue.data_key)), (1, 1))
+        self.assertEqual(queue.get_due(4), [])
+        self.assertEqual(queue.next_due(), 5.0)
+        self.assertEqual(queue.get_due(5), [(5.0, 'c')])
+        self.assertEqual((queue.qsize(), db.hlen(queue.data_key)), (0, 0))
+
+
+class TimeTest(unittest.TestCase):
+    def test_timestamp_parsers(self):
+        dt = datetime(2019, 3, 4, 10, 0, 30, 123456)
+        self.assertEqual(parse_rfc3339('2019-03-04T10:00:30.123456789Z'), dt)
+        self.assertEqual(parse_rfc3339('2019-03-04T20:00:30.123456+10:00'), dt)
+        self.assertEqual(parse_internal('2019-03-04 10:00:30:123456'), dt)
+        self.assertEqual(parse_dukascopy('04.03.2019 10:00:30.123'), dt.replace(microsecond=123000))
+        self.assertEqual(parse_datetime('2019-03-04 10:00:30.123456'), dt)
+        self.assertEqual(parse_datetime('2019.03.04 10:00:30.123'), dt.replace(microsecond=123000))
+        self.assertEqual(parse_datetime('2019-03-04 10:00'), dt.replace(second=0, microsecond=0))
+
+        values = ['2019-03-04 10:00:30:123456', '2020-02-29 23:59:59', '1999-12-31 00:00:00:5']
+        self.assertEqual(parse_internal_array(values).astype('datetime64[us]').tolist(),
+                         [dt, datetime(2020, 2, 29, 23, 59, 59), datetime(1999, 12, 31, 0, 0, 0, 500000)])
+        self.assertEqual(str(parse_rfc3339_array(['2019-03-04T10:00:30.123456789Z'])[0]),
+                         '2019-03-04T10:00:30.123456789')
+        self.assertEqual(parse_dukascopy_array(['2019.03.04 10:00:30.123']).astype('datetime64[us]').tolist(),
+                         [dt.replace(microsecond=123000)])
+        for parse_array in (parse_internal_array, parse_rfc3339_array, parse_dukascopy_array):
+            for empty in ([], np.array([], dtype=object), pd.Series([], dtype=object).values):
+                parsed = parse_array(empty)
+                self.assertEqual((parsed.dtype, len(parsed)), (np.dtype('datetime64[ns]'), 0))
@@ -1,7 +1,13 @@
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
 from dateparser import parse
 
+INTERNAL_FORMAT = '%Y-%m-%d %H:%M:%S:%f'  # Event.to_dict and redis
+_DATE_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S:%f', '%Y-%m-%dT%H:%M:%S']
+
 
 def parse_timestamp(timestamp, utc=False):
     if utc:
@@ -14,18 +20,20 @@ def datetime_to_timestamp(dt):
     return time.mktime(dt.timetuple())
 
 
-def datetime_to_str(dt, format='%Y-%m-%d %H:%M:%S:%f'):
+def datetime_to_str(dt, format=INTERNAL_FORMAT):
     if dt:
         return dt.strftime(format)
     return None
 
 
-def str_to_datetime(string, format='%Y-%m-%d %H:%M:%S:%f'):
+def str_to_datetime(string, format=INTERNAL_FORMAT):
     if string:
+        if format == INTERNAL_FORMAT:
+            return parse_datetime(string)
         try:
             dt = datetime.strptime(string, format)
         except:
-            dt = parse(string)
+            dt = parse_datetime(string)
 
         return dt
     return None
@@ -33,3 +41,152 @@ def str_to_datetime(string, format='%Y-%m-%d %H:%M:%S:%f'):
 
 def timestamp_to_str(timestamp, datetime_fmt="%Y/%m/%d %H:%M:%S:%f"):
     return datetime.fromtimestamp(timestamp).strftime(datetime_fmt)
+
+
+# Fixed format parsers. A stream repeats the same date, hour and minute for
+# many timestamps in a row, the prefix is parsed once and kept in a small LRU.
+
+@lru_cache(maxsize=256)
+def _ymd_hm(year, month, day, hour, minute):
+    return int(year), int(month), int(day), int(hour), int(minute)
+
+
+def _microsecond(fraction):
+    """digits after the decimal point to microseconds, longer fractions (nanoseconds) are truncated"""
+    if not fraction:
+        return 0
+    return int(fraction[:6].ljust(6, '0'))
+
+
+def parse_internal(string):
+    """'%Y-%m-%d %H:%M:%S:%f', the format of Event.to_dict and redis, also without the fraction"""
+    y, m, d, hh, mm = _ymd_hm(string[0:4], string[5:7], string[8:10], string[11:13], string[14:16])
+    return datetime(y, m, d, hh, mm, int(string[17:19]), _microsecond(string[20:]))
+
+
+def parse_rfc3339(string):
+    """
+    RFC3339 timestamp of the OANDA api to a naive utc datetime.
+
+    '2019-03-04T10:00:30.123456789Z' or with a +hh:mm offset, nanoseconds are
+    truncated to microseconds.
+    """
+    y, m, d, hh, mm = _ymd_hm(string[0:4], string[5:7], string[8:10], string[11:13], string[14:16])
+    offset = None
+    end = len(string)
+    if string[-1] in 'Zz':
+        end -= 1
+    elif len(string) > 19 and string[-6] in '+-':
+        end -= 6
+        offset = timedelta(hours=int(string[-5:-3]), minutes=int(string[-2:]))
+        if string[-6] == '+':
+            offset = -offset
+    microsecond = _microsecond(string[20:end]) if end > 19 and string[19] == '.' else 0
+    dt = datetime(y, m, d, hh, mm, int(string[17:19]), microsecond)
+    return dt + offset if offset else dt
+
+
+def parse_dukascopy(string):
+    """dukascopy tick time, '2019.03.04 10:00:30.123' of the downloader or '04.03.2019 10:00:30.123' of exports"""
+    if string[4] == '.':
+        y, m, d, hh, mm = _ymd_hm(string[0:4], string[5:7], string[8:10], string[11:13], string[14:16])
+    else:
+        y, m, d, hh, mm = _ymd_hm(string[6:10], string[3:5], string[0:2], string[11:13], string[14:16])
+    return datetime(y, m, d, hh, mm, int(string[17:19]), _microsecond(string[20:]))
+
+
+def parse_datetime(string):
+    """
+    Parse the timestamp formats of the stack, fastest first.
+
+    Internal, RFC3339, iso like and dukascopy strings are parsed by fixed
+    position, anything else falls back to dateparser.
+    """
+    try:
+        if len(string) >= 19 and string[13] == ':' and string[16] == ':':
+            if string[4] == '-' and string[10] in 'T ':
+                if string[10] == 'T' or string[-1] in 'Zz' or string[-6] in '+-':
+                    return parse_rfc3339(string)
+                return parse_internal(string)
+            if string[4] == '.' or string[2] == '.':
+                return parse_dukascopy(string)
+    except ValueError:
+        pass
+    return parse(string, date_formats=_DATE_FORMATS)
+
+
+# Vectorized variants for bulk data, a numpy array or sequence of same format
+# strings to datetime64[ns]. The strings are viewed as a matrix of character
+# codes and the digits of every field are combined column by column. Digits
+# are not validated, use them on data of a known format.
+
+def _char_matrix(strings, width):
+    """one row of character codes per string, str arrays are viewed as utf-32 without a copy"""
+    data = np.asarray(strings)
+    if data.dtype.kind == 'O':
+        data = data.astype('U')
+    if data.dtype.kind == 'U':
+        size, code = data.dtype.itemsize // 4, np.uint32
+    else:
+        size, code = data.dtype.itemsize, np.uint8
+    if size < width:
+        raise ValueError('timestamps shorter than %s characters' % width)
+    return np.ascontiguousarray(data).view(code).reshape(len(data), size)
+
+
+def _digits(matrix, start, end):
+    value = np.zeros(len(matrix), dtype=np.int64)
+    for i in range(start, end):
+        value = value * 10 + (matrix[:, i].astype(np.int64) - 48)
+    return value
+
+
+def _fraction_ns(matrix, start):
+    """digits from start to the first non digit, as nanoseconds"""
+    value = np.zeros(len(matrix), dtype=np.int64)
+    count = np.zeros(len(matrix), dtype=np.int64)
+    ended = np.zeros(len(matrix), dtype=bool)
+    for i in range(start, min(start + 9, matrix.shape[1])):
+        digit = matrix[:, i].astype(np.int64) - 48
+        ended |= (digit < 0) | (digit > 9)
+        value = np.where(ended, value, value * 10 + digit)
+        count += ~ended
+    return value * 10 ** (9 - count)
+
+
+def _to_datetime64(year, month, day, hour, minute, second, nanosecond):
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    ns = ((hour * 60 + minute) * 60 + second) * 1000000000 + nanosecond
+    return days.astype('datetime64[ns]') + ns.astype('timedelta64[ns]')
+
+
+def parse_internal_array(strings):
+    if len(strings) == 0:
+        return np.array([], dtype='datetime64[ns]')
+    matrix = _char_matrix(strings, 19)
+    return _to_datetime64(_digits(matrix, 0, 4), _digits(matrix, 5, 7), _digits(matrix, 8, 10),
+                          _digits(matrix, 11, 13), _digits(matrix, 14, 16), _digits(matrix, 17, 19),
+                          _fraction_ns(matrix, 20))
+
+
+def parse_rfc3339_array(strings):
+    """utc RFC3339 timestamps ending with Z, as returned by OANDA"""
+    if len(strings) == 0:
+        return np.array([], dtype='datetime64[ns]')
+    matrix = _char_matrix(strings, 20)
+    return _to_datetime64(_digits(matrix, 0, 4), _digits(matrix, 5, 7), _digits(matrix, 8, 10),
+                          _digits(matrix, 11, 13), _digits(matrix, 14, 16), _digits(matrix, 17, 19),
+                          _fraction_ns(matrix, 20))
+
+
+def parse_dukascopy_array(strings):
+    if len(strings) == 0:
+        return np.array([], dtype='datetime64[ns]')
+    matrix = _char_matrix(strings, 19)
+    if matrix[0, 4] == ord('.'):
+        year, month, day = _digits(matrix, 0, 4), _digits(matrix, 5, 7), _digits(matrix, 8, 10)
+    else:
+        year, month, day = _digits(matrix, 6, 10), _digits(matrix, 3, 5), _digits(matrix, 0, 2)
+    return _to_datetime64(year, month, day, _digits(matrix, 11, 13), _digits(matrix, 14, 16),
+                          _digits(matrix, 17, 19), _fraction_ns(matrix, 20))